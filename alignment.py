@@ -0,0 +1,213 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from cleaning import TempCleaner, clean_temp_data, iter_clean_temp_data
+from thermo_loaders import (capsule_counts, data_epoch, group_capsules, iter_temp_data, load_hr_data_for_subject,
+                            load_temp_data, merge_capsules, merge_frames, session_date_epoch)
+from timebase import align_interp, align_nearest, event_seconds, window_bounds
+
+# --- Configuration ---
+WINDOW = (-300, 420)
+HR_TOLERANCE = 1.5
+# True: load_session_tensor reads the signals from the memory-mapped session
+# store (session_store.py, written under DOWNLOADS_DIR and rebuilt when a
+# source file changes) instead of parsing the workbooks on every call
+SESSION_STORE = False
+
+# The aligned tensor holds every (experiment, event, subject) window on one
+# shared per-second grid: rows follow the event lists, columns the grid.
+
+@dataclass
+class AlignedTensor:
+    seconds: np.ndarray     # grid, seconds from event start
+    rows: pd.DataFrame      # experiment, subject, suffix, time_str, event_t, label
+    hr: np.ndarray          # (n_rows, n_seconds), NaN where no sample
+    temp: np.ndarray
+    hr_samples: np.ndarray  # raw samples inside each window, 0 = no data
+    temp_samples: np.ndarray
+
+def event_rows(experiments, start=None):
+    # experiments: [(prefix, events), ...] e.g. [("Exp1_", EVENTS_EXP1), ...]
+    # start: session start for timebase.event_seconds
+    rows = []
+    for prefix, events in experiments:
+        for event_t, (start_time_str, names, suffix) in zip(event_seconds(events, start), events):
+            for name in names:
+                label = f"{prefix}{name}_{suffix}" if suffix else f"{prefix}{name}"
+                rows.append({"experiment": prefix.rstrip("_"), "subject": name, "suffix": suffix,
+                             "time_str": start_time_str, "event_t": int(event_t), "label": label})
+    return pd.DataFrame(rows, columns=["experiment", "subject", "suffix", "time_str", "event_t", "label"])
+
+def correct_times(times, correction):
+    # correction: {"offset", "drift", "ref_t"} with device = true + offset + drift * (true - ref_t)
+    if not correction:
+        return times
+    times = np.asarray(times, dtype=np.int64)
+    offset = correction.get("offset", 0.0)
+    drift = correction.get("drift", 0.0)
+    ref_t = correction.get("ref_t", 0)
+    if offset == 0 and drift == 0:
+        return times
+    corrected = ref_t + (times - ref_t - offset) / (1.0 + drift)
+    return np.rint(corrected).astype(np.int64)
+
+def _series(frame, column):
+    # (times, values) of a frame, or None. A frame is a DataFrame with
+    # SessionSeconds, or a (times, values) pair such as SessionStore views.
+    if frame is None:
+        return None
+    if isinstance(frame, tuple):
+        return frame if len(frame[0]) else None
+    if frame.empty or column not in frame.columns:
+        return None
+    return frame['SessionSeconds'].to_numpy(), pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float)
+
+def _align_signal(frames, column, rows, seconds, method, offsets, signal):
+    out = np.full((len(rows), seconds.size), np.nan)
+    counts = np.zeros(len(rows), dtype=np.int64)
+    lo, hi = seconds[0], seconds[-1]
+    for subject, idx in rows.groupby("subject").indices.items():
+        series = _series(frames.get(subject), column)
+        if series is None:
+            continue
+        times = correct_times(series[0], (offsets or {}).get((signal, subject)))
+        values = series[1]
+        # Store slices are already sorted; slicing them below stays zero-copy.
+        if np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+
+        event_t = rows["event_t"].to_numpy()[idx]
+        starts, stops = window_bounds(times, event_t, lo, hi)
+        counts[idx] = stops - starts
+        # Each window is aligned against its own samples only, so edges stay
+        # NaN instead of being filled from outside the window.
+        for row, t, start, stop in zip(idx, event_t, starts, stops):
+            if stop <= start:
+                continue
+            if method == "nearest":
+                out[row] = align_nearest(times[start:stop], values[start:stop], t, seconds, tolerance=HR_TOLERANCE)
+            else:
+                out[row] = align_interp(times[start:stop], values[start:stop], t, seconds)
+    return out, counts
+
+def build_aligned_tensor(experiments, temp_frames, hr_frames, offsets=None, seconds=None, start=None):
+    # temp_frames / hr_frames: {subject: DataFrame with SessionSeconds, or
+    # (times, values)}
+    # offsets: {(signal, subject): correction} from clock_offset.estimate_offsets
+    # start: session start the event clock times are unwrapped around
+    if seconds is None:
+        seconds = np.arange(WINDOW[0], WINDOW[1] + 1, 1)
+    seconds = np.asarray(seconds)
+    rows = event_rows(experiments, start)
+    hr, hr_samples = _align_signal(hr_frames, 'HR (bpm)', rows, seconds, "nearest", offsets, "hr")
+    temp, temp_samples = _align_signal(temp_frames, 'Temp', rows, seconds, "interp", offsets, "temp")
+    return AlignedTensor(seconds, rows, hr, temp, hr_samples, temp_samples)
+
+def iter_aligned_subjects(experiments, temp_iter, hr_loader, seconds=None, capsules=None):
+    # Streaming alignment: consumes (name, frame) capsules one at a time,
+    # loads that subject's HR with hr_loader(name) and yields
+    # (subject, row indices, hr, temp, hr_samples, temp_samples) for the
+    # subject's rows, so only one subject's raw samples are held at a time.
+    # capsules: {name: capsules in temp_iter} (thermo_loaders.capsule_counts);
+    # a subject on several capsules is aligned once all of them have arrived,
+    # on their concatenation like the batch path. Subjects without a capsule
+    # follow with HR only.
+    if seconds is None:
+        seconds = np.arange(WINDOW[0], WINDOW[1] + 1, 1)
+    seconds = np.asarray(seconds)
+    rows = event_rows(experiments)
+    groups = rows.groupby("subject").indices
+    done = set()
+
+    def align(subject, temp_df):
+        idx = groups[subject]
+        sub_rows = rows.iloc[idx]
+        hr, hr_samples = _align_signal({subject: hr_loader(subject)}, 'HR (bpm)', sub_rows, seconds, "nearest", None, "hr")
+        temp, temp_samples = _align_signal({subject: temp_df}, 'Temp', sub_rows, seconds, "interp", None, "temp")
+        done.add(subject)
+        return subject, idx, hr, temp, hr_samples, temp_samples
+
+    for name, frames in group_capsules(temp_iter, capsules):
+        if name in groups:
+            yield align(name, merge_frames(frames))
+    for subject in sorted(set(groups) - done):
+        yield align(subject, None)
+
+def stream_session_tensor(experiments, clean=False, seconds=None, epoch=None):
+    # load_session_tensor with bounded memory: the tensor (rows x seconds) is
+    # filled subject by subject from iter_aligned_subjects.
+    epoch = session_date_epoch() if epoch is None else epoch
+    if seconds is None:
+        seconds = np.arange(WINDOW[0], WINDOW[1] + 1, 1)
+    seconds = np.asarray(seconds)
+    rows = event_rows(experiments)
+    shape = (len(rows), seconds.size)
+    tensor = AlignedTensor(seconds, rows, np.full(shape, np.nan), np.full(shape, np.nan),
+                           np.zeros(len(rows), dtype=np.int64), np.zeros(len(rows), dtype=np.int64))
+
+    temp_iter = iter_temp_data(epoch)
+    cleaner = TempCleaner() if clean else None
+    if clean:
+        temp_iter = iter_clean_temp_data(temp_iter, cleaner=cleaner)
+    for _, idx, hr, temp, hr_samples, temp_samples in iter_aligned_subjects(
+            experiments, temp_iter, lambda name: load_hr_data_for_subject(name, epoch), seconds, capsule_counts()):
+        tensor.hr[idx], tensor.temp[idx] = hr, temp
+        tensor.hr_samples[idx], tensor.temp_samples[idx] = hr_samples, temp_samples
+    if clean:
+        print(cleaner.report().to_string(index=False))
+    return tensor
+
+def store_frames(store, signal):
+    # {subject: (times, values)} read-only views into a session_store.SessionStore
+    return {key: store.series(signal, key) for key in store.keys(signal)}
+
+def load_session_tensor(experiments, correct_offsets=False, clean=False, seconds=None, low_memory=False,
+                        store=SESSION_STORE, markers=None):
+    # Load capsules + per-subject HR once and build the aligned tensor.
+    # low_memory streams one subject at a time (stream_session_tensor).
+    # store: a session_store.SessionStore, True to open (and if stale,
+    # rebuild) the default one, or None/False to parse the workbooks. From a store
+    # the signals are memmap slices, so processes sharing it share the pages.
+    # markers: {subject: [(capsule_t, true_t), ...]} sync markers that
+    # correct the capsule loggers (clock_offset.offsets_from_markers).
+    from clock_offset import estimate_offsets, offsets_from_markers, offsets_table  # imports this module
+
+    if low_memory:
+        if correct_offsets or markers:
+            raise ValueError("clock offset correction compares the whole cohort; use low_memory=False")
+        return stream_session_tensor(experiments, clean=clean, seconds=seconds)
+
+    subjects = {name for _, events in experiments for _, names, _ in events for name in names}
+    if store:
+        if store is True:
+            from session_store import open_session_store
+            store = open_session_store()
+        temp_frames = store_frames(store, "temp")
+        hr_frames = {name: series for name, series in store_frames(store, "hr").items() if name in subjects}
+        if clean:
+            # Cleaning writes new arrays anyway; only the parse is skipped.
+            temp_data = [(name, pd.DataFrame({"SessionSeconds": t, "Temp": v})) for name, (t, v) in temp_frames.items()]
+            temp_data, report = clean_temp_data(temp_data)
+            print(report.to_string(index=False))
+            temp_frames = merge_capsules(temp_data)
+    else:
+        temp_data = load_temp_data()
+        epoch = data_epoch(temp_data)
+        if clean:
+            temp_data, report = clean_temp_data(temp_data)
+            print(report.to_string(index=False))
+        temp_frames = merge_capsules(temp_data)
+        hr_frames = {name: load_hr_data_for_subject(name, epoch) for name in sorted(subjects)}
+
+    offsets = None
+    if correct_offsets or markers:
+        offsets = {}
+        if correct_offsets:
+            offsets.update(estimate_offsets(experiments, temp_frames, hr_frames))
+        if markers:
+            offsets.update(offsets_from_markers(markers))
+        print(offsets_table(offsets).to_string(index=False))
+    return build_aligned_tensor(experiments, temp_frames, hr_frames, offsets=offsets, seconds=seconds)
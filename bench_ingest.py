@@ -0,0 +1,126 @@
+import csv
+import datetime
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+import capsule_layout
+from thermo_loaders import CAPSULE_NAME_MAPPING, load_temp_data
+
+# --- Configuration ---
+SESSION = "260117"
+SAMPLES = 20000         # rows per capsule file (1 Hz, ~5.5 h)
+META_ROWS = 6           # logger metadata above the capsule header
+REPEATS = 3
+SEED = 0
+
+# Capsule ingest from the logger's three export formats of the same sheet:
+#   xlsx            openpyxl read-only stream of the capsule columns
+#   csv / tsv       capsule_layout's text path, pyarrow's CSV reader
+#   csv (C parser)  the same with pyarrow unavailable: pandas' C engine
+# Each format is written to its own directory from the same synthetic
+# session (the CAPSULE_NAME_MAPPING files) and loaded with load_temp_data.
+# "cold" includes layout inference, "warm" reads the cached layout. The
+# outputs are checked to be identical (Datetime, SessionSeconds, Temp).
+
+def session_rows(capsules, rng):
+    # Header rows and data rows of one capsule file, as cell values.
+    rows = [[f"meta{r}"] for r in range(META_ROWS)]
+    header, labels = [], []
+    for cap_id in capsules:
+        header += [f"Capsule n-{cap_id}", None, None, None, None]
+        labels += ["Sample", "Date", "Hour", "Temperature", None]
+    rows += [header, labels]
+    start = 13 * 3600
+    temps = np.round(37.0 + np.cumsum(rng.normal(0, 0.01, (SAMPLES, len(capsules))), axis=0), 2)
+    for k in range(SAMPLES):
+        s = start + k
+        row = []
+        for j in range(len(capsules)):
+            row += [k + 1, datetime.datetime(2026, 1, 17), datetime.time(s // 3600, (s // 60) % 60, s % 60),
+                    float(temps[k, j]), None]
+        rows.append(row)
+    return rows
+
+def write_xlsx(path, rows):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def write_text(path, rows, delimiter):
+    def cell(v):
+        if v is None:
+            return ""
+        if isinstance(v, datetime.datetime):
+            return v.strftime("%Y/%m/%d")
+        if isinstance(v, datetime.time):
+            return v.strftime("%H:%M:%S")
+        return v
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f, delimiter=delimiter).writerows([cell(v) for v in row] for row in rows)
+
+def make_session(root, rng):
+    dirs = {fmt: root / fmt for fmt in ("xlsx", "csv", "tsv")}
+    for d in dirs.values():
+        d.mkdir()
+    for file_no, mapping in CAPSULE_NAME_MAPPING.items():
+        rows = session_rows(sorted(mapping), rng)
+        write_xlsx(dirs["xlsx"] / f"{SESSION}_no{file_no}.xlsx", rows)
+        write_text(dirs["csv"] / f"{SESSION}_no{file_no}.csv", rows, ",")
+        write_text(dirs["tsv"] / f"{SESSION}_no{file_no}.tsv", rows, "\t")
+    return dirs
+
+def bench(name, directory, repeats):
+    # The first load infers and caches the layouts (cold); the rest reuse them.
+    times = []
+    for _ in range(repeats + 1):
+        start = time.perf_counter()
+        data = load_temp_data(downloads_dir=directory, session=SESSION)
+        times.append(time.perf_counter() - start)
+    mb = sum(f.stat().st_size for f in directory.iterdir()) / 1e6
+    rows = sum(len(df) for _, df in data)
+    warm = float(np.median(times[1:]))
+    print(f"{name:16s} {mb:7.1f} MB  cold {times[0]:7.3f} s  warm {warm:7.3f} s  {rows / warm / 1e6:6.2f} M rows/s")
+    return warm, data
+
+def same_output(a, b):
+    if [n for n, _ in a] != [n for n, _ in b]:
+        return False
+    cols = ['Datetime', 'SessionSeconds', 'Temp']
+    return all(x[cols].reset_index(drop=True).equals(y[cols].reset_index(drop=True)) for (_, x), (_, y) in zip(a, b))
+
+def main():
+    rng = np.random.default_rng(SEED)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        dirs = make_session(root, rng)
+        # The layout cache is Downloads/capsule_layouts.json relative to the
+        # working directory; keep the benchmark's entries out of the real one.
+        os.chdir(root)
+        try:
+            base, reference = bench("xlsx", dirs["xlsx"], REPEATS)
+            results = {}
+            if capsule_layout.pacsv is not None:
+                results["csv"] = bench("csv", dirs["csv"], REPEATS)
+                results["tsv"] = bench("tsv", dirs["tsv"], REPEATS)
+            pacsv, capsule_layout.pacsv = capsule_layout.pacsv, None
+            try:
+                results["csv (C parser)"] = bench("csv (C parser)", dirs["csv"], REPEATS)
+            finally:
+                capsule_layout.pacsv = pacsv
+        finally:
+            os.chdir(cwd)
+
+    for name, (warm, data) in results.items():
+        print(f"{name:16s} {base / warm:5.1f}x faster than xlsx, output identical: {same_output(reference, data)}")
+
+if __name__ == "__main__":
+    main()
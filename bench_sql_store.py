@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from sql_store import SCHEMA, WINDOW_SQL
+from timebase import window_bounds
+
+# --- Configuration ---
+N_SESSIONS = 10
+N_SUBJECTS = 8
+SESSION_SECONDS = 3 * 3600      # 1 Hz HR per subject and session
+EVENTS_PER_SUBJECT = 3
+WINDOW = (-300, 420)
+REPEATS = 3
+SEED = 0
+
+# Window extraction over many sessions, three ways:
+#   scan-and-mask   one long DataFrame, a boolean mask over all rows per window
+#                   (how the scripts cut windows before timebase.window_bounds)
+#   searchsorted    per-series sorted arrays + timebase.window_bounds
+#   sqlite          sql_store's prepared WINDOW_SQL on the clustered primary key
+# Synthetic data, in memory, so only the query strategies are compared.
+
+def make_data(rng):
+    t = np.arange(SESSION_SECONDS, dtype=np.int64) + 8 * 3600
+    frames, windows = [], []
+    for s in range(N_SESSIONS):
+        for k in range(N_SUBJECTS):
+            values = 70 + rng.normal(0, 3, t.size)
+            frames.append(pd.DataFrame({"session": f"s{s:02d}", "subject": f"p{k}", "signal": "hr",
+                                        "t": t, "value": values}))
+            for event_t in rng.integers(t[0] + 600, t[-1] - 600, EVENTS_PER_SUBJECT):
+                windows.append((f"s{s:02d}", f"p{k}", int(event_t)))
+    return pd.concat(frames, ignore_index=True), windows
+
+def bench(name, fn, windows, repeats=REPEATS):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        n = sum(fn(*w) for w in windows)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<15} {best * 1000:9.1f} ms total  {best / len(windows) * 1e6:9.1f} us/window  ({n} samples)")
+
+def main():
+    rng = np.random.default_rng(SEED)
+    df, windows = make_data(rng)
+    print(f"{len(df)} samples, {len(windows)} windows")
+
+    t_all = df["t"].to_numpy()
+    session_all = df["session"].to_numpy()
+    subject_all = df["subject"].to_numpy()
+
+    def scan_and_mask(session, subject, event_t):
+        mask = (session_all == session) & (subject_all == subject) & \
+               (t_all >= event_t + WINDOW[0]) & (t_all <= event_t + WINDOW[1])
+        return int(mask.sum())
+
+    series = {key: (g["t"].to_numpy(), g["value"].to_numpy()) for key, g in df.groupby(["session", "subject"])}
+
+    def searchsorted(session, subject, event_t):
+        times, values = series[session, subject]
+        lo, hi = window_bounds(times, event_t, *WINDOW)
+        return len(values[lo:hi])
+
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    start = time.perf_counter()
+    with conn:
+        conn.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?)", df.itertuples(index=False, name=None))
+    print(f"sqlite ingest   {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    def sqlite_window(session, subject, event_t):
+        rows = conn.execute(WINDOW_SQL, {"session": session, "subject": subject, "signal": "hr",
+                                         "event_t": event_t, "lo": WINDOW[0], "hi": WINDOW[1]}).fetchall()
+        return len(rows)
+
+    bench("scan-and-mask", scan_and_mask, windows, repeats=1)  # slow enough to time once
+    bench("searchsorted", searchsorted, windows)
+    bench("sqlite", sqlite_window, windows)
+
+if __name__ == "__main__":
+    main()
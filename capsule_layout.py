@@ -0,0 +1,268 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # optional; text exports then go through pandas' C parser
+    pa = pacsv = None
+
+from excel_backends import read_rows
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+LAYOUT_CACHE = DOWNLOADS_DIR / "capsule_layouts.json"
+PREFIX_ROWS = 30            # rows read to infer a layout
+FIELD_LABELS = {"Date": ("date",), "Time": ("hour", "time"), "Temp": ("temperature", "temp")}
+# Offsets from the "Capsule n-X" cell when a workbook has no label row
+DEFAULT_OFFSETS = {"Date": 1, "Time": 2, "Temp": 3}
+# Text exports of the same sheet: extension -> delimiter (None: sniffed)
+TEXT_EXTENSIONS = {".csv": ",", ".tsv": "\t", ".txt": None}
+TEXT_ENCODING = "utf-8"
+
+# Capsule logger exports put a "Capsule n-X" cell above each capsule's column
+# group and a label row (Sample / Date / Hour / Temperature) below it. The
+# layout (header rows, capsule columns, first data row) is inferred from the
+# first PREFIX_ROWS rows only, and the data read then requests just the
+# Date/Hour/Temperature columns of every capsule, starting at the first data
+# row. Layouts are cached in LAYOUT_CACHE: per workbook (path, size, mtime),
+# so an unchanged workbook is not even opened for inference, and per export
+# format (signature of the header rows), so the field offsets of a format are
+# only worked out once. The logger's CSV/TSV export of the same sheet goes
+# through the same inference; its data rows are then parsed by a native CSV
+# reader with the column types fixed up front.
+
+_cache_lock = threading.Lock()
+
+@dataclass(frozen=True)
+class CapsuleLayout:
+    signature: str
+    capsule_row: int
+    data_start: int
+    capsules: tuple     # ((capsule_id, date_col, time_col, temp_col), ...)
+
+    def columns(self):
+        return sorted({c for _, *cols in self.capsules for c in cols})
+
+def _capsule_cells(row):
+    cells = []
+    for col_idx, val in row.items():
+        if isinstance(val, str) and "Capsule" in val:
+            match = re.search(r'n[^\d]*(\d+)', val)   # n-1, nｰ1 etc.
+            if match:
+                cells.append((int(col_idx), int(match.group(1))))
+    return cells
+
+def _is_label(val, field):
+    return isinstance(val, str) and val.strip().lower() in FIELD_LABELS[field]
+
+def _header_rows(prefix):
+    # (capsule row, [(col, capsule_id), ...], label row or None)
+    for row_idx in range(len(prefix)):
+        cells = _capsule_cells(prefix.iloc[row_idx])
+        if cells:
+            for label_idx in range(row_idx + 1, min(row_idx + 4, len(prefix))):
+                if any(_is_label(v, f) for v in prefix.iloc[label_idx] for f in FIELD_LABELS):
+                    return row_idx, cells, label_idx
+            return row_idx, cells, None
+    return None, [], None
+
+def _mask(val):
+    return re.sub(r'\d+', '#', str(val).strip().lower()) if isinstance(val, str) else ""
+
+def layout_signature(prefix, capsule_row, cells, label_row):
+    # Same export format <=> same header rows once capsule numbers are masked.
+    first = cells[0][0]
+    rows = [capsule_row] + ([label_row] if label_row is not None else [])
+    text = [[row - capsule_row, int(col) - first, _mask(val)]
+            for row in rows for col, val in prefix.iloc[row].items() if _mask(val)]
+    return hashlib.sha1(json.dumps([capsule_row, text]).encode('utf-8')).hexdigest()[:16]
+
+def _field_offsets(prefix, cells, label_row):
+    # Offsets of Date/Time/Temp from the capsule cell, from the label row of
+    # the first capsule group; defaults where a label is missing.
+    offsets = dict(DEFAULT_OFFSETS)
+    if label_row is None:
+        return offsets
+    start = cells[0][0]
+    stop = cells[1][0] if len(cells) > 1 else prefix.shape[1]
+    labels = prefix.iloc[label_row]
+    for field in FIELD_LABELS:
+        for col in range(start, stop):
+            if col in labels.index and _is_label(labels[col], field):
+                offsets[field] = col - start
+                break
+    return offsets
+
+def infer_layout(prefix, formats=None):
+    # prefix: the first rows of a sheet read with header=None. formats: the
+    # cached {signature: {"data_start", "offsets"}}, updated in place.
+    capsule_row, cells, label_row = _header_rows(prefix)
+    if not cells:
+        return None
+    signature = layout_signature(prefix, capsule_row, cells, label_row)
+    formats = {} if formats is None else formats
+    if signature not in formats:
+        formats[signature] = {"data_start": (label_row if label_row is not None else capsule_row + 1) + 1,
+                              "offsets": _field_offsets(prefix, cells, label_row)}
+    fmt = formats[signature]
+    offsets = fmt["offsets"]
+    capsules = tuple((cap_id, col + offsets["Date"], col + offsets["Time"], col + offsets["Temp"])
+                     for col, cap_id in cells)
+    # A group cut off at the sheet edge has no Temperature column to read.
+    capsules = tuple(c for c in capsules if max(c[1:]) < prefix.shape[1])
+    return CapsuleLayout(signature, capsule_row, fmt["data_start"], capsules)
+
+def is_text_export(path):
+    return Path(path).suffix.lower() in TEXT_EXTENSIONS
+
+def _text_delimiter(path):
+    delimiter = TEXT_EXTENSIONS[Path(path).suffix.lower()]
+    if delimiter is None:
+        with open(path, encoding=TEXT_ENCODING, errors='replace') as f:
+            delimiter = "\t" if "\t" in f.read(4096) else ","
+    return delimiter
+
+def _read_text_prefix(path, nrows):
+    # Empty fields become None, like empty cells of a workbook.
+    with open(path, encoding=TEXT_ENCODING, errors='replace', newline='') as f:
+        rows = [[cell if cell.strip() else None for cell in row]
+                for row in itertools.islice(csv.reader(f, delimiter=_text_delimiter(path)), nrows)]
+    return pd.DataFrame(rows)
+
+def read_prefix(path, nrows=PREFIX_ROWS):
+    # The first rows as a DataFrame indexed like pd.read_excel(header=None).
+    if is_text_export(path):
+        return _read_text_prefix(path, nrows)
+    return pd.DataFrame(list(read_rows(path, max_row=nrows)))
+
+def _read_cache(cache_path):
+    if cache_path is None or not Path(cache_path).exists():
+        return {"formats": {}, "files": {}}
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+        return {"formats": cache.get("formats", {}), "files": cache.get("files", {})}
+    except (OSError, ValueError):
+        return {"formats": {}, "files": {}}
+
+def _write_cache(cache_path, cache):
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, cache_path)
+
+def workbook_layout(path, cache_path=LAYOUT_CACHE):
+    # Layout of one workbook, from the cache when the file is unchanged.
+    # None when no "Capsule" header is found.
+    path = Path(path)
+    stat = path.stat()
+    key = str(path.resolve())
+    with _cache_lock:
+        cache = _read_cache(cache_path)
+        entry = cache["files"].get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            if entry["signature"] is None:
+                return None
+            return CapsuleLayout(entry["signature"], entry["capsule_row"], entry["data_start"],
+                                 tuple(tuple(c) for c in entry["capsules"]))
+
+        layout = infer_layout(read_prefix(path), cache["formats"])
+        cache["files"][key] = {"size": stat.st_size, "mtime": stat.st_mtime,
+                               "signature": layout and layout.signature,
+                               "capsule_row": layout and layout.capsule_row,
+                               "data_start": layout and layout.data_start,
+                               "capsules": [list(c) for c in layout.capsules] if layout else []}
+        if cache_path is not None:
+            _write_cache(cache_path, cache)
+    return layout
+
+def _read_sheet_columns(path, layout):
+    # Only the span of capsule columns is requested from the reader backend
+    # (excel_backends.py) and only the capsule columns are kept, which is
+    # what pd.read_excel(usecols=...) does not manage: it converts the whole
+    # row first.
+    columns = layout.columns()
+    first, last = columns[0], columns[-1]
+    picks = [c - first for c in columns]
+    data = {c: [] for c in columns}
+    for row in read_rows(path, min_row=layout.data_start, min_col=first, max_col=last + 1):
+        for c, i in zip(columns, picks):
+            data[c].append(row[i] if i < len(row) else None)
+    return data
+
+def _read_text_columns(path, layout):
+    # Date and Time are kept as text (timebase parses them vectorized) and
+    # Temperature is parsed to float64 by the reader itself. pyarrow's
+    # multithreaded reader when installed, else pandas' C parser; a
+    # non-numeric temperature cell falls back to reading it as text, which
+    # _block_to_frame coerces as it does for workbooks.
+    columns = layout.columns()
+    temp_cols = {temp for _, _, _, temp in layout.capsules}
+    delimiter = _text_delimiter(path)
+    if pacsv is not None:
+        names = {c: f"f{c}" for c in columns}  # autogenerated column names
+        try:
+            table = pacsv.read_csv(
+                path,
+                read_options=pacsv.ReadOptions(skip_rows=layout.data_start, autogenerate_column_names=True,
+                                               encoding=TEXT_ENCODING),
+                parse_options=pacsv.ParseOptions(delimiter=delimiter),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=list(names.values()),
+                    column_types={n: pa.float64() if c in temp_cols else pa.string() for c, n in names.items()},
+                    strings_can_be_null=True))
+            return {c: table.column(n).to_numpy(zero_copy_only=False) for c, n in names.items()}
+        except pa.ArrowInvalid:
+            pass    # ragged rows or text in a temperature column
+
+    def read(dtype):
+        return pd.read_csv(path, sep=delimiter, header=None, skiprows=layout.data_start, usecols=columns,
+                           dtype=dtype, engine='c', encoding=TEXT_ENCODING, encoding_errors='replace')
+    try:
+        frame = read({c: 'float64' if c in temp_cols else str for c in columns})
+    except ValueError:
+        frame = read({c: str for c in columns})
+    return {c: frame[c].to_numpy() for c in columns}
+
+def read_capsule_blocks(path, layout=None, cache_path=LAYOUT_CACHE):
+    # [(capsule_id, DataFrame with Date/Time/Temp), ...] in sheet order,
+    # reading only the capsule columns below the header rows. The index is
+    # the 0-based sheet row, as in a full read with header=None (for text
+    # exports, blank lines are not counted).
+    layout = layout or workbook_layout(path, cache_path)
+    if layout is None or not layout.capsules:
+        return []
+    if is_text_export(path):
+        data = _read_text_columns(path, layout)
+    else:
+        data = _read_sheet_columns(path, layout)
+    n = len(data[layout.columns()[0]])
+    index = pd.RangeIndex(layout.data_start, layout.data_start + n)
+    return [(cap_id, pd.DataFrame({"Date": data[date_col], "Time": data[time_col], "Temp": data[temp_col]}, index=index))
+            for cap_id, date_col, time_col, temp_col in layout.capsules]
+
+def main():
+    from thermo_loaders import find_capsule_files
+
+    for path in find_capsule_files():
+        layout = workbook_layout(path)
+        if layout is None:
+            print(f"{path.name}: no capsule headers found")
+            continue
+        print(f"{path.name}: format {layout.signature}, data from row {layout.data_start}, "
+              f"capsules {[(c[0], c[1:]) for c in layout.capsules]}")
+
+if __name__ == "__main__":
+    main()
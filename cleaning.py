@@ -0,0 +1,172 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- Configuration ---
+CLEANING_CONFIG = {
+    "valid_range": (25.0, 44.0),   # °C; anything outside cannot be core temperature
+    "spike_window": 7,             # previous samples in the rolling median/MAD
+    "spike_mad_k": 5.0,            # |x - median| > k * 1.4826 * MAD is a spike ...
+    "spike_min_delta": 0.3,        # ... and at least this many °C
+    "max_rate": 0.02,              # °C per second from the last good sample (~1.2 °C/min) ...
+    "rate_min_delta": 0.3,         # ... and at least this many °C, above 1 Hz sensor noise
+    "gap_seconds": 60,             # sampling gaps longer than this are reported
+    "out_of_body_temp": 33.0,      # below this *and* a rolling median below it
+    "chunk_size": 100_000,
+}
+FILTERS = ["range", "out_of_body", "spike", "rate"]
+
+# Replaces the fixed `Temp >= 36.0` / `Temp >= 30.0` cut-offs. All filters
+# are causal (they only look at earlier samples), so feeding a capsule in
+# chunks, or appending new samples later, gives the same result as one pass.
+# Samples flagged by several filters are counted under the first in FILTERS.
+
+class TempCleaner:
+    def __init__(self, config=None):
+        self.config = {**CLEANING_CONFIG, **(config or {})}
+        self._history = {}   # key -> (times, values) of the last spike_window raw samples
+        self._last_good = {} # key -> (time, value) of the last sample the other filters passed
+        self._counts = {}    # key -> {"samples": n, <filter>: n}
+        self._gaps = {}      # key -> [(gap_start, gap_end), ...]
+
+    def feed(self, keys, times, values):
+        # keys/times/values: one sample per entry, any mix of capsules, each
+        # capsule's samples in time order. Returns a boolean keep mask.
+        cfg = self.config
+        w = cfg["spike_window"]
+        keys = np.asarray(keys)
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        keep = np.zeros(len(values), dtype=bool)
+        if len(values) == 0:
+            return keep
+
+        codes, uniques = pd.factorize(keys)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+        # Per capsule: exactly w history slots (NaN-padded) then the new
+        # samples, so no rolling window ever spans two capsules.
+        seg_v, seg_t, is_new = [], [], []
+        for g, key in enumerate(uniques):
+            idx = order[bounds[g]:bounds[g + 1]]
+            hist_t, hist_v = self._history.get(key, (np.empty(0, np.int64), np.empty(0)))
+            pad = w - len(hist_v)
+            seg_v += [np.full(pad, np.nan), hist_v, values[idx]]
+            seg_t += [np.full(pad, -1, dtype=np.int64), hist_t, times[idx]]
+            is_new += [np.zeros(pad + len(hist_v), dtype=bool), np.ones(len(idx), dtype=bool)]
+            all_t = np.concatenate([hist_t, times[idx]])
+            all_v = np.concatenate([hist_v, values[idx]])
+            self._history[key] = (all_t[-w:], all_v[-w:])
+
+        full_v = np.concatenate(seg_v)
+        full_t = np.concatenate(seg_t)
+        new = np.flatnonzero(np.concatenate(is_new))
+
+        windows = sliding_window_view(full_v, w)[new - w]  # the w samples before each new one
+        x = full_v[new]
+        t = full_t[new]
+        prev_t = full_t[new - 1]
+        has_prev = prev_t >= 0
+        sample_keys = np.concatenate([np.full(bounds[g + 1] - bounds[g], g) for g in range(len(uniques))])
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            # the first samples of a capsule have an all-NaN history window
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median = np.nanmedian(windows, axis=1)
+            mad = np.nanmedian(np.abs(windows - median[:, None]), axis=1)
+            deviation = np.abs(x - median)
+
+            flags = {
+                "range": ~np.isfinite(x) | (x < cfg["valid_range"][0]) | (x > cfg["valid_range"][1]),
+                "out_of_body": (x < cfg["out_of_body_temp"]) & (median < cfg["out_of_body_temp"]),
+                "spike": (deviation > np.maximum(cfg["spike_mad_k"] * 1.4826 * mad, cfg["spike_min_delta"])),
+            }
+            flags = {name: np.nan_to_num(mask, nan=0).astype(bool) for name, mask in flags.items()}
+
+            # Rate: the step from the last sample the other filters passed,
+            # earlier in this batch or carried over from the previous one.
+            good = ~(flags["range"] | flags["out_of_body"] | flags["spike"])
+            last = np.maximum.accumulate(np.where(good, np.arange(len(new)), -1))
+            ref = np.concatenate([[-1], last[:-1]])
+            ref[ref < bounds[sample_keys]] = -1       # not from an earlier capsule in the batch
+            carried = np.array([self._last_good.get(key, (-1, np.nan)) for key in uniques]).reshape(-1, 2)
+            ref_t = np.where(ref >= 0, t[ref], carried[sample_keys, 0])
+            ref_v = np.where(ref >= 0, x[ref], carried[sample_keys, 1])
+            step = np.abs(x - ref_v)
+            limit = np.maximum(cfg["max_rate"] * np.maximum(t - ref_t, 1), cfg["rate_min_delta"])
+            flags["rate"] = np.nan_to_num((ref_t >= 0) & (step > limit), nan=0).astype(bool)
+
+        for g, key in enumerate(uniques):
+            in_key = np.flatnonzero(good[bounds[g]:bounds[g + 1]])
+            if in_key.size:
+                i = bounds[g] + in_key[-1]
+                self._last_good[key] = (int(t[i]), float(x[i]))
+
+        removed = np.zeros(len(new), dtype=bool)
+        for g, key in enumerate(uniques):
+            counts = self._counts.setdefault(key, {"samples": 0, **{f: 0 for f in FILTERS}})
+            counts["samples"] += int(bounds[g + 1] - bounds[g])
+        for name in FILTERS:
+            first = flags[name] & ~removed
+            for g, n in zip(*np.unique(sample_keys[first], return_counts=True)):
+                self._counts[uniques[g]][name] += int(n)
+            removed |= flags[name]
+
+        gap = has_prev & (t - prev_t > cfg["gap_seconds"])
+        for i in np.flatnonzero(gap):
+            self._gaps.setdefault(uniques[sample_keys[i]], []).append((int(prev_t[i]), int(t[i])))
+
+        keep[order] = ~removed
+        return keep
+
+    def report(self):
+        rows = []
+        for key, counts in self._counts.items():
+            gaps = self._gaps.get(key, [])
+            removed = sum(counts[f] for f in FILTERS)
+            rows.append({"key": key, **counts, "kept": counts["samples"] - removed, "gaps": len(gaps),
+                         "longest_gap_s": max((b - a for a, b in gaps), default=0)})
+        return pd.DataFrame(rows, columns=["key", "samples", *FILTERS, "kept", "gaps", "longest_gap_s"])
+
+    def gaps(self, key):
+        return list(self._gaps.get(key, []))
+
+def clean_temp_data(temp_data, config=None, cleaner=None):
+    # temp_data: [(name, DataFrame with SessionSeconds/Temp), ...] as returned
+    # by thermo_loaders.load_temp_data. All capsules go through the cleaner as
+    # one stream, in bounded chunks.
+    cleaner = cleaner or TempCleaner(config)
+    if not temp_data:
+        return [], cleaner.report()
+    keys = np.concatenate([np.full(len(df), i) for i, (_, df) in enumerate(temp_data)])
+    times = np.concatenate([df['SessionSeconds'].to_numpy() for _, df in temp_data])
+    values = np.concatenate([pd.to_numeric(df['Temp'], errors='coerce').to_numpy(dtype=float) for _, df in temp_data])
+    labels = np.array([name for name, _ in temp_data], dtype=object)
+
+    chunk = cleaner.config["chunk_size"]
+    keep = np.concatenate([cleaner.feed(labels[keys[i:i + chunk]], times[i:i + chunk], values[i:i + chunk])
+                           for i in range(0, len(values), chunk)]) if len(values) else np.empty(0, bool)
+
+    cleaned = []
+    start = 0
+    for name, df in temp_data:
+        cleaned.append((name, df[keep[start:start + len(df)]]))
+        start += len(df)
+    return cleaned, cleaner.report()
+
+def iter_clean_temp_data(temp_iter, config=None, cleaner=None):
+    # Streaming clean_temp_data: consumes (name, frame) pairs one capsule at a
+    # time (e.g. thermo_loaders.iter_temp_data) and yields them cleaned. The
+    # filters only look back, so the result equals the batch version; the
+    # report is cleaner.report() once the stream is exhausted.
+    cleaner = cleaner or TempCleaner(config)
+    chunk = cleaner.config["chunk_size"]
+    for name, df in temp_iter:
+        times = df['SessionSeconds'].to_numpy()
+        values = pd.to_numeric(df['Temp'], errors='coerce').to_numpy(dtype=float)
+        keep = np.concatenate([cleaner.feed(np.full(min(chunk, len(values) - i), name, dtype=object),
+                                            times[i:i + chunk], values[i:i + chunk])
+                               for i in range(0, len(values), chunk)]) if len(values) else np.empty(0, bool)
+        yield name, df[keep]
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from alignment import build_aligned_tensor
+
+# --- Configuration ---
+SEARCH_WINDOW = (-600, 600)   # seconds around each event used for correlation
+MAX_LAG = 60                  # largest offset considered, seconds
+MIN_SCORE = 0.3               # peak normalized correlation needed to trust a lag
+SMOOTHING = {"hr": 15, "temp": 60}
+FIT_DRIFT = True
+REFINE_PASSES = 1
+# Core temperature responds over minutes, too slowly to resolve lags of a few
+# seconds by correlation; capsule loggers are corrected from sync markers
+# (offsets_from_markers) unless "temp" is passed explicitly.
+XCORR_SIGNALS = ("hr",)
+
+# Clock model per device (one HR monitor or capsule logger per subject):
+#   device_time = true_time + offset + drift * (true_time - ref_t)
+# Offsets are estimated against the cohort consensus: every device's event
+# responses are cross-correlated (FFT, all rows in one batch) with the mean
+# response of its signal, and the per-event lags are fitted per device.
+
+def _prepare(block, smooth):
+    # Fill gaps, smooth, differentiate and z-normalize every row at once; the
+    # derivative makes the onset dominate the correlation rather than levels.
+    filled = pd.DataFrame(block.T).interpolate(limit_direction='both').to_numpy().T
+    filled = np.where(np.isfinite(filled), filled, 0.0)
+    if smooth > 1:
+        kernel = np.ones(smooth) / smooth
+        c = np.cumsum(np.pad(filled, ((0, 0), (smooth, 0)), mode='edge'), axis=1)
+        filled = (c[:, smooth:] - c[:, :-smooth]) * kernel[0]
+    diff = np.diff(filled, axis=1)
+    diff -= diff.mean(axis=1, keepdims=True)
+    norm = np.linalg.norm(diff, axis=1, keepdims=True)
+    return np.divide(diff, norm, out=np.zeros_like(diff), where=norm > 0)
+
+def cross_correlation_lags(responses, template, max_lag=MAX_LAG):
+    # Lag (in samples) of every row of `responses` relative to `template`,
+    # positive when the row lags behind, plus the normalized peak value.
+    n = responses.shape[1]
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    spectra = np.fft.rfft(responses, size, axis=1) * np.conj(np.fft.rfft(template, size))[None, :]
+    corr = np.fft.irfft(spectra, size, axis=1)
+    lags = np.concatenate([np.arange(0, max_lag + 1), np.arange(-max_lag, 0)])
+    candidates = corr[:, lags]
+    best = np.argmax(candidates, axis=1)
+    return lags[best], candidates[np.arange(len(best)), best]
+
+def _shift_rows(responses, lags):
+    # Undo each row's lag (edge-clamped) so the template can be re-estimated.
+    idx = np.clip(np.arange(responses.shape[1])[None, :] + lags[:, None], 0, responses.shape[1] - 1)
+    return np.take_along_axis(responses, idx, axis=1)
+
+def fit_device_clocks(devices, event_t, lags, weights, fit_drift=FIT_DRIFT):
+    # Weighted linear fit lag = offset + drift * (event_t - ref_t) for every
+    # device at once via grouped sums.
+    codes, keys = pd.factorize(pd.Series(devices))
+    w = np.asarray(weights, dtype=float)
+    t = np.asarray(event_t, dtype=float)
+    y = np.asarray(lags, dtype=float)
+    n = len(keys)
+
+    def group_sum(x):
+        return np.bincount(codes, weights=x, minlength=n)
+
+    sw = group_sum(w)
+    ref_t = np.divide(group_sum(w * t), sw, out=np.zeros(n), where=sw > 0)
+    dt = t - ref_t[codes]
+    mean_y = np.divide(group_sum(w * y), sw, out=np.zeros(n), where=sw > 0)
+    sxx = group_sum(w * dt * dt)
+    sxy = group_sum(w * dt * (y - mean_y[codes]))
+    events = np.bincount(codes, weights=(w > 0).astype(float), minlength=n)
+    if fit_drift:
+        drift = np.divide(sxy, sxx, out=np.zeros(n), where=(sxx > 0) & (events >= 2))
+    else:
+        drift = np.zeros(n)
+
+    return {key: {"offset": float(mean_y[i]), "drift": float(drift[i]), "ref_t": int(round(ref_t[i])),
+                  "n_events": int(events[i])}
+            for i, key in enumerate(keys) if sw[i] > 0}
+
+def offsets_from_markers(markers, signal="temp", fit_drift=FIT_DRIFT):
+    # markers: {subject: [(device_t, true_t), ...]} from shared sync markers,
+    # e.g. a tap or button press seen by every device; device_t in the
+    # session seconds of `signal`'s device. Keyed (signal, subject) like
+    # estimate_offsets, as alignment.correct_times looks them up.
+    devices, true_t, lags = [], [], []
+    for subject, pairs in markers.items():
+        for device_t, reference_t in pairs:
+            devices.append(subject)
+            true_t.append(reference_t)
+            lags.append(device_t - reference_t)
+    fitted = fit_device_clocks(devices, true_t, lags, np.ones(len(lags)), fit_drift)
+    return {(signal, subject): fit for subject, fit in fitted.items()}
+
+def estimate_offsets(experiments, temp_frames, hr_frames, signals=XCORR_SIGNALS, max_lag=MAX_LAG, min_score=MIN_SCORE):
+    seconds = np.arange(SEARCH_WINDOW[0], SEARCH_WINDOW[1] + 1, 1)
+    tensor = build_aligned_tensor(experiments, temp_frames, hr_frames, seconds=seconds)
+    offsets = {}
+    for signal in signals:
+        block = getattr(tensor, signal)
+        has_data = np.isfinite(block).sum(axis=1) > seconds.size // 2
+        if has_data.sum() < 2:
+            continue
+        responses = _prepare(block[has_data], SMOOTHING.get(signal, 1))
+        template = responses.mean(axis=0)
+        template /= np.linalg.norm(template) or 1.0
+        lags, scores = cross_correlation_lags(responses, template, max_lag)
+        for _ in range(REFINE_PASSES):
+            # Skewed devices blur the first template; rebuild it from the
+            # de-lagged rows of the confident matches and correlate again.
+            confident = scores >= min_score
+            if confident.sum() < 2:
+                break
+            template = _shift_rows(responses[confident], lags[confident]).mean(axis=0)
+            template /= np.linalg.norm(template) or 1.0
+            lags, scores = cross_correlation_lags(responses, template, max_lag)
+
+        rows = tensor.rows[has_data]
+        weights = np.where(scores >= min_score, scores, 0.0)
+        fitted = fit_device_clocks(rows["subject"].to_numpy(), rows["event_t"].to_numpy(), lags, weights)
+        for subject, fit in fitted.items():
+            fit["score"] = float(scores[rows["subject"].to_numpy() == subject].mean())
+            offsets[(signal, subject)] = fit
+    return offsets
+
+def offsets_table(offsets):
+    rows = [{"signal": signal, "subject": subject, **fit} for (signal, subject), fit in offsets.items()]
+    return pd.DataFrame(rows)
+
+def main():
+    from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+    from thermo_loaders import data_epoch, load_hr_data_for_subject, load_temp_data, merge_capsules
+
+    temp_data = load_temp_data()
+    epoch = data_epoch(temp_data)
+    temp_frames = merge_capsules(temp_data)
+    hr_frames = {name: load_hr_data_for_subject(name, epoch) for name in temp_frames}
+    experiments = [("Exp1_", EVENTS_EXP1), ("Exp2_", EVENTS_EXP2)]
+    offsets = estimate_offsets(experiments, temp_frames, hr_frames)
+    print(offsets_table(offsets).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
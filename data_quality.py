@@ -0,0 +1,250 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from alignment import WINDOW, event_rows
+from cleaning import FILTERS, clean_temp_data
+from thermo_loaders import (DOWNLOADS_DIR, NAME_MAP_HR_TO_KANJI, data_epoch, find_sessions,
+                            load_hr_data_for_subject, load_temp_data)
+from timebase import clock_to_seconds, from_session_seconds, unwrap_midnight, window_bounds
+
+# --- Configuration ---
+REPORT_JSON = DOWNLOADS_DIR / "data_quality.json"
+REPORT_XLSX = DOWNLOADS_DIR / "data_quality.xlsx"
+GAP_FACTOR = 3              # an interval longer than GAP_FACTOR x the median interval is a gap ...
+MIN_GAP_SECONDS = 5         # ... and at least this long
+CLOCK_JUMP_SECONDS = 300    # backward steps this large are clock jumps, smaller ones out-of-order samples
+MIN_COVERAGE = 0.9          # event windows below this fraction of expected samples are flagged
+
+# One pass over every capsule and HR series of a session. Each series is
+# checked in file order (out-of-order samples, clock jumps) and in time order
+# (interval stats, gaps, duplicates) with plain NumPy diffs, so the cost is
+# linear in the number of samples apart from one sort. Rows the loaders drop
+# (incomplete rows, unparseable times) and samples the cleaning filters
+# remove are counted per series, and every event window gets a coverage row.
+
+def _stats(intervals):
+    if intervals.size == 0:
+        return {"median_interval_s": np.nan, "mean_interval_s": np.nan, "interval_std_s": np.nan,
+                "interval_p05_s": np.nan, "interval_p95_s": np.nan, "off_median_frac": np.nan}
+    median = np.median(intervals)
+    p05, p95 = np.percentile(intervals, [5, 95])
+    return {"median_interval_s": float(median), "mean_interval_s": float(intervals.mean()),
+            "interval_std_s": float(intervals.std()), "interval_p05_s": float(p05), "interval_p95_s": float(p95),
+            "off_median_frac": float(np.mean(intervals != median))}
+
+def series_quality(raw_times, values):
+    # raw_times: int64 session seconds in file order, values alongside.
+    # Returns (summary dict, [(kind, start, end), ...]) where kind is "gap"
+    # or "clock_jump".
+    raw_times = np.asarray(raw_times, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    step = np.diff(raw_times)
+    jumps = step <= -CLOCK_JUMP_SECONDS
+    out_of_order = (step < 0) & ~jumps
+
+    order = np.argsort(raw_times, kind='stable')
+    times, values = raw_times[order], values[order]
+    dt = np.diff(times)
+    same_value = (values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))
+    duplicates = dt == 0
+    intervals = dt[dt > 0]
+
+    median = np.median(intervals) if intervals.size else np.nan
+    gap_limit = max(GAP_FACTOR * median, MIN_GAP_SECONDS) if intervals.size else np.inf
+    is_gap = dt > gap_limit
+    gap_lengths = dt[is_gap]
+
+    summary = {
+        "samples": int(times.size),
+        "nan_values": int(np.isnan(values).sum()),
+        "start_s": int(times[0]) if times.size else None,
+        "end_s": int(times[-1]) if times.size else None,
+        "span_s": int(times[-1] - times[0]) if times.size else 0,
+        **_stats(intervals[intervals <= gap_limit]),
+        "duplicates": int(duplicates.sum()),
+        "duplicate_conflicts": int((duplicates & ~same_value).sum()),
+        "out_of_order": int(out_of_order.sum()),
+        "clock_jumps": int(jumps.sum()),
+        "gaps": int(is_gap.sum()),
+        "gap_total_s": int(gap_lengths.sum()),
+        "longest_gap_s": int(gap_lengths.max()) if gap_lengths.size else 0,
+    }
+    issues = [("gap", int(times[i]), int(times[i + 1])) for i in np.flatnonzero(is_gap)]
+    issues += [("clock_jump", int(raw_times[i]), int(raw_times[i + 1])) for i in np.flatnonzero(jumps)]
+    return summary, issues
+
+def window_coverage(frames, column, rows, median_intervals, window=WINDOW):
+    # Samples, expected samples and the longest hole (window edges included)
+    # of every event window. frames: {subject: DataFrame with SessionSeconds}.
+    n = np.zeros(len(rows), dtype=np.int64)
+    longest = np.full(len(rows), window[1] - window[0], dtype=np.int64)
+    expected = np.full(len(rows), np.nan)
+    for subject, idx in rows.groupby("subject").indices.items():
+        df = frames.get(subject)
+        interval = median_intervals.get(subject)
+        if interval:
+            expected[idx] = (window[1] - window[0]) / interval + 1
+        if df is None or df.empty or column not in df.columns:
+            continue
+        df = df[pd.to_numeric(df[column], errors='coerce').notna()]
+        times = np.sort(df['SessionSeconds'].to_numpy())
+        event_t = rows["event_t"].to_numpy()[idx]
+        starts, stops = window_bounds(times, event_t, window[0], window[1])
+        n[idx] = stops - starts
+        for row, t, start, stop in zip(idx, event_t, starts, stops):
+            if stop > start:
+                edges = np.concatenate([[t + window[0]], times[start:stop], [t + window[1]]])
+                longest[row] = np.diff(edges).max()
+    coverage = np.minimum(n / expected, 1.0)
+    return n, expected, coverage, longest
+
+def _clock(seconds, epoch):
+    if epoch is None:
+        return pd.Series(seconds, dtype=object)
+    seconds = pd.to_numeric(pd.Series(seconds), errors='coerce')
+    out = pd.Series(pd.NaT, index=seconds.index, dtype='datetime64[s]')
+    valid = seconds.notna()
+    out[valid] = from_session_seconds(seconds[valid].astype(np.int64), epoch)
+    return out
+
+def quality_report(directory=DOWNLOADS_DIR, session=None, experiments=None):
+    # {"Series", "Gaps", "Windows"} DataFrames plus "errors" for one session.
+    # experiments: [(prefix, events), ...] as for alignment.event_rows.
+    directory = Path(directory)
+    counts = {}
+    kwargs = {} if session is None else {"session": session}
+    raw_temp = load_temp_data(downloads_dir=directory, counts=counts, **kwargs)
+    epoch = data_epoch(raw_temp)
+    clean_temp, cleaning_report = clean_temp_data(raw_temp)
+    removed = cleaning_report.set_index("key")
+    errors = list(counts.get("errors", []))
+
+    series, issues, frames = [], [], {"temp": dict(clean_temp), "hr": {}}
+    # Capsules: file order is the original row order kept in the index.
+    for name, df in raw_temp:
+        raw = df.sort_index()
+        summary, found = series_quality(raw['SessionSeconds'].to_numpy(), pd.to_numeric(raw['Temp'], errors='coerce'))
+        dropped = counts.get(name, {})
+        series.append({"signal": "temp", "subject": name, "source": "capsule",
+                       "dropped_incomplete": dropped.get("incomplete", 0), "dropped_bad_time": dropped.get("bad_time", 0),
+                       **{f"removed_{f}": int(removed.at[name, f]) if name in removed.index else 0 for f in FILTERS},
+                       **summary})
+        issues += [("temp", name, *issue) for issue in found]
+
+    for path in sorted(directory.glob("心拍数_*.CSV")):
+        name = path.stem.split('_', 1)[1]
+        hr_counts = {}
+        df = load_hr_data_for_subject(name, epoch, downloads_dir=directory, counts=hr_counts)
+        if "error" in hr_counts:
+            errors.append(f"{path.name}: {hr_counts['error']}")
+        if df.empty or 'HR (bpm)' not in df.columns:
+            continue
+        frames["hr"][name] = df
+        raw = df.sort_index()
+        summary, found = series_quality(raw['SessionSeconds'].to_numpy(), pd.to_numeric(raw['HR (bpm)'], errors='coerce'))
+        series.append({"signal": "hr", "subject": name, "source": path.name,
+                       "dropped_bad_time": hr_counts.get("bad_time", 0), **summary})
+        issues += [("hr", name, *issue) for issue in found]
+
+    # Combined HR export (clock times only), one column per subject.
+    combined = directory / "Jisedai2026_HR.csv"
+    if combined.exists():
+        df = pd.read_csv(combined)
+        clock = clock_to_seconds(df['Time'].to_numpy())
+        valid = clock >= 0
+        times = unwrap_midnight(clock[valid])
+        for column in df.columns.drop('Time'):
+            name = NAME_MAP_HR_TO_KANJI.get(column, column)
+            summary, found = series_quality(times, pd.to_numeric(df[column], errors='coerce').to_numpy()[valid])
+            series.append({"signal": "hr_combined", "subject": name, "source": combined.name,
+                           "dropped_bad_time": int((~valid).sum()), **summary})
+            issues += [("hr_combined", name, *issue) for issue in found]
+
+    series = pd.DataFrame(series)
+    gaps = pd.DataFrame(issues, columns=["signal", "subject", "kind", "start_s", "end_s"])
+    gaps["seconds"] = gaps["end_s"] - gaps["start_s"]
+    gaps["start"] = _clock(gaps["start_s"], epoch)
+    gaps["end"] = _clock(gaps["end_s"], epoch)
+
+    windows = pd.DataFrame()
+    if experiments:
+        rows = event_rows(experiments)
+        parts = [rows]
+        for signal, column in (("temp", 'Temp'), ("hr", 'HR (bpm)')):
+            medians = series[series["signal"] == signal].set_index("subject")["median_interval_s"].to_dict() if len(series) else {}
+            n, expected, coverage, longest = window_coverage(frames[signal], column, rows, medians)
+            parts.append(pd.DataFrame({f"{signal}_samples": n, f"{signal}_expected": np.round(expected, 1),
+                                       f"{signal}_coverage": np.round(coverage, 3), f"{signal}_longest_gap_s": longest}))
+        windows = pd.concat(parts, axis=1)
+        raw_frames = dict(raw_temp)
+        raw_n, _, _, _ = window_coverage(raw_frames, 'Temp', rows, {})
+        windows.insert(windows.columns.get_loc("temp_expected"), "temp_removed", raw_n - windows["temp_samples"])
+        windows["flagged"] = (windows["temp_coverage"].fillna(0) < MIN_COVERAGE) | (windows["hr_coverage"].fillna(0) < MIN_COVERAGE)
+
+    return {"Series": series, "Gaps": gaps, "Windows": windows, "errors": errors}
+
+def _records(df):
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False)) if len(df) else []
+
+def write_report(reports, json_path=REPORT_JSON, xlsx_path=REPORT_XLSX):
+    # reports: {session: quality_report(...)}; one JSON and one workbook with
+    # a session column on every sheet.
+    tables = {}
+    for name in ("Series", "Gaps", "Windows"):
+        parts = [r[name].assign(session=session) for session, r in reports.items() if len(r[name])]
+        tables[name] = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if len(tables[name]):
+            tables[name] = tables[name][["session"] + [c for c in tables[name].columns if c != "session"]]
+
+    Path(json_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({"config": {"gap_factor": GAP_FACTOR, "min_gap_seconds": MIN_GAP_SECONDS,
+                              "clock_jump_seconds": CLOCK_JUMP_SECONDS, "min_coverage": MIN_COVERAGE},
+                   "errors": {session: r["errors"] for session, r in reports.items() if r["errors"]},
+                   **{name.lower(): _records(df) for name, df in tables.items()}},
+                  f, ensure_ascii=False, indent=1)
+    with pd.ExcelWriter(xlsx_path) as writer:
+        for name, df in tables.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return tables
+
+def print_summary(tables):
+    series = tables["Series"]
+    if series.empty:
+        print("No series found.")
+        return
+    problems = series[(series["gaps"] > 0) | (series["duplicate_conflicts"] > 0)
+                      | (series["out_of_order"] > 0) | (series["clock_jumps"] > 0)]
+    print(f"{len(series)} series, {int(series['samples'].sum())} samples")
+    if len(problems):
+        print(problems[["session", "signal", "subject", "samples", "median_interval_s", "gaps", "longest_gap_s",
+                        "duplicates", "duplicate_conflicts", "out_of_order", "clock_jumps"]].to_string(index=False))
+    windows = tables["Windows"]
+    if len(windows) and windows["flagged"].any():
+        print(f"Windows below {MIN_COVERAGE:.0%} coverage:")
+        print(windows[windows["flagged"]][["session", "label", "time_str", "temp_coverage", "hr_coverage",
+                                           "temp_longest_gap_s", "hr_longest_gap_s"]].to_string(index=False))
+
+def main():
+    from events import session_events
+    from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+
+    reports = {}
+    for session, directory in find_sessions().items():
+        events = session_events(session, directory, {"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+        if events is None:
+            print(f"Session {session}: no event schedule, skipped")
+            continue
+        experiments = [(f"{exp}_", ev) for exp, ev in events.items()]
+        reports[session] = quality_report(directory, session, experiments)
+        for error in reports[session]["errors"]:
+            print(f"Session {session}: {error}")
+    tables = write_report(reports)
+    print_summary(tables)
+    print(f"Saved {REPORT_JSON} and {REPORT_XLSX}")
+
+if __name__ == "__main__":
+    main()
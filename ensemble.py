@@ -0,0 +1,111 @@
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+N_BOOTSTRAP = 2000
+CI_LEVEL = 0.95
+BOOTSTRAP_CHUNK = 250
+N_WORKERS = os.cpu_count() or 1
+SEED = 0
+SIGNALS = ["hr", "temp"]
+STATS = ["mean", "sd", "sem", "n", "ci_low", "ci_high"]
+
+# Group response across subjects and trials, per second of the aligned grid.
+# Groups are (experiment, suffix), e.g. "Exp1 1回目", "Exp1 2回目", "Exp2".
+# All reductions are NaN-aware so gaps only shrink n for that second.
+
+def group_labels(rows):
+    return [f"{e} {s}" if s else e for e, s in zip(rows["experiment"], rows["suffix"])]
+
+def nan_summary(block):
+    # block: (n_traces, n_seconds)
+    n = np.isfinite(block).sum(axis=0)
+    with np.errstate(all='ignore'):
+        mean = np.nansum(block, axis=0) / n
+        sd = np.sqrt(np.nansum((block - mean) ** 2, axis=0) / (n - 1))
+        sem = sd / np.sqrt(n)
+    mean[n == 0] = np.nan
+    sd[n < 2] = np.nan
+    sem[n < 2] = np.nan
+    return mean, sd, sem, n
+
+def _bootstrap_means(block, n_resamples, seed):
+    # Resample whole traces with replacement; returns (n_resamples, n_seconds).
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, block.shape[0], size=(n_resamples, block.shape[0]))
+    resampled = block[idx]
+    n = np.isfinite(resampled).sum(axis=1)
+    with np.errstate(all='ignore'):
+        means = np.nansum(resampled, axis=1) / n
+    means[n == 0] = np.nan
+    return means
+
+def bootstrap_ci(block, n_boot=N_BOOTSTRAP, level=CI_LEVEL, workers=N_WORKERS, seed=SEED, pool=None):
+    chunks = [min(BOOTSTRAP_CHUNK, n_boot - start) for start in range(0, n_boot, BOOTSTRAP_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    if pool is not None:
+        parts = list(pool.map(_bootstrap_means, [block] * len(chunks), chunks, seeds))
+    elif workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_bootstrap_means, [block] * len(chunks), chunks, seeds))
+    else:
+        parts = [_bootstrap_means(block, n, s) for n, s in zip(chunks, seeds)]
+    means = np.concatenate(parts)
+    alpha = (1.0 - level) / 2
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # seconds with no data in any resample
+        low, high = np.nanpercentile(means, [100 * alpha, 100 * (1 - alpha)], axis=0)
+    return low, high
+
+def ensemble_summary(tensor, n_boot=N_BOOTSTRAP, level=CI_LEVEL, workers=N_WORKERS):
+    # One column per (signal, group, stat), indexed by seconds from start.
+    labels = np.array(group_labels(tensor.rows))
+    columns = {}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for signal in SIGNALS:
+            data = getattr(tensor, signal)
+            for group in dict.fromkeys(labels):
+                block = data[labels == group]
+                block = block[np.isfinite(block).any(axis=1)]
+                if block.size == 0:
+                    continue
+                mean, sd, sem, n = nan_summary(block)
+                low, high = bootstrap_ci(block, n_boot, level, workers, pool=executor)
+                for stat, values in zip(STATS, (mean, sd, sem, n, low, high)):
+                    columns[(signal, group, stat)] = values
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    summary = pd.DataFrame(columns, index=tensor.seconds)
+    summary.columns = pd.MultiIndex.from_tuples(summary.columns, names=["signal", "group", "stat"])
+    summary.index.name = 'Seconds_from_Start'
+    return summary
+
+def phase_means(tensor, phases):
+    # Per-row mean of each signal over each phase, e.g. plot_aligned_grid.PHASES
+    # {"pre": (-300, 0), ...}; ends are exclusive except for "post", as in
+    # calculate_stats.
+    columns = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # phases without data
+        for signal in SIGNALS:
+            data = getattr(tensor, signal)
+            for phase, (start, end) in phases.items():
+                before_end = tensor.seconds <= end if phase == "post" else tensor.seconds < end
+                in_phase = (tensor.seconds >= start) & before_end
+                columns[(signal, phase)] = np.nanmean(data[:, in_phase], axis=1)
+    table = pd.DataFrame(columns, index=pd.Index(tensor.rows["label"], name="label"))
+    table.columns = pd.MultiIndex.from_tuples(table.columns, names=["signal", "phase"])
+    return table
+
+def flat_summary(summary):
+    # Single header row for the Excel sheet: "hr | Exp1 1回目 | mean"
+    flat = summary.copy()
+    flat.columns = [" | ".join(c) for c in summary.columns]
+    return flat
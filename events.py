@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pandas as pd
+
+from thermo_loaders import SESSION
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+# Reviewed schedule; start from onset_detection.py's candidate file, fix it
+# by hand if needed and save it under this name.
+SCHEDULE_FILE = DOWNLOADS_DIR / "event_schedule.csv"
+SCHEDULE_COLUMNS = ["experiment", "time", "subjects", "suffix", "confidence"]
+
+# Schedule files hold one event per row, subjects joined with ";":
+#   experiment,time,subjects,suffix,confidence
+#   Exp1,14:08:12,山口;姜,1回目,0.93
+# and map onto the (TimeStr, [PersonKanji1, PersonKanji2], SuffixLabel)
+# tuples used by EVENTS_EXP1 / EVENTS_EXP2.
+
+def schedule_frame(experiments):
+    # experiments: {"Exp1": EVENTS_EXP1, ...}
+    rows = [{"experiment": exp, "time": time_str, "subjects": ";".join(names), "suffix": suffix,
+             "confidence": float("nan")}
+            for exp, events in experiments.items() for time_str, names, suffix in events]
+    return pd.DataFrame(rows, columns=SCHEDULE_COLUMNS)
+
+def write_schedule(schedule, path=SCHEDULE_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    schedule.to_csv(path, index=False, encoding='utf-8')
+
+def read_schedule(path=SCHEDULE_FILE):
+    # Returns {experiment: [(TimeStr, names, suffix), ...]} in file order.
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8')
+    experiments = {}
+    for row in df.itertuples(index=False):
+        names = [n.strip() for n in row.subjects.split(";") if n.strip()]
+        experiments.setdefault(row.experiment, []).append((row.time.strip(), names, row.suffix.strip()))
+    return experiments
+
+def load_events(default, path=SCHEDULE_FILE):
+    # The reviewed schedule file when present, else the hand-typed events.
+    path = Path(path)
+    if path.exists():
+        print(f"Using event schedule {path}")
+        return read_schedule(path)
+    return default
+
+def session_events(session, directory, default, default_session=SESSION):
+    # A session's reviewed <directory>/event_schedule.csv. The hand-typed
+    # `default` events belong to default_session only; any other session
+    # without a schedule gets None, so callers skip it instead of windowing
+    # its data at another session's times.
+    path = Path(directory) / SCHEDULE_FILE.name
+    if path.exists() or session == default_session:
+        return load_events(default, path)
+    return None
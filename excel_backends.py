@@ -0,0 +1,170 @@
+import datetime
+import json
+import platform
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from openpyxl import Workbook, load_workbook
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # optional; the openpyxl backends are always there
+    CalamineWorkbook = None
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+BACKEND_CHOICE = DOWNLOADS_DIR / "excel_backend.json"
+BACKEND = None              # force a backend by name; None = the benchmarked choice
+FALLBACK = "openpyxl-readonly"
+BENCH_ROWS = 5000           # data rows of the synthetic benchmark workbook
+BENCH_REPEATS = 3
+
+# Reader backends for the capsule workbooks. Every backend returns the rows
+# of the first worksheet as tuples of cell values (None for empty cells),
+# 0-based with exclusive max_row/max_col, padded to the requested columns:
+#   openpyxl            full load, the pd.read_excel default
+#   openpyxl-readonly   streamed rows (read_only=True)
+#   calamine            python-calamine (Rust), when installed
+# The first read on a machine times every available backend on a synthetic
+# capsule workbook, drops any whose cells differ from openpyxl's, and keeps
+# the fastest; the choice is stored in BACKEND_CHOICE per machine and set of
+# installed backends, so installing calamine triggers a new benchmark. A
+# backend that fails to open a file falls back to FALLBACK.
+
+_lock = threading.Lock()
+_selected = None
+
+def _openpyxl_rows(path, min_row, max_row, min_col, max_col, read_only):
+    workbook = load_workbook(path, read_only=read_only, data_only=True)
+    sheet = workbook.worksheets[0]
+    if read_only:
+        # Some exports write a wrong <dimension> record, so it is recomputed
+        # from the rows (as pandas does).
+        sheet.reset_dimensions()
+
+    def rows():
+        try:
+            yield from sheet.iter_rows(min_row=min_row + 1, max_row=max_row, min_col=min_col + 1,
+                                       max_col=max_col, values_only=True)
+        finally:
+            workbook.close()
+    return rows()
+
+def _calamine_rows(path, min_row, max_row, min_col, max_col):
+    # The whole sheet is parsed up front (in Rust); empty cells come back as "".
+    sheet = CalamineWorkbook.from_path(str(path)).get_sheet_by_index(0)
+    rows = sheet.to_python(skip_empty_area=False, nrows=max_row)[min_row:max_row]
+    width = None if max_col is None else max_col - min_col
+    out = []
+    for row in rows:
+        cells = tuple(None if v == "" else v for v in row[min_col:max_col])
+        if width is not None and len(cells) < width:
+            cells += (None,) * (width - len(cells))
+        out.append(cells)
+    return iter(out)
+
+BACKENDS = {
+    "openpyxl": lambda *args: _openpyxl_rows(*args, read_only=False),
+    "openpyxl-readonly": lambda *args: _openpyxl_rows(*args, read_only=True),
+    "calamine": _calamine_rows,
+}
+
+def available_backends():
+    return [name for name in BACKENDS if name != "calamine" or CalamineWorkbook is not None]
+
+def _machine_key():
+    return f"{platform.node()}|{platform.machine()}|py{platform.python_version()}|{','.join(available_backends())}"
+
+def _write_sample(path, rows=BENCH_ROWS):
+    # Two capsule groups laid out like the logger export.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for r in range(6):
+        sheet.append([f"meta{r}"])
+    sheet.append(["Capsule n-1", None, None, None, None, "Capsule n-2"])
+    sheet.append(["Sample", "Date", "Hour", "Temperature", None] * 2)
+    for k in range(rows):
+        s = 13 * 3600 + k
+        cells = [k + 1, datetime.datetime(2026, 1, 17), datetime.time(s // 3600, (s // 60) % 60, s % 60),
+                 37.0 + (k % 100) / 100, None]
+        sheet.append(cells + cells)
+    workbook.save(path)
+
+def _same_cells(a, b):
+    return len(a) == len(b) and all(len(x) == len(y) and all(u == v for u, v in zip(x, y)) for x, y in zip(a, b))
+
+def benchmark_backends(repeats=BENCH_REPEATS):
+    # {name: best ms or None if it failed or its cells differ}, on a
+    # synthetic workbook read from the data rows, capsule columns only.
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "sample.xlsx"
+        _write_sample(path)
+        reference = list(BACKENDS["openpyxl"](path, 8, None, 1, 9))
+        for name in available_backends():
+            try:
+                times = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    rows = list(BACKENDS[name](path, 8, None, 1, 9))
+                    times.append((time.perf_counter() - start) * 1000)
+                results[name] = min(times) if _same_cells(rows, reference) else None
+            except Exception as e:
+                print(f"Excel backend {name} failed in the benchmark: {e}")
+                results[name] = None
+    return results
+
+def _read_choices(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def select_backend(choice_path=BACKEND_CHOICE, rebenchmark=False):
+    # BACKEND when set, else the stored choice for this machine, else the
+    # winner of a fresh benchmark (stored for next time).
+    global _selected
+    with _lock:
+        if BACKEND is not None:
+            return BACKEND
+        if _selected is not None and not rebenchmark:
+            return _selected
+        key = _machine_key()
+        choices = {} if choice_path is None else _read_choices(choice_path)
+        entry = choices.get(key)
+        if entry is None or rebenchmark or entry.get("backend") not in available_backends():
+            timings = benchmark_backends()
+            usable = {name: ms for name, ms in timings.items() if ms is not None}
+            backend = min(usable, key=usable.get) if usable else FALLBACK
+            entry = {"backend": backend, "timings_ms": timings}
+            if choice_path is not None:
+                choices[key] = entry
+                Path(choice_path).parent.mkdir(parents=True, exist_ok=True)
+                with open(choice_path, 'w', encoding='utf-8') as f:
+                    json.dump(choices, f, indent=1)
+        _selected = entry["backend"]
+        return _selected
+
+def read_rows(path, min_row=0, max_row=None, min_col=0, max_col=None, backend=None):
+    # Iterator over the rows of the first worksheet (see above).
+    name = backend or select_backend()
+    try:
+        return BACKENDS[name](path, min_row, max_row, min_col, max_col)
+    except Exception as e:
+        if name == FALLBACK:
+            raise
+        print(f"Excel backend {name} could not read {Path(path).name} ({e}); using {FALLBACK}")
+        return BACKENDS[FALLBACK](path, min_row, max_row, min_col, max_col)
+
+def main():
+    backend = select_backend(rebenchmark=True)
+    entry = _read_choices(BACKEND_CHOICE).get(_machine_key(), {})
+    for name, ms in entry.get("timings_ms", {}).items():
+        print(f"{name:18s} {'differs/failed' if ms is None else f'{ms:8.1f} ms'}")
+    print(f"Using {backend} (stored in {BACKEND_CHOICE})")
+
+if __name__ == "__main__":
+    main()
@@ -2,227 +2,195 @@ import pandas as pd
 import glob
 import os
 import re
-from datetime import datetime, timedelta
 import numpy as np
 from pathlib import Path
+from openpyxl.chart import LineChart, Reference
+from openpyxl.chart.series import SeriesLabel
+
+from alignment import load_session_tensor
+from ensemble import ensemble_summary, flat_summary
+from events import load_events
+from strain_index import strain_indices
+from timebase import block_means
 
 # --- Configuration ---
 # 実行ディレクトリからの相対パス
 DOWNLOADS_DIR = Path("Downloads")
+# Estimate per-device clock offsets from the event responses and correct
+# them during alignment (see clock_offset.py).
+CORRECT_CLOCK_OFFSETS = False
+# Capsule sync markers {subject: [(capsule_t, true_t), ...]} in session
+# seconds; each logger's clock is corrected from its markers
+SYNC_MARKERS = {}
+# Add an 'Ensemble Summary' sheet (mean/SD/SEM/bootstrap CI per group)
+WRITE_ENSEMBLE_SHEET = True
+# Strain indices (strain_index.INDICES) written as extra sheets, same layout as 'Heart Rate'
+STRAIN_SHEETS = ["PSI"]
+# Stream capsules and HR one subject at a time (alignment.stream_session_tensor);
+# peak memory is one subject's samples instead of the session
+LOW_MEMORY = False
+# Aligned window and grid step in seconds; the base sheets use this grid
+WINDOW = (-300, 420)
+GRID_STEP = 1
+# Block-mean resolutions in seconds (multiples of GRID_STEP), one extra sheet
+# per signal and resolution, e.g. 'Heart Rate 30s'; blocks start at 0:00
+RESOLUTIONS = [5, 30, 60]
+# Native Excel line charts on one 'Charts <experiment>' sheet per experiment:
+# HR and temperature overlays of every trial, then one HR + temperature
+# chart per subject/event. They reference the signal sheets, so nothing is
+# rasterized; CHART_RESOLUTION picks the sheets (None = the base grid, or
+# one of RESOLUTIONS for lighter charts).
+WRITE_CHARTS = True
+CHART_RESOLUTION = None
+CHART_SIZE = (16, 7.5)      # cm
 # ... (events, name_map etc follow) ...
 
 # ... (EVENTS_EXP1, EVENTS_EXP2, NAME_MAP_KANJI_TO_HR definitions) ...
 
-def parse_time_to_dummy_datetime(time_str):
-    return datetime.strptime(time_str, "%H:%M:%S")
-
-def combine_datetime_excel(row):
-    try:
-        t = row['Time']
-        if pd.isna(t): return pd.NaT
-        if isinstance(t, str):
-            t_obj = datetime.strptime(t, '%H:%M:%S').time()
-        elif isinstance(t, datetime):
-            t_obj = t.time()
-        elif hasattr(t, 'hour'):
-             t_obj = t
-        else:
-             return pd.NaT
-        return datetime(1900, 1, 1, t_obj.hour, t_obj.minute, t_obj.second)
-    except:
-        return pd.NaT
-
-def load_hr_data_for_subject(kanji_name):
-    filename = f"心拍数_{kanji_name}.CSV"
-    path = DOWNLOADS_DIR / filename
-    if not path.exists():
-        return pd.DataFrame()
-    
-    try:
-        with open(path, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-            if len(lines) < 4: return pd.DataFrame()
-            
-            meta_header = lines[0].strip().split(',')
-            meta_values = lines[1].strip().split(',')
-            
-            try:
-                date_idx = meta_header.index('Date')
-                start_time_idx = meta_header.index('Start time')
-                date_str = meta_values[date_idx]
-                start_time_str = meta_values[start_time_idx]
-                start_dt = datetime.strptime(f"{date_str} {start_time_str}", "%d-%m-%Y %H:%M:%S")
-                base_dt = datetime(1900, 1, 1, start_dt.hour, start_dt.minute, start_dt.second)
-            except ValueError:
-                return pd.DataFrame()
-
-        df = pd.read_csv(path, header=2)
-        df['DurationDelta'] = pd.to_timedelta(df['Time'])
-        df['Datetime'] = base_dt + df['DurationDelta']
-        return df
-    except Exception as e:
-        print(f"Error loading {filename}: {e}")
-        return pd.DataFrame()
-
-def load_temp_data():
-    files = list(DOWNLOADS_DIR.glob("260117_no*.xlsx")) + list(DOWNLOADS_DIR.glob("260117_No*.xlsx"))
-    files = list(set(files))
-    
-    name_mapping = {
-        1: {2: "板井", 3: "姜"},
-        2: {2: "北田", 3: "伊藤"},
-        3: {1: "山本", 3: "高見澤"},
-        5: {1: "山口", 2: "藤井"}
-    }
-    
-    all_data = [] 
-    for file_path in files:
-        filename = file_path.name
-        try:
-            df = pd.read_excel(file_path, header=None)
-            file_no_match = re.search(r'no(\d+)', filename.lower())
-            if not file_no_match: continue
-            file_no = int(file_no_match.group(1))
-
-            capsule_row = df.iloc[6]
-            capsule_indices = []
-            for col_idx, val in capsule_row.items():
-                if isinstance(val, str) and "Capsule" in val:
-                    match = re.search(r'n[^\d]*(\d+)', val) 
-                    if match:
-                        cap_id = int(match.group(1))
-                        capsule_indices.append((col_idx, cap_id))
-            
-            data_start_idx = 8
-            for col_idx, cap_id in capsule_indices:
-                temp_idx = col_idx + 3
-                date_idx = col_idx + 1
-                time_idx = col_idx + 2
-                if temp_idx >= len(df.columns): continue
-
-                data_block = df.iloc[data_start_idx:, [date_idx, time_idx, temp_idx]].copy()
-                data_block.columns = ['Date', 'Time', 'Temp']
-                data_block = data_block.dropna(subset=['Time', 'Temp'])
-                data_block['Datetime'] = data_block.apply(combine_datetime_excel, axis=1)
-                data_block = data_block.dropna(subset=['Datetime'])
-                data_block['Temp'] = pd.to_numeric(data_block['Temp'], errors='coerce')
-                
-                name = name_mapping.get(file_no, {}).get(cap_id, None)
-                if name:
-                    all_data.append((name, data_block))
-        except Exception:
-            pass
-    return all_data
-
-def process_experiment_data(events, combined_hr_df, combined_temp_df, prefix=""):
-    target_seconds = np.arange(-300, 421, 1)
-    
-    for start_time_str, names, suffix in events:
-        start_dt = parse_time_to_dummy_datetime(start_time_str)
-        
-        for name in names:
-            col_label = f"{prefix}{name}_{suffix}" if suffix else f"{prefix}{name}"
-            
-            hr_series = pd.Series(index=target_seconds, dtype=float)
-            hr_source_df = load_hr_data_for_subject(name)
-            
-            if not hr_source_df.empty and 'HR (bpm)' in hr_source_df.columns:
-                hr_source_df['RelSeconds'] = (hr_source_df['Datetime'] - start_dt).dt.total_seconds()
-                mask = (hr_source_df['RelSeconds'] >= -310) & (hr_source_df['RelSeconds'] <= 430)
-                subset = hr_source_df.loc[mask].copy()
-                
-                if not subset.empty:
-                    subset = subset.set_index('RelSeconds')
-                    subset = subset[~subset.index.duplicated(keep='first')]
-                    reindexed = subset['HR (bpm)'].reindex(target_seconds, method='nearest', tolerance=2.0)
-                    hr_series = reindexed
-            
-            combined_hr_df[col_label] = hr_series
-            pass 
-
-    return
+def format_seconds(x):
+    sign = "-" if x < 0 else ""
+    abs_x = int(abs(x))
+    m, s = divmod(abs_x, 60)
+    return f"{sign}{m}:{s:02d}"
+
+def resolution_label(width):
+    return f"{width // 60}min" if width % 60 == 0 else f"{width}s"
+
+def _signal_sheet(seconds, values, labels, keep):
+    df = pd.DataFrame({label: values[i] for i, label in enumerate(labels) if keep[i]}, index=seconds)
+    df.index = df.index.map(format_seconds)
+    df.index.name = 'Time'
+    return df
+
+def export_sheets(tensor, strain_sheets=STRAIN_SHEETS, write_ensemble=WRITE_ENSEMBLE_SHEET, summary=None,
+                  resolutions=RESOLUTIONS):
+    # {sheet name: DataFrame} in workbook order, indexed by m:ss from start.
+    # summary: a precomputed ensemble_summary(tensor) to reuse.
+    # resolutions: block means of every signal sheet (timebase.block_means),
+    # computed from the aligned grid without re-aligning.
+    labels = tensor.rows["label"]
+    signals = {'Core Temp': (tensor.temp, tensor.temp_samples > 0),
+               'Heart Rate': (tensor.hr, tensor.hr_samples > 0)}
+    indices = strain_indices(tensor) if strain_sheets else {}
+    for name in strain_sheets:
+        has_both = (tensor.hr_samples > 0) & (tensor.temp_samples > 0)
+        signals[name.replace('%', 'pct')] = (np.asarray(indices[name]), has_both)
+
+    sheets = {name: _signal_sheet(tensor.seconds, values, labels, keep) for name, (values, keep) in signals.items()}
+
+    if write_ensemble:
+        df_ensemble = flat_summary(ensemble_summary(tensor) if summary is None else summary)
+        df_ensemble.index = df_ensemble.index.map(format_seconds)
+        df_ensemble.index.name = 'Time'
+        sheets['Ensemble Summary'] = df_ensemble
+
+    step = int(tensor.seconds[1] - tensor.seconds[0]) if len(tensor.seconds) > 1 else 1
+    for width in resolutions:
+        if width % step:
+            raise ValueError(f"resolution {width}s is not a multiple of the {step}s grid")
+        for name, (values, keep) in signals.items():
+            starts, means = block_means(tensor.seconds, values, width)
+            sheets[f"{name} {resolution_label(width)}"] = _signal_sheet(starts, means, labels, keep)
+    return sheets
+
+def chart_groups(tensor):
+    # {experiment: [labels]} in tensor row order
+    groups = {}
+    for experiment, label in zip(tensor.rows["experiment"], tensor.rows["label"]):
+        groups.setdefault(experiment, []).append(label)
+    return groups
+
+def _y_scale(axis, df, labels, pad):
+    values = df[[l for l in labels if l in df.columns]].to_numpy(dtype=float)
+    if np.isfinite(values).any():
+        axis.scaling.min = float(np.floor((np.nanmin(values) - pad) / pad) * pad)
+        axis.scaling.max = float(np.ceil((np.nanmax(values) + pad) / pad) * pad)
+
+def _line_chart(title, y_title, n_points, step):
+    chart = LineChart()
+    chart.title = title
+    chart.y_axis.title = y_title
+    chart.x_axis.title = "Time from start (m:ss)"
+    chart.width, chart.height = CHART_SIZE
+    # One tick label per minute; axes are hidden by default since openpyxl 3.1
+    chart.x_axis.tickLblSkip = chart.x_axis.tickMarkSkip = max(1, min(60 // step, n_points))
+    chart.x_axis.delete = chart.y_axis.delete = False
+    return chart
+
+def _add_line(chart, ws, col, n_points, name=None):
+    chart.add_data(Reference(ws, min_col=col, min_row=1, max_row=n_points + 1), titles_from_data=True)
+    series = chart.series[-1]
+    series.smooth = False
+    series.marker.symbol = "none"
+    if name is not None:
+        series.tx = SeriesLabel(v=name)
+
+def add_charts(book, sheets, groups, resolution=CHART_RESOLUTION):
+    # groups: chart_groups(tensor). Charts go on new sheets of `book` (the
+    # openpyxl workbook being written) and reference 'Core Temp' and
+    # 'Heart Rate' (or their `resolution` sheets) by cell range.
+    suffix = "" if resolution is None else f" {resolution_label(resolution)}"
+    hr_name, temp_name = f"Heart Rate{suffix}", f"Core Temp{suffix}"
+    hr_df, temp_df = sheets[hr_name], sheets[temp_name]
+    ws_hr, ws_temp = book[hr_name], book[temp_name]
+    hr_cols = {label: i + 2 for i, label in enumerate(hr_df.columns)}
+    temp_cols = {label: i + 2 for i, label in enumerate(temp_df.columns)}
+    n_points = len(temp_df)
+    step = GRID_STEP if resolution is None else resolution
+    categories = Reference(ws_temp, min_col=1, min_row=2, max_row=n_points + 1)
+
+    for experiment, labels in groups.items():
+        ws = book.create_sheet(f"Charts {experiment}"[:31])
+        overlays = [(_line_chart(f"{experiment} - Heart Rate", "HR (bpm)", n_points, step), ws_hr, hr_cols, hr_df, 10),
+                    (_line_chart(f"{experiment} - Core Temp", "Temp (°C)", n_points, step), ws_temp, temp_cols, temp_df, 0.1)]
+        for (chart, sheet, cols, df, pad), anchor in zip(overlays, ("A1", "L1")):
+            for label in labels:
+                if label in cols:
+                    _add_line(chart, sheet, cols[label], n_points)
+            if chart.series:
+                chart.set_categories(categories)
+                chart.legend.position = 'r'
+                _y_scale(chart.y_axis, df, labels, pad)
+                ws.add_chart(chart, anchor)
+
+        for i, label in enumerate(l for l in labels if l in hr_cols or l in temp_cols):
+            chart = _line_chart(label, "HR (bpm)", n_points, step)
+            if label in hr_cols:
+                _add_line(chart, ws_hr, hr_cols[label], n_points, "HR (bpm)")
+                _y_scale(chart.y_axis, hr_df, [label], 10)
+            chart.set_categories(categories)
+            if label in temp_cols:
+                temp_chart = LineChart()
+                _add_line(temp_chart, ws_temp, temp_cols[label], n_points, "Temp (°C)")
+                temp_chart.y_axis.axId = 200
+                temp_chart.y_axis.title = "Temp (°C)"
+                temp_chart.y_axis.crosses = "max"
+                temp_chart.y_axis.delete = False
+                _y_scale(temp_chart.y_axis, temp_df, [label], 0.1)
+                chart += temp_chart
+            chart.legend.position = 'b'
+            ws.add_chart(chart, f"{('A', 'L')[i % 2]}{17 + 16 * (i // 2)}")
+
+def write_workbook(sheets, out_path, groups=None):
+    # groups: chart_groups(tensor) to add native charts (add_charts).
+    engine = "openpyxl" if groups else None
+    with pd.ExcelWriter(out_path, engine=engine) as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name)
+        if groups:
+            add_charts(writer.book, sheets, groups)
+    return out_path
 
 def main():
-    target_index = np.arange(-300, 421, 1)
-    
-    df_export_hr = pd.DataFrame(index=target_index)
-    df_export_hr.index.name = 'Seconds_from_Start'
-    
-    df_export_temp = pd.DataFrame(index=target_index)
-    df_export_temp.index.name = 'Seconds_from_Start'
-    
-    all_temp_data = load_temp_data()
-    temp_dict = {}
-    for name, df in all_temp_data:
-        temp_dict[name] = df
-
-    for start_time_str, names, suffix in EVENTS_EXP1:
-        start_dt = parse_time_to_dummy_datetime(start_time_str)
-        for name in names:
-            col_label = f"Exp1_{name}_{suffix}"
-            
-            hr_source = load_hr_data_for_subject(name)
-            if not hr_source.empty:
-                hr_source['RelSeconds'] = (hr_source['Datetime'] - start_dt).dt.total_seconds()
-                subset = hr_source[(hr_source['RelSeconds'] >= -300) & (hr_source['RelSeconds'] <= 420)]
-                if not subset.empty:
-                    subset = subset.set_index('RelSeconds')
-                    subset = subset[~subset.index.duplicated()]
-                    series = subset['HR (bpm)'].reindex(df_export_hr.index, method='nearest', tolerance=1.5)
-                    df_export_hr[col_label] = series
-            
-            if name in temp_dict:
-                temp_source = temp_dict[name].copy()
-                temp_source['RelSeconds'] = (temp_source['Datetime'] - start_dt).dt.total_seconds()
-                subset = temp_source[(temp_source['RelSeconds'] >= -300) & (temp_source['RelSeconds'] <= 420)]
-                if not subset.empty:
-                    subset = subset.set_index('RelSeconds')
-                    subset = subset[~subset.index.duplicated()]
-                    series = np.interp(df_export_temp.index, subset.index, subset['Temp'], left=np.nan, right=np.nan)
-                    df_export_temp[col_label] = series
-
-    for start_time_str, names, suffix in EVENTS_EXP2:
-        start_dt = parse_time_to_dummy_datetime(start_time_str)
-        for name in names:
-            col_label = f"Exp2_{name}"
-            
-            hr_source = load_hr_data_for_subject(name)
-            if not hr_source.empty:
-                hr_source['RelSeconds'] = (hr_source['Datetime'] - start_dt).dt.total_seconds()
-                subset = hr_source[(hr_source['RelSeconds'] >= -300) & (hr_source['RelSeconds'] <= 420)]
-                if not subset.empty:
-                    subset = subset.set_index('RelSeconds')
-                    subset = subset[~subset.index.duplicated()]
-                    series = subset['HR (bpm)'].reindex(df_export_hr.index, method='nearest', tolerance=1.5)
-                    df_export_hr[col_label] = series
-
-            if name in temp_dict:
-                temp_source = temp_dict[name].copy()
-                temp_source['RelSeconds'] = (temp_source['Datetime'] - start_dt).dt.total_seconds()
-                subset = temp_source[(temp_source['RelSeconds'] >= -300) & (temp_source['RelSeconds'] <= 420)]
-                if not subset.empty:
-                    subset = subset.set_index('RelSeconds')
-                    subset = subset[~subset.index.duplicated()]
-                    series = np.interp(df_export_temp.index, subset.index, subset['Temp'], left=np.nan, right=np.nan)
-                    df_export_temp[col_label] = series
-
-    def format_seconds(x):
-        sign = "-" if x < 0 else ""
-        abs_x = int(abs(x))
-        m, s = divmod(abs_x, 60)
-        return f"{sign}{m}:{s:02d}"
-
-    df_export_hr.index = df_export_hr.index.map(format_seconds)
-    df_export_temp.index = df_export_temp.index.map(format_seconds)
-    
-    df_export_hr.index.name = 'Time'
-    df_export_temp.index.name = 'Time'
+    target_index = np.arange(WINDOW[0], WINDOW[1] + 1, GRID_STEP)
+    events = load_events({"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+    experiments = [("Exp1_", events["Exp1"]), ("Exp2_", events["Exp2"])]
+    tensor = load_session_tensor(experiments, correct_offsets=CORRECT_CLOCK_OFFSETS, seconds=target_index,
+                                 low_memory=LOW_MEMORY, markers=SYNC_MARKERS)
 
     out_path = DOWNLOADS_DIR / "Experiment_Data_Aligned.xlsx"
     DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
-    with pd.ExcelWriter(out_path) as writer:
-        df_export_temp.to_excel(writer, sheet_name='Core Temp')
-        df_export_hr.to_excel(writer, sheet_name='Heart Rate')
+    write_workbook(export_sheets(tensor), out_path, chart_groups(tensor) if WRITE_CHARTS else None)
     
     print(f"Saved {out_path}")
 
@@ -0,0 +1,120 @@
+import base64
+import json
+import zlib
+from pathlib import Path
+
+import numpy as np
+from matplotlib.colors import to_hex
+
+from alignment import load_session_tensor
+from events import load_events
+from plot_aligned_experiment import COLOR_MAP, EVENTS_EXP1, EVENTS_EXP2
+from plot_aligned_grid import PHASES
+from signal_pyramid import GAP_SECONDS, POINTS_PER_PIXEL, open_signal_pyramid
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+OUTPUT_FILE = DOWNLOADS_DIR / "Session_Viewer.html"
+TEMPLATE_FILE = Path(__file__).with_name("viewer_template.html")
+TITLE = "260117 Session Viewer"
+# Session overview levels embedded from the signal pyramid (seconds per bin);
+# the 1 s level is left out to keep the file small, event windows are 1 s.
+SESSION_LEVELS = [10, 60, 600]
+COMPRESSION_LEVEL = 9
+PANELS = [
+    {"id": "hr", "events": "hr", "session": "hr", "label": "Heart Rate (bpm)", "short": "HR", "digits": 1},
+    {"id": "temp", "events": "temp", "session": "temp_clean", "label": "Core Temp (°C)", "short": "Temp", "digits": 2},
+]
+SUFFIX_DASH = {"2回目": [6, 3]}
+
+# One offline HTML file: the aligned event windows (1 s grid, every row of
+# the aligned tensor) and the session overview at a few pyramid levels are
+# packed as float32/int32 arrays into a single zlib stream, base64-encoded
+# into the page and decoded by the browser with DecompressionStream. The
+# viewer (viewer_template.html) plots them on canvases with subject/event
+# selection, wheel zoom and drag pan, and the phase means of the grid plots.
+
+def pack_arrays(arrays):
+    # arrays: {name: ndarray} -> (bytes, manifest); every array is 4-byte
+    # aligned so the browser can view the buffer without copying.
+    chunks, manifest, offset = [], [], 0
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.integer):
+            data, dtype = values.astype('<i4'), "i4"
+        else:
+            data, dtype = values.astype('<f4'), "f4"
+        chunks.append(data.tobytes())
+        manifest.append({"name": name, "dtype": dtype, "offset": offset, "length": int(data.size)})
+        offset += data.nbytes
+    return b"".join(chunks), manifest
+
+def event_payload(tensor):
+    rows = [{"experiment": r.experiment, "subject": r.subject, "suffix": r.suffix, "time": r.time_str,
+             "label": r.label} for r in tensor.rows.itertuples(index=False)]
+    seconds = tensor.seconds
+    meta = {"start": int(seconds[0]), "step": int(seconds[1] - seconds[0]) if seconds.size > 1 else 1,
+            "n": int(seconds.size), "rows": rows}
+    return meta, {"events/hr": tensor.hr.ravel(), "events/temp": tensor.temp.ravel()}
+
+def session_payload(pyramid, levels=SESSION_LEVELS):
+    arrays = {}
+    signals = sorted({p["session"] for p in PANELS} & set(pyramid.signals()))
+    keys = sorted({key for signal in signals for key in pyramid.keys(signal)})
+    for signal in signals:
+        for level in levels:
+            for key in pyramid.keys(signal):
+                piece = pyramid.query(signal, key, -2 ** 31, 2 ** 31 - 1, level=level)
+                base = f"session/{signal}/{level}/{key}/"
+                arrays[base + "t"] = piece.t
+                arrays[base + "min"] = piece.min
+                arrays[base + "max"] = piece.max
+                arrays[base + "mean"] = piece.mean
+    extents = [pyramid.extent(signal) for signal in signals]
+    extents = [e for e in extents if e is not None]
+    extent = [min(e[0] for e in extents), max(e[1] for e in extents)] if extents else [0, 1]
+    meta = {"levels": list(levels), "keys": keys, "extent": extent,
+            "points_per_pixel": POINTS_PER_PIXEL, "gap_seconds": GAP_SECONDS}
+    return meta, arrays
+
+def write_html_viewer(tensor, pyramid=None, out_path=OUTPUT_FILE, title=TITLE):
+    event_meta, arrays = event_payload(tensor)
+    session_meta = {"levels": [], "keys": [], "extent": [0, 1], "points_per_pixel": POINTS_PER_PIXEL,
+                    "gap_seconds": GAP_SECONDS}
+    if pyramid is not None:
+        session_meta, session_arrays = session_payload(pyramid)
+        arrays.update(session_arrays)
+
+    blob, manifest = pack_arrays(arrays)
+    payload = base64.b64encode(zlib.compress(blob, COMPRESSION_LEVEL)).decode('ascii')
+    subjects = list(dict.fromkeys(list(tensor.rows["subject"]) + session_meta["keys"]))
+    meta = {
+        "arrays": manifest,
+        "events": event_meta,
+        "session": session_meta,
+        "panels": PANELS,
+        "phases": {name: list(bounds) for name, bounds in PHASES.items()},
+        "subjects": subjects,
+        "colors": {name: to_hex(COLOR_MAP.get(name, 'black')) for name in subjects},
+        "suffix_dash": SUFFIX_DASH,
+    }
+
+    html = TEMPLATE_FILE.read_text(encoding='utf-8')
+    html = html.replace("__TITLE__", title)
+    html = html.replace("/*__META__*/null", json.dumps(meta, ensure_ascii=False).replace("</", "<\\/"), 1)
+    html = html.replace("__PAYLOAD__", payload, 1)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(html, encoding='utf-8')
+    print(f"Saved {out_path} ({len(blob) / 1e6:.1f} MB raw, {out_path.stat().st_size / 1e6:.1f} MB file)")
+    return out_path
+
+def main():
+    events = load_events({"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+    experiments = [("Exp1_", events["Exp1"]), ("Exp2_", events["Exp2"])]
+    tensor = load_session_tensor(experiments, clean=True)
+    write_html_viewer(tensor, open_signal_pyramid())
+
+if __name__ == "__main__":
+    main()
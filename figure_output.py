@@ -0,0 +1,150 @@
+import io
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from render_core import figure_bytes, output_options, output_path, set_figure_writer
+
+# --- Configuration ---
+ENCODE_WORKERS = 2
+QUEUE_SIZE = 4      # rendered figures waiting for a worker; save_figure blocks beyond this
+PRINT_REPORT = True
+
+# Write-behind output stage. save_figure() rasterizes the figure on the
+# calling thread (Agg draw), copies the RGBA buffer and queues it; worker
+# threads PNG-encode (Pillow releases the GIL while compressing) and write
+# the file, so the next figure is built while the last one is encoded. The
+# bounded queue caps memory at QUEUE_SIZE raw frames. Vector formats (svg,
+# pdf) cannot be split that way: they are serialized on the calling thread
+# and only the disk write is deferred.
+#
+#   with write_behind():
+#       main()
+
+class FigureWriter:
+
+    def __init__(self, workers=ENCODE_WORKERS, queue_size=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._records = []
+        self._errors = []
+        self.blocked_ms = 0.0   # time save_figure waited on a full queue
+        self._threads = [threading.Thread(target=self._work, name=f"figure-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fig, out_path, output_class=None, dpi=None):
+        options = output_options(output_class, dpi)
+        out_path = output_path(out_path, options)
+        start = time.perf_counter()
+        if options["format"] == "png":
+            original_dpi = fig.dpi
+            if options["dpi"] is not None:
+                fig.set_dpi(options["dpi"])
+            fig.canvas.draw()
+            payload = np.array(fig.canvas.buffer_rgba())    # copy; the figure is released next
+            options["dpi"] = fig.dpi
+            fig.set_dpi(original_dpi)
+        else:
+            payload = figure_bytes(fig, options["format"], options["dpi"])
+        render_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        self._queue.put((payload, out_path, output_class, options, render_ms))
+        with self._lock:
+            self.blocked_ms += (time.perf_counter() - start) * 1000
+        return out_path
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            payload, out_path, output_class, options, render_ms = item
+            try:
+                start = time.perf_counter()
+                if isinstance(payload, np.ndarray):
+                    info = PngInfo()
+                    info.add_text("Software", f"Matplotlib version{matplotlib.__version__}, https://matplotlib.org/")
+                    buffer = io.BytesIO()
+                    Image.fromarray(payload, "RGBA").save(buffer, format="png", pnginfo=info,
+                                                          compress_level=options["compress_level"],
+                                                          dpi=(options["dpi"], options["dpi"]))
+                    data = buffer.getvalue()
+                else:
+                    data = payload
+                encode_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                out_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = out_path.with_name(out_path.name + ".tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, out_path)
+                write_ms = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    self._records.append({"path": str(out_path), "class": output_class or "", "format": options["format"],
+                                          "dpi": options["dpi"], "render_ms": render_ms, "encode_ms": encode_ms,
+                                          "write_ms": write_ms, "bytes": len(data)})
+            except Exception as e:
+                with self._lock:
+                    self._errors.append((out_path, e))
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            path, error = errors[0]
+            raise RuntimeError(f"{len(errors)} figure(s) failed to write, first {path}: {error}") from error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+    def report(self):
+        # One row per written figure: render (calling thread), encode and
+        # write (worker) times in ms, and the file size.
+        with self._lock:
+            return pd.DataFrame(self._records, columns=["path", "class", "format", "dpi", "render_ms",
+                                                        "encode_ms", "write_ms", "bytes"])
+
+def print_report(report, blocked_ms=0.0):
+    if report.empty:
+        return
+    table = report.assign(file=report["path"].map(lambda p: Path(p).name), kb=(report["bytes"] / 1024).round(1))
+    print(table[["file", "class", "dpi", "render_ms", "encode_ms", "write_ms", "kb"]].round(1).to_string(index=False))
+    print(f"{len(report)} figures: render {report['render_ms'].sum():.0f} ms on the main thread, "
+          f"encode {report['encode_ms'].sum():.0f} ms + write {report['write_ms'].sum():.0f} ms in the background, "
+          f"blocked {blocked_ms:.0f} ms on a full queue")
+
+@contextmanager
+def write_behind(workers=ENCODE_WORKERS, queue_size=QUEUE_SIZE, report=PRINT_REPORT):
+    # Every save_figure() inside the block goes through one FigureWriter;
+    # leaving the block waits for the queue to drain.
+    writer = FigureWriter(workers, queue_size)
+    previous = set_figure_writer(writer)
+    try:
+        yield writer
+    finally:
+        set_figure_writer(previous)
+        writer.close()
+        if report:
+            print_report(writer.report(), writer.blocked_ms)
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+HR_RECOVERY = (120, 420)    # seconds from event start: after the 2-min bout
+TEMP_RISE = (0, 420)
+MIN_POINTS = 30             # finite samples needed to fit a window
+TAU_RANGE = (5.0, 3600.0)   # s, bounds of the time constants
+N_TAU_START = 24            # starting time constants tried per window
+MAX_ITER = 100
+TOL = 1e-10                 # relative SSE decrease that counts as converged
+
+# Per-window kinetics, every (subject, trial) row of an AlignedTensor at
+# once. Both exponential models are
+#     y = base + amp * exp(-(t - t0) / tau)    for t0 <= t <= end
+#   hr_recovery   HR from the end of the bout (t0 = 120 s); amp > 0 is the
+#                 drop still to come, tau the recovery time constant
+#   temp_rise     core temperature from the event start (t0 = 0); amp < 0,
+#                 -amp is the rise it levels off at
+# and temp_linear is a straight line over TEMP_RISE (slope in °C/min).
+# The solver is batched Levenberg-Marquardt: residuals and Jacobians are
+# (rows, seconds[, 3]) arrays with missing seconds masked out, and the 3x3
+# normal equations of all rows are solved in one np.linalg.solve call per
+# iteration. Start values come from the best of N_TAU_START time constants,
+# for which base and amp are a closed-form linear fit.
+
+MODELS = {"hr_recovery": ("hr", HR_RECOVERY), "temp_rise": ("temp", TEMP_RISE)}
+
+def _masked(Y):
+    W = np.isfinite(Y)
+    return np.where(W, Y, 0.0), W.astype(float)
+
+def _line_fit(X, Y0, W):
+    # Weighted least squares of Y on X (both (rows, m)) per row: intercept, slope.
+    n = W.sum(axis=1)
+    sx, sy = (W * X).sum(axis=1), (W * Y0).sum(axis=1)
+    sxx, sxy = (W * X * X).sum(axis=1), (W * X * Y0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - slope * sx) / n
+    return intercept, slope
+
+def _quality(Y0, W, fitted):
+    n = W.sum(axis=1)
+    sse = (W * (Y0 - fitted) ** 2).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (W * Y0).sum(axis=1) / n
+        sst = (W * (Y0 - mean[:, None]) ** 2).sum(axis=1)
+        return 1.0 - sse / sst, np.sqrt(sse / n), sse
+
+def fit_linear(x, Y):
+    # x: (m,) seconds, Y: (rows, m) with NaN gaps.
+    Y0, W = _masked(Y)
+    X = np.broadcast_to(x, Y.shape)
+    intercept, slope = _line_fit(X, Y0, W)
+    r2, rmse, _ = _quality(Y0, W, intercept[:, None] + slope[:, None] * x)
+    n = W.sum(axis=1)
+    few = n < MIN_POINTS
+    out = {"intercept": intercept, "slope_per_min": slope * 60.0, "r2": r2, "rmse": rmse, "n": n}
+    for key in ("intercept", "slope_per_min", "r2", "rmse"):
+        out[key] = np.where(few, np.nan, out[key])
+    return out
+
+def _sse(Y0, W, x, p):
+    fitted = p[:, :1] + p[:, 1:2] * np.exp(-p[:, 2:3] * x)
+    return (W * (Y0 - fitted) ** 2).sum(axis=1)
+
+def fit_exponential(x, Y):
+    # y = base + amp * exp(-x / tau) per row; x: (m,) seconds from t0,
+    # Y: (rows, m) with NaN gaps. Returns {param: (rows,) array}.
+    Y0, W = _masked(Y)
+    rows = Y.shape[0]
+    k_lo, k_hi = 1.0 / TAU_RANGE[1], 1.0 / TAU_RANGE[0]
+
+    # Start: for each candidate k, base/amp are a linear fit of Y on exp(-k x).
+    p = np.full((rows, 3), np.nan)
+    best = np.full(rows, np.inf)
+    for k in np.geomspace(k_lo, k_hi, N_TAU_START):
+        E = np.broadcast_to(np.exp(-k * x), Y.shape)
+        base, amp = _line_fit(E, Y0, W)
+        trial = np.column_stack([base, amp, np.full(rows, k)])
+        sse = _sse(Y0, W, x, np.nan_to_num(trial))
+        better = np.isfinite(base) & (sse < best)
+        p[better], best[better] = trial[better], sse[better]
+
+    valid = (W.sum(axis=1) >= MIN_POINTS) & np.isfinite(best)
+    p = np.where(valid[:, None], p, 0.0)
+    sse = np.where(valid, best, 0.0)
+    lam = np.full(rows, 1e-3)
+    active = valid.copy()
+    converged = np.zeros(rows, dtype=bool)
+    for _ in range(MAX_ITER):
+        if not active.any():
+            break
+        e = np.exp(-p[:, 2:3] * x)
+        r = W * (Y0 - (p[:, :1] + p[:, 1:2] * e))
+        J = np.stack([np.ones_like(e), e, -p[:, 1:2] * x * e], axis=-1) * W[..., None]
+        JtJ = np.einsum('nmi,nmj->nij', J, J)
+        g = np.einsum('nmi,nm->ni', J, r)
+        diag = np.diagonal(JtJ, axis1=1, axis2=2)
+        A = JtJ + np.eye(3) * (lam[:, None] * diag + 1e-12)[:, None, :]
+        step = np.linalg.solve(A, g[..., None])[..., 0]
+
+        trial = p + step
+        trial[:, 2] = np.clip(trial[:, 2], k_lo, k_hi)
+        trial_sse = _sse(Y0, W, x, trial)
+        accept = active & (trial_sse <= sse)
+        done = accept & (sse - trial_sse <= TOL * np.maximum(sse, 1e-300))
+        p[accept] = trial[accept]
+        sse[accept] = trial_sse[accept]
+        lam = np.where(accept, lam * 0.3, lam * 10.0)
+        converged |= done
+        active &= ~done & (lam < 1e12)
+
+    fitted = p[:, :1] + p[:, 1:2] * np.exp(-p[:, 2:3] * x)
+    r2, rmse, _ = _quality(Y0, W, fitted)
+    out = {"base": p[:, 0], "amp": p[:, 1], "tau_s": 1.0 / np.where(valid, p[:, 2], np.nan),
+           "r2": r2, "rmse": rmse, "n": W.sum(axis=1), "converged": converged}
+    for key in ("base", "amp", "tau_s", "r2", "rmse"):
+        out[key] = np.where(valid, out[key], np.nan)
+    return out
+
+def _window(tensor, signal, span):
+    in_span = (tensor.seconds >= span[0]) & (tensor.seconds <= span[1])
+    return tensor.seconds[in_span] - span[0], getattr(tensor, signal)[:, in_span]
+
+def fit_kinetics(tensor):
+    # One row per tensor row (index: label), columns (model, param).
+    columns = {}
+    for model, (signal, span) in MODELS.items():
+        x, Y = _window(tensor, signal, span)
+        for param, values in fit_exponential(x, Y).items():
+            columns[(model, param)] = values
+    x, Y = _window(tensor, "temp", TEMP_RISE)
+    for param, values in fit_linear(x, Y).items():
+        columns[("temp_linear", param)] = values
+    table = pd.DataFrame(columns, index=pd.Index(tensor.rows["label"], name="label"))
+    table.columns = pd.MultiIndex.from_tuples(table.columns, names=["model", "param"])
+    return table
+
+def fits_by_event(tensor, table):
+    # {(subject, event_t): row of fit_kinetics} for looking up plot panels.
+    keys = zip(tensor.rows["subject"], tensor.rows["event_t"].astype(int))
+    return {key: table.iloc[i] for i, key in enumerate(keys)}
+
+def fit_curve(fit, model, seconds):
+    # Fitted values of `model` at `seconds` from event start, NaN outside its span.
+    seconds = np.asarray(seconds, dtype=float)
+    if model == "temp_linear":
+        span = TEMP_RISE
+        values = fit[(model, "intercept")] + fit[(model, "slope_per_min")] / 60.0 * (seconds - span[0])
+    else:
+        span = MODELS[model][1]
+        values = fit[(model, "base")] + fit[(model, "amp")] * np.exp(-(seconds - span[0]) / fit[(model, "tau_s")])
+    return np.where((seconds >= span[0]) & (seconds <= span[1]), values, np.nan)
+
+def main():
+    from alignment import load_session_tensor
+    from events import load_events
+    from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+
+    events = load_events({"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+    tensor = load_session_tensor([("Exp1_", events["Exp1"]), ("Exp2_", events["Exp2"])], clean=True)
+    table = fit_kinetics(tensor)
+    view = pd.DataFrame({
+        "HR tau (s)": table[("hr_recovery", "tau_s")],
+        "HR drop (bpm)": table[("hr_recovery", "amp")],
+        "HR R2": table[("hr_recovery", "r2")],
+        "Temp slope (°C/min)": table[("temp_linear", "slope_per_min")],
+        "Temp tau (s)": table[("temp_rise", "tau_s")],
+        "Temp rise (°C)": -table[("temp_rise", "amp")],
+        "Temp R2": table[("temp_rise", "r2")],
+    })
+    print(view.round(3).to_string())
+
+if __name__ == "__main__":
+    main()
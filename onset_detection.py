@@ -0,0 +1,207 @@
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from events import schedule_frame, write_schedule
+from thermo_loaders import NAME_MAP_HR_TO_KANJI, load_hr_data_for_subject, session_date_epoch
+from timebase import SECONDS_PER_DAY
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+CANDIDATE_FILE = DOWNLOADS_DIR / "event_schedule_candidates.csv"
+BIN_SECONDS = 5          # change points are searched on 5 s bin means
+MIN_SEGMENT = 3          # bins
+PENALTY_K = 3.0          # penalty = K * sigma^2 * log(n) per change point
+MIN_RISE = 15.0          # bpm step up that counts as an onset
+MERGE_SECONDS = 90       # consecutive up-steps closer than this form one onset
+ONSET_SIGMA = 3.0        # onset must leave baseline by 3 sigma ...
+SMOOTH_SECONDS = 5
+PAIR_TOLERANCE = 30      # seconds; subject onsets this close form one event
+PAIR_SIZE = 2
+SNR_HALF = 5.0           # rise / sigma at which a subject's score is 0.5
+EXPERIMENT_GAP = 600     # a pause this long between events starts a new experiment
+
+# Event onsets from HR alone. Each subject's session is reduced to 5 s bin
+# means, segmented with PELT (optimal partitioning with pruning, linear time
+# in practice) under a Gaussian mean-shift cost, and upward steps of at least
+# MIN_RISE bpm are refined to the last second the HR was still at baseline.
+# Subject onsets within PAIR_TOLERANCE are grouped into events, split into
+# experiments at long pauses and numbered per subject group, giving a
+# candidate schedule in the EVENTS_EXP1 / EVENTS_EXP2 format (see events.py).
+
+def _noise_sigma(x):
+    # Robust noise level from first differences (insensitive to level shifts).
+    d = np.diff(x[np.isfinite(x)])
+    if d.size == 0:
+        return 1.0
+    return max(1.4826 * np.median(np.abs(d - np.median(d))) / np.sqrt(2), 1e-6)
+
+def pelt(x, penalty, min_size=MIN_SEGMENT):
+    # Change points (segment start indices, excluding 0) minimizing
+    # sum of within-segment squared error + penalty per change point.
+    n = x.size
+    s1 = np.concatenate([[0.0], np.cumsum(x)])
+    s2 = np.concatenate([[0.0], np.cumsum(x * x)])
+
+    def cost(starts, end):
+        length = end - starts
+        return s2[end] - s2[starts] - (s1[end] - s1[starts]) ** 2 / length
+
+    f = np.full(n + 1, np.inf)
+    f[0] = -penalty
+    last = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.array([0], dtype=np.int64)
+    for end in range(min_size, n + 1):
+        if end >= 2 * min_size:
+            candidates = np.append(candidates, end - min_size)
+        total = f[candidates] + cost(candidates, end) + penalty
+        best = np.argmin(total)
+        f[end] = total[best]
+        last[end] = candidates[best]
+        # Pruning: a start that cannot beat the optimum now never will.
+        candidates = candidates[total - penalty <= f[end]]
+
+    points = []
+    end = n
+    while end > 0:
+        end = last[end]
+        if end > 0:
+            points.append(end)
+    return np.array(points[::-1], dtype=np.int64)
+
+def _resample(times, values):
+    # 1 s grid from the first to the last sample, gaps linearly filled.
+    grid = np.arange(times[0], times[-1] + 1, dtype=np.int64)
+    return grid, np.interp(grid, times, values)
+
+def subject_onsets(times, values, bin_seconds=BIN_SECONDS, min_rise=MIN_RISE, penalty_k=PENALTY_K):
+    # Returns a DataFrame of onsets: t (session seconds), rise (bpm), snr.
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    ok = np.isfinite(values)
+    times, values = times[ok], values[ok]
+    if times.size < 2 * MIN_SEGMENT * bin_seconds:
+        return pd.DataFrame(columns=["t", "rise", "snr"])
+    order = np.argsort(times, kind='stable')
+    grid, hr = _resample(times[order], values[order])
+
+    n_bins = hr.size // bin_seconds
+    bins = hr[:n_bins * bin_seconds].reshape(n_bins, bin_seconds).mean(axis=1)
+    sigma = _noise_sigma(hr)
+    bin_sigma = max(_noise_sigma(bins), sigma / np.sqrt(bin_seconds))
+    points = pelt(bins, penalty_k * bin_sigma ** 2 * np.log(n_bins))
+
+    bounds = np.concatenate([[0], points, [n_bins]])
+    means = np.array([bins[a:b].mean() for a, b in zip(bounds[:-1], bounds[1:])])
+    steps = np.diff(means)
+
+    # Merge runs of up-steps (a ramp is split into a staircase) into one onset.
+    onsets = []
+    i = 0
+    while i < steps.size:
+        if steps[i] <= 0:
+            i += 1
+            continue
+        j = i
+        while j + 1 < steps.size and steps[j + 1] > 0 and \
+                (points[j + 1] - points[j]) * bin_seconds <= MERGE_SECONDS:
+            j += 1
+        rise = means[j + 1] - means[i]
+        if rise >= min_rise:
+            onsets.append((i, rise))
+        i = j + 1
+
+    smooth = pd.Series(hr).rolling(SMOOTH_SECONDS, center=True, min_periods=1).median().to_numpy()
+    rows = []
+    for k, rise in onsets:
+        base_start, change = bounds[k], bounds[k + 1]
+        baseline = means[k]
+        # First second near the change that clears baseline + ONSET_SIGMA * sigma ...
+        lo = max(base_start, change - MERGE_SECONDS // bin_seconds) * bin_seconds
+        hi = min(hr.size, (change + 2) * bin_seconds + MERGE_SECONDS)
+        above = np.flatnonzero(smooth[lo:hi] > baseline + ONSET_SIGMA * sigma)
+        idx = lo + above[0] if above.size else change * bin_seconds
+        # ... then back to just after the last sample within one sigma.
+        quiet = np.flatnonzero(smooth[lo:idx] <= baseline + sigma)
+        if quiet.size:
+            idx = lo + quiet[-1] + 1
+        rows.append({"t": int(grid[idx]), "rise": float(rise), "snr": float(rise / sigma)})
+    return pd.DataFrame(rows, columns=["t", "rise", "snr"])
+
+def group_onsets(onsets, tolerance=PAIR_TOLERANCE, pair_size=PAIR_SIZE):
+    # onsets: DataFrame with subject, t, rise, snr -> one row per event.
+    if onsets.empty:
+        return pd.DataFrame(columns=["t", "subjects", "rise", "confidence"])
+    onsets = onsets.sort_values("t", kind='stable').reset_index(drop=True)
+    t = onsets["t"].to_numpy()
+    cluster = np.concatenate([[0], np.cumsum(np.diff(t) > tolerance)])
+
+    events = []
+    for _, group in onsets.groupby(cluster, sort=True):
+        group = group.drop_duplicates("subject")
+        score = group["snr"] / (group["snr"] + SNR_HALF)
+        spread = group["t"].max() - group["t"].min()
+        coverage = min(1.0, len(group) / pair_size)
+        confidence = float(score.mean() * coverage * np.exp(-spread / tolerance))
+        events.append({"t": int(np.median(group["t"])), "subjects": group["subject"].tolist(),
+                       "rise": float(group["rise"].mean()), "confidence": round(confidence, 3)})
+    return pd.DataFrame(events)
+
+def candidate_schedule(events, experiment_gap=EXPERIMENT_GAP):
+    # Split events into experiments at long pauses and number repeated
+    # subject groups within an experiment ("1回目", "2回目", ...).
+    if events.empty:
+        return schedule_frame({})
+    t = events["t"].to_numpy()
+    experiment = np.concatenate([[0], np.cumsum(np.diff(t) > experiment_gap)]) + 1
+
+    schedule = []
+    for exp_no in np.unique(experiment):
+        block = events[experiment == exp_no]
+        keys = [tuple(sorted(s)) for s in block["subjects"]]
+        repeats = pd.Series(keys).value_counts()
+        seen = {}
+        for (_, row), key in zip(block.iterrows(), keys):
+            seen[key] = seen.get(key, 0) + 1
+            suffix = f"{seen[key]}回目" if repeats[key] > 1 else ""
+            clock = int(row["t"]) % SECONDS_PER_DAY
+            schedule.append({"experiment": f"Exp{exp_no}",
+                             "time": f"{clock // 3600:02d}:{clock // 60 % 60:02d}:{clock % 60:02d}",
+                             "subjects": ";".join(row["subjects"]), "suffix": suffix,
+                             "confidence": row["confidence"]})
+    return pd.DataFrame(schedule, columns=schedule_frame({}).columns)
+
+def detect_onsets(hr_frames):
+    # hr_frames: {subject: DataFrame with SessionSeconds, 'HR (bpm)'}
+    per_subject = []
+    for subject, df in hr_frames.items():
+        if df is None or df.empty or 'HR (bpm)' not in df.columns:
+            continue
+        values = pd.to_numeric(df['HR (bpm)'], errors='coerce').to_numpy(dtype=float)
+        onsets = subject_onsets(df['SessionSeconds'].to_numpy(), values)
+        onsets.insert(0, "subject", subject)
+        per_subject.append(onsets)
+    if not per_subject:
+        return pd.DataFrame(columns=["subject", "t", "rise", "snr"])
+    return pd.concat(per_subject, ignore_index=True)
+
+def main():
+    start = time.perf_counter()
+    # Every HR file on the session epoch the rest of the pipeline uses (the
+    # session date, as in alignment.stream_session_tensor), so onsets share
+    # a zero with the capsule and event seconds without loading the capsules.
+    epoch = session_date_epoch()
+    hr_frames = {name: load_hr_data_for_subject(name, epoch) for name in NAME_MAP_HR_TO_KANJI.values()}
+    onsets = detect_onsets(hr_frames)
+    schedule = candidate_schedule(group_onsets(onsets))
+    elapsed = time.perf_counter() - start
+
+    print(f"Detected {len(onsets)} subject onsets, {len(schedule)} events in {elapsed:.2f}s")
+    print(schedule.to_string(index=False))
+    write_schedule(schedule, CANDIDATE_FILE)
+    print(f"Saved {CANDIDATE_FILE}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; only this module needs it
+    pa = pq = None
+
+from alignment import WINDOW
+from cleaning import clean_temp_data
+from thermo_loaders import (DOWNLOADS_DIR, data_epoch, find_sessions, load_hr_data_for_subject, load_temp_data,
+                            merge_capsules, source_mtimes)
+from timebase import event_seconds
+
+# --- Configuration ---
+DATASET_DIR = DOWNLOADS_DIR / "parquet_dataset"
+MANIFEST_FILE = "_manifest.json"
+ROW_GROUP_SIZE = 600        # samples; 10 min of 1 Hz HR per row group
+COMPRESSION = "zstd"
+
+# Dataset layout (Hive-style partitions, one file per partition):
+#   session=260117/subject=山口/signal=hr/part-0.parquet
+# columns t (int64 session seconds, sorted), value (float64) and time
+# (timestamp[s]). Files are written in small row groups so the min/max
+# statistics of t bound each group tightly; window reads open only the
+# partitions they need and only the row groups overlapping the window.
+# Temperature is stored after cleaning (cleaning.clean_temp_data).
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("parquet_dataset needs pyarrow (pip install pyarrow)")
+
+def partition_path(dataset_dir, session, subject, signal):
+    return Path(dataset_dir) / f"session={session}" / f"subject={subject}" / f"signal={signal}" / "part-0.parquet"
+
+def _read_manifest(dataset_dir):
+    path = Path(dataset_dir) / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_manifest(dataset_dir, manifest):
+    path = Path(dataset_dir) / MANIFEST_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def write_partition(path, times, values, epoch):
+    _require_pyarrow()
+    order = np.argsort(times, kind='stable')
+    times = np.asarray(times, dtype=np.int64)[order]
+    values = np.asarray(values, dtype=float)[order]
+    columns = {"t": pa.array(times), "value": pa.array(values)}
+    if epoch is not None:
+        columns["time"] = pa.array(np.datetime64(epoch, 's') + times.astype('timedelta64[s]'))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.table(columns), path, row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION)
+
+def ingest_session(session, directory, dataset_dir=DATASET_DIR):
+    # Replace one session's partitions with freshly loaded, cleaned samples.
+    _require_pyarrow()
+    temp_data, report = clean_temp_data(load_temp_data(downloads_dir=directory, session=session))
+    epoch = data_epoch(temp_data)
+    session_dir = Path(dataset_dir) / f"session={session}"
+    if session_dir.exists():
+        shutil.rmtree(session_dir)
+
+    n_files = 0
+    for name, df in merge_capsules(temp_data).items():
+        df = df.dropna(subset=['Temp'])
+        if not df.empty:
+            write_partition(partition_path(dataset_dir, session, name, "temp"),
+                            df['SessionSeconds'].to_numpy(), df['Temp'].to_numpy(dtype=float), epoch)
+            n_files += 1
+    for path in sorted(Path(directory).glob("心拍数_*.CSV")):
+        name = path.stem.split('_', 1)[1]
+        df = load_hr_data_for_subject(name, epoch, downloads_dir=directory)
+        if df.empty or 'HR (bpm)' not in df.columns:
+            continue
+        values = pd.to_numeric(df['HR (bpm)'], errors='coerce').to_numpy(dtype=float)
+        write_partition(partition_path(dataset_dir, session, name, "hr"), df['SessionSeconds'].to_numpy(), values, epoch)
+        n_files += 1
+    return n_files
+
+def ingest(root=DOWNLOADS_DIR, dataset_dir=DATASET_DIR):
+    # Incremental: sessions whose source files are unchanged are skipped.
+    _require_pyarrow()
+    dataset_dir = Path(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _read_manifest(dataset_dir)
+    for session, directory in find_sessions(root).items():
+        sources = source_mtimes(directory, session)
+        if manifest.get(session, {}).get("sources") == sources:
+            print(f"Session {session}: up to date")
+            continue
+        n_files = ingest_session(session, directory, dataset_dir)
+        manifest[session] = {"directory": str(directory), "sources": sources}
+        _write_manifest(dataset_dir, manifest)
+        print(f"Session {session}: wrote {n_files} partitions")
+    return manifest
+
+class WindowReader:
+    # Reads time windows from the dataset, touching only the row groups whose
+    # t statistics overlap the window. Parquet footers are cached per file.
+
+    def __init__(self, dataset_dir=DATASET_DIR):
+        _require_pyarrow()
+        self.dataset_dir = Path(dataset_dir)
+        self._files = {}
+        self.row_groups_read = 0
+        self.row_groups_total = 0
+        self.bytes_read = 0
+
+    def _file(self, path):
+        if path not in self._files:
+            parquet = pq.ParquetFile(path)
+            t_col = parquet.schema_arrow.get_field_index("t")
+            bounds = []
+            for i in range(parquet.metadata.num_row_groups):
+                group = parquet.metadata.row_group(i)
+                stats = group.column(t_col).statistics
+                size = sum(group.column(j).total_compressed_size for j in range(group.num_columns))
+                bounds.append((stats.min, stats.max, size))
+            self._files[path] = (parquet, bounds)
+        return self._files[path]
+
+    def window(self, session, subject, signal, t_start, t_end, columns=("t", "value")):
+        # Samples with t_start <= t <= t_end as (times, values).
+        path = partition_path(self.dataset_dir, session, subject, signal)
+        if not path.exists():
+            return np.empty(0, np.int64), np.empty(0)
+        parquet, bounds = self._file(path)
+        groups = [i for i, (lo, hi, _) in enumerate(bounds) if hi >= t_start and lo <= t_end]
+        self.row_groups_total += len(bounds)
+        self.row_groups_read += len(groups)
+        self.bytes_read += sum(bounds[i][2] for i in groups)
+        if not groups:
+            return np.empty(0, np.int64), np.empty(0)
+        table = parquet.read_row_groups(groups, columns=list(columns))
+        times = table.column("t").to_numpy()
+        values = table.column("value").to_numpy()
+        lo = np.searchsorted(times, t_start, side='left')
+        hi = np.searchsorted(times, t_end, side='right')
+        return times[lo:hi], values[lo:hi]
+
+def event_windows(reader, schedules, signal, subject=None, suffix=None, window=WINDOW):
+    # schedules: {session: [(TimeStr, names, suffix), ...]} -> long DataFrame
+    # with session, subject, suffix, event_t, rel_t, value for every matching
+    # (event, subject) window, e.g. all "1回目" windows of one subject.
+    parts = []
+    for session, events in schedules.items():
+        for event_t, (time_str, names, event_suffix) in zip(event_seconds(events), events):
+            if suffix is not None and event_suffix != suffix:
+                continue
+            for name in names:
+                if subject is not None and name != subject:
+                    continue
+                times, values = reader.window(session, name, signal, event_t + window[0], event_t + window[1])
+                parts.append(pd.DataFrame({"session": session, "subject": name, "suffix": event_suffix,
+                                           "event_t": int(event_t), "rel_t": times - event_t, "value": values}))
+    if not parts:
+        return pd.DataFrame(columns=["session", "subject", "suffix", "event_t", "rel_t", "value"])
+    return pd.concat(parts, ignore_index=True)
+
+def main():
+    from events import session_events
+    from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+
+    ingest()
+    # Example query; other sessions keep a reviewed event_schedule.csv next
+    # to their workbooks (see events.py).
+    schedules = {}
+    for session, directory in find_sessions().items():
+        events = session_events(session, directory, {"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+        if events is None:
+            print(f"Session {session}: no event schedule, skipped")
+            continue
+        schedules[session] = events.get("Exp1", [])
+    reader = WindowReader()
+    subject = EVENTS_EXP1[0][1][0]
+    windows = event_windows(reader, schedules, "hr", subject=subject, suffix="1回目")
+    print(f"{subject} 1回目 HR windows: {len(windows)} samples from {windows['session'].nunique()} sessions")
+    print(f"Read {reader.row_groups_read}/{reader.row_groups_total} row groups, {reader.bytes_read / 1024:.1f} KB")
+
+if __name__ == "__main__":
+    main()
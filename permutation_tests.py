@@ -0,0 +1,276 @@
+import itertools
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.stats import t as t_dist
+except ImportError:  # optional; _t_threshold falls back to a series expansion
+    t_dist = None
+
+from ensemble import SIGNALS, group_labels
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+# Comparison name -> (condition A, condition B). A condition is a group label
+# ("Exp1 1回目") or an experiment ("Exp1"), whose trials are averaged per
+# subject; subjects are paired across the two conditions.
+COMPARISONS = {
+    "Exp1 1回目 vs 2回目": ("Exp1 1回目", "Exp1 2回目"),
+    "Exp1 vs Exp2": ("Exp1", "Exp2"),
+}
+N_PERMUTATIONS = 5000
+PERMUTATION_CHUNK = 500
+N_WORKERS = os.cpu_count() or 1
+CLUSTER_ALPHA = 0.05        # two-sided per-second threshold that forms clusters
+ALPHA = 0.05                # cluster-level significance
+MIN_SUBJECTS = 3            # seconds with fewer paired subjects are never in a cluster
+SEED = 0
+SHADE_COLOR = "gold"
+
+# Paired cluster-based permutation test (Maris & Oostenveld 2007) over the
+# per-second aligned grid. For every subject, d = A - B per second; the
+# statistic is the one-sample t of d across subjects, and clusters are runs
+# of seconds with |t| above the two-sided CLUSTER_ALPHA threshold and the same
+# sign, scored by their summed t ("mass"). Under the null each subject's
+# difference is equally likely to flip sign, so a permutation is one ±1 per
+# subject: with signs S (n_perm, n_subjects) and D (n_subjects, n_seconds),
+# S @ D gives the permuted sums of all permutations at once, and the sum of
+# squares does not change. Each cluster's p is the share of permutations
+# whose largest |mass| anywhere in the window reaches it, which controls the
+# error over the whole window. With 2**n_subjects <= N_PERMUTATIONS every
+# sign pattern is enumerated and the test is exact. Permutation chunks run
+# in a process pool like ensemble.bootstrap_ci.
+
+def _t_threshold(df, alpha=CLUSTER_ALPHA):
+    # Two-sided critical t per second; df may be an array (0 where unusable).
+    df = np.asarray(df, dtype=float)
+    p = 1.0 - alpha / 2
+    if t_dist is not None:
+        with np.errstate(invalid='ignore'):
+            return np.where(df > 0, t_dist.ppf(p, np.maximum(df, 1)), np.inf)
+    # Exact for 1 and 2 degrees of freedom, Abramowitz & Stegun 26.7.5 above.
+    z = NormalDist().inv_cdf(p)
+    g = [(z ** 3 + z) / 4,
+         (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96,
+         (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384,
+         (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160]
+    nu = np.maximum(df, 1)
+    out = z + sum(gk / nu ** (k + 1) for k, gk in enumerate(g))
+    out = np.where(df == 1, np.tan(np.pi * (p - 0.5)), out)
+    out = np.where(df == 2, (2 * p - 1) * np.sqrt(2 / (4 * p * (1 - p))), out)
+    return np.where(df > 0, out, np.inf)
+
+def _t_stats(sums, sumsq, n):
+    # One-sample t from per-second sums (..., n_seconds); 0 where undefined.
+    with np.errstate(all='ignore'):
+        mean = sums / n
+        var = (sumsq - n * mean ** 2) / (n - 1)
+        t = mean / np.sqrt(var / n)
+    return np.where(np.isfinite(t) & (n >= MIN_SUBJECTS), t, 0.0)
+
+def _runs(T, threshold):
+    # Same-sign runs of |T| > threshold in every row of T (rows, n_seconds):
+    # (row, start, stop, mass) per run, stop exclusive. Runs are numbered
+    # over the flattened array, so one bincount sums all of them.
+    sign = (np.sign(T) * (np.abs(T) > threshold)).astype(np.int8)
+    previous = np.pad(sign[:, :-1], ((0, 0), (1, 0)))
+    begins = (sign != 0) & (sign != previous)
+    inside = (sign != 0).ravel()
+    run = np.cumsum(begins.ravel())[inside] - 1
+    mass = np.bincount(run, weights=T.ravel()[inside], minlength=int(begins.sum()))
+    length = np.bincount(run, minlength=int(begins.sum()))
+    rows, start = np.nonzero(begins)
+    return rows, start, start + length, mass
+
+def _max_masses(D, n, sumsq, threshold, signs):
+    # Largest |cluster mass| of each sign pattern in `signs` (chunk, n_subjects).
+    T = _t_stats(signs @ D, sumsq, n)
+    rows, _, _, mass = _runs(T, threshold)
+    out = np.zeros(len(signs))
+    np.maximum.at(out, rows, np.abs(mass))
+    return out
+
+def sign_patterns(n_subjects, n_perm=N_PERMUTATIONS, seed=SEED):
+    # (patterns, exact): every ±1 pattern when there are at most n_perm,
+    # else n_perm random ones with the identity first.
+    if 2 ** n_subjects <= n_perm:
+        signs = np.array(list(itertools.product((1.0, -1.0), repeat=n_subjects)))
+        return signs, True
+    rng = np.random.default_rng(seed)
+    signs = rng.choice((1.0, -1.0), size=(n_perm, n_subjects))
+    signs[0] = 1.0
+    return signs, False
+
+def cluster_test(diffs, n_perm=N_PERMUTATIONS, cluster_alpha=CLUSTER_ALPHA, workers=N_WORKERS, seed=SEED,
+                 pool=None):
+    # diffs: paired differences (n_subjects, n_seconds), NaN where missing.
+    # Returns {"t", "threshold", "n", "clusters": [(start, stop, mass, p)],
+    # "null", "exact"} with start/stop as column indices (stop exclusive).
+    finite = np.isfinite(diffs)
+    D = np.where(finite, diffs, 0.0)
+    n = finite.sum(axis=0)
+    sumsq = (D * D).sum(axis=0)
+    threshold = _t_threshold(np.where(n >= MIN_SUBJECTS, n - 1, 0), cluster_alpha)
+
+    t = _t_stats(D.sum(axis=0), sumsq, n)
+    _, start, stop, mass = _runs(t[None, :], threshold)
+
+    signs, exact = sign_patterns(len(D), n_perm, seed)
+    chunks = [signs[i:i + PERMUTATION_CHUNK] for i in range(0, len(signs), PERMUTATION_CHUNK)]
+    args = ([D] * len(chunks), [n] * len(chunks), [sumsq] * len(chunks), [threshold] * len(chunks), chunks)
+    if len(chunks) > 1 and pool is not None:
+        parts = list(pool.map(_max_masses, *args))
+    elif len(chunks) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_max_masses, *args))
+    else:
+        parts = [_max_masses(*a) for a in zip(*args)]
+    null = np.concatenate(parts)
+
+    # The observed labelling is one of the permutations, so p >= 1 / n_perm.
+    p = [float((null >= abs(m) - 1e-9 * abs(m)).mean()) for m in mass]
+    return {"t": t, "threshold": threshold, "n": n, "null": null, "exact": exact,
+            "clusters": list(zip(start, stop, mass, p))}
+
+def paired_conditions(tensor, signal, a, b):
+    # (subjects, A values, B values): per-subject means of each condition's
+    # trials, for subjects with data in both.
+    labels = np.array(group_labels(tensor.rows))
+    experiments = tensor.rows["experiment"].to_numpy()
+    subjects = tensor.rows["subject"].to_numpy()
+    data = getattr(tensor, signal)
+
+    def per_subject(condition):
+        rows = (labels == condition) | (experiments == condition)
+        means = {}
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # seconds without data
+            for subject in dict.fromkeys(subjects[rows]):
+                block = data[rows & (subjects == subject)]
+                if np.isfinite(block).any():
+                    means[subject] = np.nanmean(block, axis=0)
+        return means
+
+    A, B = per_subject(a), per_subject(b)
+    paired = [s for s in A if s in B]
+    if not paired:
+        return paired, np.empty((0, data.shape[1])), np.empty((0, data.shape[1]))
+    return paired, np.array([A[s] for s in paired]), np.array([B[s] for s in paired])
+
+def condition_tests(tensor, comparisons=COMPARISONS, n_perm=N_PERMUTATIONS, workers=N_WORKERS):
+    # (clusters table, {(comparison, signal): cluster_test result}); the table
+    # has one row per cluster with seconds from start and p.
+    results, records = {}, []
+    # One pool for every test, and none when no test has more than one chunk.
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and n_perm > PERMUTATION_CHUNK else None
+    try:
+        for name, (a, b) in comparisons.items():
+            for signal in SIGNALS:
+                subjects, A, B = paired_conditions(tensor, signal, a, b)
+                if len(subjects) < MIN_SUBJECTS:
+                    print(f"{name} {signal}: {len(subjects)} paired subjects, skipped")
+                    continue
+                result = cluster_test(A - B, n_perm, workers=workers, pool=executor)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)  # seconds without data
+                    result.update(subjects=subjects, mean_a=np.nanmean(A, axis=0), mean_b=np.nanmean(B, axis=0))
+                results[(name, signal)] = result
+                for start, stop, mass, p in result["clusters"]:
+                    records.append({"comparison": name, "signal": signal,
+                                    "start_s": int(tensor.seconds[start]), "end_s": int(tensor.seconds[stop - 1]),
+                                    "direction": "A > B" if mass > 0 else "A < B", "mass": mass, "p": p,
+                                    "significant": p < ALPHA, "n_subjects": len(subjects),
+                                    "n_permutations": len(result["null"]), "exact": result["exact"]})
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    columns = ["comparison", "signal", "start_s", "end_s", "direction", "mass", "p", "significant", "n_subjects",
+               "n_permutations", "exact"]
+    return pd.DataFrame(records, columns=columns), results
+
+def within(exp_name, comparisons=COMPARISONS):
+    # Comparisons whose two conditions both belong to exp_name (e.g. 1回目 vs 2回目).
+    return [name for name, pair in comparisons.items() if all(c.split()[0] == exp_name for c in pair)]
+
+def shade_clusters(ax, clusters, signal, comparisons=None, color=SHADE_COLOR):
+    # Shade the significant clusters of `signal` on an axis in minutes from
+    # start; comparisons limits them to some rows of COMPARISONS.
+    if clusters is None or clusters.empty:
+        return
+    rows = clusters[(clusters["signal"] == signal) & clusters["significant"]]
+    if comparisons is not None:
+        rows = rows[rows["comparison"].isin(comparisons)]
+    for i, row in enumerate(rows.itertuples()):
+        ax.axvspan(row.start_s / 60.0, (row.end_s + 1) / 60.0, color=color, alpha=0.3, linewidth=0,
+                   label=f"p < {ALPHA} cluster" if i == 0 else None)
+
+def draw_comparison(fig, name, results, seconds):
+    # Condition means (top) and paired t with its threshold (bottom) per signal.
+    a, b = COMPARISONS[name]
+    minutes = np.asarray(seconds) / 60.0
+    axes = fig.subplots(2, len(SIGNALS), sharex=True, squeeze=False)
+    units = {"hr": "HR (bpm)", "temp": "Temp (°C)"}
+    for col, signal in enumerate(SIGNALS):
+        ax_mean, ax_t = axes[0, col], axes[1, col]
+        result = results.get((name, signal))
+        if result is None:
+            ax_mean.set_title(f"{signal}: not enough paired subjects")
+            continue
+        n = len(result["subjects"])
+        ax_mean.plot(minutes, result["mean_a"], color="C0", linewidth=2, label=f"{a} (n={n})")
+        ax_mean.plot(minutes, result["mean_b"], color="C3", linewidth=2, label=f"{b} (n={n})")
+        ax_t.plot(minutes, result["t"], color="black", linewidth=1)
+        threshold = np.where(np.isfinite(result["threshold"]), result["threshold"], np.nan)
+        ax_t.plot(minutes, threshold, color="gray", linestyle="--", linewidth=1)
+        ax_t.plot(minutes, -threshold, color="gray", linestyle="--", linewidth=1)
+        for start, stop, mass, p in result["clusters"]:
+            if p >= ALPHA:
+                continue
+            for ax in (ax_mean, ax_t):
+                ax.axvspan(minutes[start], minutes[stop - 1] + 1 / 60.0, color=SHADE_COLOR, alpha=0.3, linewidth=0)
+            ax_t.annotate(f"p={p:.3f}", ((minutes[start] + minutes[stop - 1]) / 2, mass / (stop - start)),
+                          ha='center', fontsize=9)
+        kind = "exact" if result["exact"] else f"{len(result['null'])} permutations"
+        ax_mean.set_title(f"{name} - {units[signal]}")
+        ax_mean.set_ylabel(units[signal])
+        ax_t.set_title(f"paired t, clusters p < {ALPHA} shaded ({kind})")
+        ax_t.set_ylabel("t")
+        ax_t.set_xlabel("Time from Start (min)")
+        for ax in (ax_mean, ax_t):
+            ax.axvline(0, color='red', linestyle='--')
+            ax.axvline(2, color='gray', linestyle=':')
+            ax.grid(True)
+        ax_mean.legend(loc='upper right')
+    fig.tight_layout()
+
+def main():
+    from alignment import load_session_tensor
+    from events import load_events
+    from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+    from render_core import figure, save_figure, setup_japanese_font
+
+    events = load_events({"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+    tensor = load_session_tensor([("Exp1_", events["Exp1"]), ("Exp2_", events["Exp2"])], clean=True)
+    clusters, results = condition_tests(tensor)
+    significant = clusters[clusters["significant"]]
+    print(f"{len(clusters)} clusters above the per-second threshold, {len(significant)} with p < {ALPHA}")
+    if not significant.empty:
+        print(significant.round(4).to_string(index=False))
+
+    setup_japanese_font()
+    DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    for name in COMPARISONS:
+        with figure(figsize=(16, 9)) as fig:
+            draw_comparison(fig, name, results, tensor.seconds)
+            out_file = save_figure(fig, DOWNLOADS_DIR / f"Permutation_{name.replace(' ', '_')}.png",
+                                   output_class="overview")
+        print(f"Saved {out_file}")
+
+if __name__ == "__main__":
+    main()
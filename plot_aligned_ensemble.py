@@ -0,0 +1,84 @@
+import numpy as np
+from pathlib import Path
+
+from alignment import load_session_tensor
+from ensemble import ensemble_summary
+from events import load_events
+from figure_output import write_behind
+from permutation_tests import condition_tests, shade_clusters, within
+from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+from render_core import figure, save_figure, setup_japanese_font
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+# Band drawn around the mean: "ci" (bootstrap), "sd" or "sem"
+BAND = "ci"
+GROUP_COLORS = {"1回目": "C0", "2回目": "C3", "": "C2"}
+# Shade significant time clusters of the within-experiment comparisons
+# (permutation_tests.COMPARISONS, e.g. 1回目 vs 2回目)
+SHADE_CLUSTERS = True
+
+def band_limits(stats, band):
+    if band == "ci":
+        return stats["ci_low"], stats["ci_high"]
+    width = stats[band]
+    return stats["mean"] - width, stats["mean"] + width
+
+def draw_ensemble(fig, summary, exp_name, band=BAND, clusters=None):
+    ax_hr, ax_temp = fig.subplots(2, 1, sharex=True)
+    minutes = summary.index.to_numpy() / 60.0
+
+    for signal, ax in (("hr", ax_hr), ("temp", ax_temp)):
+        if signal not in summary.columns.get_level_values("signal"):
+            continue
+        for group in summary[signal].columns.get_level_values("group").unique():
+            if not group.startswith(exp_name):
+                continue
+            stats = summary[signal][group]
+            suffix = group[len(exp_name):].strip()
+            color = GROUP_COLORS.get(suffix, 'black')
+            n_max = int(np.nanmax(stats["n"]))
+            low, high = band_limits(stats, band)
+            ax.plot(minutes, stats["mean"], color=color, linewidth=2, label=f"{group} (n={n_max})")
+            ax.fill_between(minutes, low, high, color=color, alpha=0.25, linewidth=0)
+        shade_clusters(ax, clusters, signal, within(exp_name))
+        ax.axvline(0, color='red', linestyle='--')
+        ax.axvline(2, color='gray', linestyle=':')
+        ax.grid(True)
+        ax.legend(loc='upper right')
+
+    band_label = {"ci": "bootstrap 95% CI", "sd": "SD", "sem": "SEM"}[band]
+    ax_hr.set_title(f"{exp_name} - Heart Rate (mean ± {band_label})")
+    ax_hr.set_ylabel("HR (bpm)")
+    ax_temp.set_title(f"{exp_name} - Core Temperature (mean ± {band_label})")
+    ax_temp.set_ylabel("Temp (°C)")
+    ax_temp.set_xlabel("Time from Start (min)")
+    fig.tight_layout()
+
+def plot_ensemble(summary, exp_name, band=BAND, clusters=None):
+    setup_japanese_font()
+    with figure(figsize=(14, 10)) as fig:
+        draw_ensemble(fig, summary, exp_name, band, clusters)
+
+        out_file = DOWNLOADS_DIR / f"{exp_name}_Ensemble.png"
+        out_file = save_figure(fig, out_file, output_class="overview")
+    print(f"Saved {out_file}")
+
+def main():
+    DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    events = load_events({"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+    experiments = [("Exp1_", events["Exp1"]), ("Exp2_", events["Exp2"])]
+    tensor = load_session_tensor(experiments, clean=True)
+    summary = ensemble_summary(tensor)
+    clusters = None
+    if SHADE_CLUSTERS:
+        clusters, _ = condition_tests(tensor)
+        significant = clusters[clusters["significant"]]
+        print(significant.round(4).to_string(index=False) if not significant.empty else "No significant clusters.")
+    plot_ensemble(summary, "Exp1", clusters=clusters)
+    plot_ensemble(summary, "Exp2", clusters=clusters)
+
+if __name__ == "__main__":
+    # PNG encoding and disk writes overlap with building the next figure
+    with write_behind():
+        main()
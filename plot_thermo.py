@@ -1,66 +1,68 @@
-import glob
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
+import matplotlib.dates as mdates
 import datetime
 from pathlib import Path
 
+from capsule_layout import read_capsule_blocks
+from render_core import DEFAULT_DPI, figure, save_figure, setup_japanese_font
+from signal_pyramid import open_signal_pyramid, plot_signal
+from thermo_loaders import find_capsule_files
+
 # --- Configuration ---
 DOWNLOADS_DIR = Path("Downloads")
+# Plot from the precomputed signal pyramid (signal_pyramid.py) instead of
+# re-reading every workbook; one line per capsule instead of per file.
+USE_PYRAMID = True
+# Time-of-day range to zoom into, e.g. ("14:00:00", "15:30:00"); None = whole session
+TIME_RANGE = None
+FIGSIZE = (20, 6)
 
 def plot_temperature():
     DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
-    file_pattern = DOWNLOADS_DIR / "260117_no*.xlsx"
-    files = glob.glob(str(file_pattern))
+    # 260117_no*.xlsx, or the logger's .csv/.tsv export of the same sheet
+    files = find_capsule_files(DOWNLOADS_DIR, "260117")
 
     if not files:
         print("No files found matching the pattern.")
         return
 
-    plt.figure(figsize=(20, 6))
+    with figure(figsize=FIGSIZE) as fig:
+        ax = fig.add_subplot()
+        if USE_PYRAMID:
+            setup_japanese_font()  # capsules are labelled by subject name
+            level = plot_signal(ax, open_signal_pyramid(), "temp", TIME_RANGE, width_px=FIGSIZE[0] * DEFAULT_DPI)
+            print(f"Plotted pyramid level {level}s")
+        else:
+            plot_files(ax, files)
 
-    # Try to support Japanese characters in plot
-    potential_fonts = ['Hiragino Sans', 'Hiragino Kaku Gothic ProN', 'Arial Unicode MS', 'Meiryo', 'Yu Gothic', 'TakaoPGothic', 'IPAPGothic']
-    font_name = None
-    for f in potential_fonts:
-        try:
-            if f in [f.name for f in fm.fontManager.ttflist]:
-                font_name = f
-                break
-        except:
-            continue
-    
-    if font_name:
-        plt.rcParams['font.family'] = font_name
-    else:
-        plt.rcParams['font.family'] = 'sans-serif'
+        ax.set_title("Temperature 260117")
+        ax.set_xlabel("Time")
+        ax.set_ylabel("Temperature")
+        ax.legend()
+        ax.grid(True)
+
+        # Format x-axis dates nicely
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
 
+        output_path = DOWNLOADS_DIR / "260117_temperature.png"
+        output_path = save_figure(fig, output_path, output_class="overview")
+        print(f"Plot saved to {output_path}")
+
+def plot_files(ax, files):
     for file_path in files:
         filename = os.path.basename(file_path)
         # Extract name (e.g., "no1" from "260117_no1.xlsx")
         name = os.path.splitext(filename)[0].split('_')[1]
 
         try:
-            # Read Excel, header=None to handle custom layout
-            df = pd.read_excel(file_path, header=None)
-            
-            # The files seem to have data in two blocks.
-            # Block 1: Columns 5, 6, 7 (indices 5, 6, 7) -> Date, Time, Temp
-            # Block 2: Columns 12, 13, 14 (indices 12, 13, 14) -> Date, Time, Temp
-            
-            # Extract Block 1
-            # Assuming data starts from row 10 based on inspection (indices 9/10), 
-            # but let's just drop rows where Date/Time are NaN later to be safe.
-            block1 = df.iloc[:, [5, 6, 7]].copy()
-            block1.columns = ['Date', 'Time', 'Temp']
-            
-            # Extract Block 2
-            block2 = df.iloc[:, [12, 13, 14]].copy()
-            block2.columns = ['Date', 'Time', 'Temp']
-            
-            # Concatenate blocks
-            combined_df = pd.concat([block1, block2], ignore_index=True)
+            # Every capsule's Date/Hour/Temperature columns, wherever the
+            # logger export puts them (capsule_layout.py)
+            blocks = [block for _, block in read_capsule_blocks(file_path)]
+            if not blocks:
+                print(f"Skipping {filename}: no capsule headers found")
+                continue
+            combined_df = pd.concat(blocks, ignore_index=True)
             
             # Clean data
             combined_df = combined_df.dropna(subset=['Date', 'Time', 'Temp'])
@@ -80,8 +82,11 @@ def plot_temperature():
                 if isinstance(d, datetime.datetime) or isinstance(d, pd.Timestamp):
                     d_date = d.date()
                 else:
-                    # Parse string if needed (unlikely based on read_excel default behavior for dates)
-                    return pd.NaT # Or try parsing
+                    # Text exports (.csv/.tsv) keep the date as a string
+                    d = pd.to_datetime(d, errors='coerce')
+                    if pd.isnull(d):
+                        return pd.NaT
+                    d_date = d.date()
                 
                 if isinstance(t, datetime.time):
                     return datetime.datetime.combine(d_date, t)
@@ -102,26 +107,12 @@ def plot_temperature():
             combined_df['Temp'] = pd.to_numeric(combined_df['Temp'], errors='coerce')
             combined_df = combined_df.dropna(subset=['Temp'])
 
-            plt.plot(combined_df['Datetime'], combined_df['Temp'], label=name)
+            ax.plot(combined_df['Datetime'], combined_df['Temp'], label=name)
             
         except Exception as e:
             print(f"Error processing {filename}: {e}")
             import traceback
             traceback.print_exc()
 
-    plt.title("Temperature 260117")
-    plt.xlabel("Time")
-    plt.ylabel("Temperature")
-    plt.legend()
-    plt.grid(True)
-    
-    # Format x-axis dates nicely
-    import matplotlib.dates as mdates
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-    
-    output_path = os.path.join(downloads_path, "260117_temperature.png")
-    plt.savefig(output_path)
-    print(f"Plot saved to {output_path}")
-
 if __name__ == "__main__":
     plot_temperature()
@@ -1,32 +1,19 @@
-import glob
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
 import datetime
 import matplotlib.dates as mdates
 import numpy as np
 from pathlib import Path
 
+from capsule_layout import read_capsule_blocks
+from cleaning import TempCleaner
+from figure_output import write_behind
+from render_core import figure, save_figure, setup_japanese_font
+from thermo_loaders import find_capsule_files
+
 # --- Configuration ---
 DOWNLOADS_DIR = Path("Downloads")
 
-def setup_japanese_font():
-    potential_fonts = ['Hiragino Sans', 'Hiragino Kaku Gothic ProN', 'Arial Unicode MS', 'Meiryo', 'Yu Gothic', 'TakaoPGothic', 'IPAPGothic']
-    font_name = None
-    for f in potential_fonts:
-        try:
-            if f in [f.name for f in fm.fontManager.ttflist]:
-                font_name = f
-                break
-        except:
-            continue
-    
-    if font_name:
-        plt.rcParams['font.family'] = font_name
-    else:
-        plt.rcParams['font.family'] = 'sans-serif'
-
 def combine_datetime(row):
     d = row['Date']
     t = row['Time']
@@ -37,8 +24,11 @@ def combine_datetime(row):
     if isinstance(d, datetime.datetime) or isinstance(d, pd.Timestamp):
         d_date = d.date()
     else:
-        # Try parsing date string if necessary
-        return pd.NaT
+        # Text exports (.csv/.tsv) keep the date as a string
+        d = pd.to_datetime(d, errors='coerce')
+        if pd.isnull(d):
+            return pd.NaT
+        d_date = d.date()
     
     if isinstance(t, datetime.time):
         return datetime.datetime.combine(d_date, t)
@@ -53,8 +43,8 @@ def combine_datetime(row):
 
 def plot_temperature_filtered():
     DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
-    # Simplified pattern to match 260117*.xlsx
-    files = [f for f in glob.glob(str(DOWNLOADS_DIR / "260117*.xlsx")) if "no" in os.path.basename(f).lower()]
+    # 260117_no*.xlsx, or the logger's .csv/.tsv export of the same sheet
+    files = find_capsule_files(DOWNLOADS_DIR, "260117")
 
     if not files:
         print("No files found matching the pattern.")
@@ -64,14 +54,13 @@ def plot_temperature_filtered():
     
     # Store all data for combined plot
     all_series = []
+    # One cleaner for every capsule, so the report at the end covers them all
+    cleaner = TempCleaner()
 
     for file_path in files:
         filename = os.path.basename(file_path)
         
         try:
-            # Read Excel without header to inspect structure
-            df = pd.read_excel(file_path, header=None)
-            
             # Define Mapping
             # FileNo -> {CapsuleID -> Name}
             # Note: 3-1 means File 3, Capsule 1
@@ -96,52 +85,13 @@ def plot_temperature_filtered():
                 # Let's verify if we should just log warning.
                 pass
 
-            # Find Capsule IDs in Row 6 (Index 6)
-            capsule_row_idx = 6
-            if len(df) <= capsule_row_idx:
-                print(f"Skipping {filename}: Too few rows for Capsule info.")
-                continue
-
-            capsule_row = df.iloc[capsule_row_idx]
-            
-            # Find indices of "Capsule n-X"
-            capsule_indices = []
-            for col_idx, val in capsule_row.items():
-                if isinstance(val, str) and "Capsule" in val:
-                    # Extract ID from "Capsule n-X"
-                    match = re.search(r'n[^\d]*(\d+)', val) # n-1, nｰ1 etc.
-                    if match:
-                        cap_id = int(match.group(1))
-                        capsule_indices.append((col_idx, cap_id))
-            
-            if not capsule_indices:
-                print(f"Warning: No Capsule headers found in {filename} row {capsule_row_idx}. Trying Row 7 for Headers directly?")
-                # Fallback or strict? User mapping relies on IDs.
-                pass
+            # Capsule column groups and the first data row come from the
+            # workbook's header rows (capsule_layout.py)
+            capsule_blocks = read_capsule_blocks(file_path)
+            if not capsule_blocks:
+                print(f"Warning: No Capsule headers found in {filename}.")
 
-            data_start_idx = 8
-            
-            for col_idx, cap_id in capsule_indices:
-                # Based on observation:
-                # Header "Temperature" is usually at col_idx + 3
-                # "Sample", "Date", "Hour", "Temperature"
-                # So Temp is +3, Date is +1, Hour is +2.
-                # Wait, earlier no5 was: Capsule at 0. Temp at 3. (0+3). Correct.
-                # no1: Capsule at 4. Temp at 7. (4+3). Correct.
-                
-                temp_idx = col_idx + 3
-                date_idx = col_idx + 1
-                time_idx = col_idx + 2
-                
-                # Verify header in Row 7 just in case
-                header_row_check = df.iloc[7]
-                if temp_idx >= len(df.columns):
-                    continue
-                
-                # Extract Data
-                data_block = df.iloc[data_start_idx:, [date_idx, time_idx, temp_idx]].copy()
-                data_block.columns = ['Date', 'Time', 'Temp']
-                
+            for cap_id, data_block in capsule_blocks:
                 data_block = data_block.dropna(subset=['Date', 'Time', 'Temp'])
                 if data_block.empty:
                     continue
@@ -158,14 +108,16 @@ def plot_temperature_filtered():
                 max_temp = data_block['Temp'].max()
                 print(f"Debug: {filename} Capsule {cap_id} ({name}) Max Temp: {max_temp}")
                 
-                # Filter >= 36.0
-                filtered_block = data_block[data_block['Temp'] >= 36.0]
+                # Artifact / dropout filtering (see cleaning.py)
+                seconds = data_block['Datetime'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+                keep = cleaner.feed(np.full(len(data_block), name), seconds, data_block['Temp'].to_numpy(dtype=float))
+                filtered_block = data_block[keep]
                 
                 if not filtered_block.empty:
                     all_series.append((name, filtered_block))
-                    plot_individual(filtered_block, name, downloads_path)
+                    plot_individual(filtered_block, name, DOWNLOADS_DIR)
                 else:
-                    print(f"Skipping {name}: Max temp {max_temp} < 36.0")
+                    print(f"Skipping {name}: no samples left after cleaning")
 
 
         except Exception as e:
@@ -178,45 +130,51 @@ def plot_temperature_filtered():
         except Exception as e:
             print(f"Error processing {filename}: {e}")
 
+    print(cleaner.report().to_string(index=False))
+
     # Combined Plot
     if all_series:
-        plt.figure(figsize=(20, 6))
-        for name, df in all_series:
-            plt.plot(df['Datetime'], df['Temp'], label=name)
-        
-        plt.title("Core Temperature Comparison (>= 36.0°C)")
-        plt.xlabel("Time")
-        plt.ylabel("Temperature (°C)")
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.grid(True)
-        plt.tight_layout()
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-        
-        combined_out = os.path.join(downloads_path, "260117_temperature_filtered.png")
-        plt.savefig(combined_out)
-        print(f"Saved combined plot: {combined_out}")
+        with figure(figsize=(20, 6)) as fig:
+            ax = fig.add_subplot()
+            for name, df in all_series:
+                ax.plot(df['Datetime'], df['Temp'], label=name)
+
+            ax.set_title("Core Temperature Comparison (cleaned)")
+            ax.set_xlabel("Time")
+            ax.set_ylabel("Temperature (°C)")
+            ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+            ax.grid(True)
+            fig.tight_layout()
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+
+            combined_out = DOWNLOADS_DIR / "260117_temperature_filtered.png"
+            combined_out = save_figure(fig, combined_out, output_class="overview")
+            print(f"Saved combined plot: {combined_out}")
     else:
         print("No valid series found for combined plot.")
 
 def plot_individual(df, name, output_dir):
-    plt.figure(figsize=(10, 6))
-    plt.plot(df['Datetime'], df['Temp'], label=name, color='orange')
-    plt.title(f"Core Temperature: {name} (>= 36.0°C)")
-    plt.xlabel("Time")
-    plt.ylabel("Temperature (°C)")
-    plt.grid(True)
-    
-    y_max = df['Temp'].max()
-    plt.ylim(36.0, max(y_max + 0.5, 38.0))
-    
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-    
-    safe_name = "".join([c for c in name if c.isalnum() or c in (' ', '_', '-', '.')]).strip()
-    out_name = os.path.join(output_dir, f"CoreTemp_{safe_name}.png")
-    plt.savefig(out_name)
-    plt.close()
+    with figure(figsize=(10, 6)) as fig:
+        ax = fig.add_subplot()
+        ax.plot(df['Datetime'], df['Temp'], label=name, color='orange')
+        ax.set_title(f"Core Temperature: {name} (cleaned)")
+        ax.set_xlabel("Time")
+        ax.set_ylabel("Temperature (°C)")
+        ax.grid(True)
+
+        y_min = df['Temp'].min()
+        y_max = df['Temp'].max()
+        ax.set_ylim(min(y_min - 0.5, 36.0), max(y_max + 0.5, 38.0))
+
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+
+        safe_name = "".join([c for c in name if c.isalnum() or c in (' ', '_', '-', '.')]).strip()
+        out_name = os.path.join(output_dir, f"CoreTemp_{safe_name}.png")
+        out_name = save_figure(fig, out_name, output_class="individual")
     print(f"Saved individual plot: {out_name}")
 
 
 if __name__ == "__main__":
-    plot_temperature_filtered()
+    # PNG encoding and disk writes overlap with building the next figure
+    with write_behind():
+        plot_temperature_filtered()
@@ -1,6 +1,4 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
 import matplotlib.dates as mdates
 import glob
 import os
@@ -8,73 +6,86 @@ import re
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from cleaning import clean_temp_data
+from plot_aligned_experiment import COLOR_MAP
+from render_core import DEFAULT_DPI, figure, save_figure, setup_japanese_font
+from signal_pyramid import open_signal_pyramid, plot_signal
+from thermo_loaders import SESSION, find_capsule_files, load_temp_data, merge_capsules
+
 # --- Configuration ---
 DOWNLOADS_DIR = Path("Downloads")
-
-def setup_japanese_font():
-    potential_fonts = ['Hiragino Sans', 'Hiragino Kaku Gothic ProN', 'Arial Unicode MS', 'Meiryo', 'Yu Gothic', 'TakaoPGothic', 'IPAPGothic']
-    font_name = None
-    for f in potential_fonts:
-        try:
-            if f in [f.name for f in fm.fontManager.ttflist]:
-                font_name = f
-                break
-        except:
-            continue
-    
-    if font_name:
-        plt.rcParams['font.family'] = font_name
-    else:
-        plt.rcParams['font.family'] = 'sans-serif'
+# Plot the cleaned capsules from the precomputed signal pyramid
+# (signal_pyramid.py) instead of re-reading and cleaning every workbook.
+USE_PYRAMID = True
+# Time-of-day range to zoom into, e.g. ("14:00:00", "15:30:00"); None = whole session
+TIME_RANGE = None
+FIGSIZE = (20, 10)
 
 # ... (combine_datetime definition) ...
 
 def plot_thermo_unified():
-    output_path = DOWNLOADS_DIR / "260117_temperature_unified.png"
+    output_path = DOWNLOADS_DIR / f"{SESSION}_temperature_unified.png"
     DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
     
-    files = list(DOWNLOADS_DIR.glob("260117_no*.xlsx")) + list(DOWNLOADS_DIR.glob("260117_No*.xlsx"))
-    files = list(set(files))
+    # <SESSION>_no*.xlsx, or the logger's .csv/.tsv export of the same sheet
+    files = find_capsule_files(DOWNLOADS_DIR, SESSION)
 
     if not files:
-        print("No 260117_no*.xlsx files found.")
+        print(f"No {SESSION}_no* capsule exports found.")
         return
 
     setup_japanese_font()
-    
-    # ... (color_map, name_mapping, all_series loop) ...
-    # (Inside the loop, ensure file_path handles Path object)
-    for file_path in files:
-        filename = file_path.name
-        print(f"Processing {filename}...")
-        
-        try:
-            df = pd.read_excel(file_path, header=None)
-            # ... rest of processing ...
-            # ... (all_series plot logic) ...
-            pass
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+
+    if USE_PYRAMID:
+        plot_thermo_unified_pyramid(output_path)
+        return
+
+    # Every capsule through the shared loaders (capsule_layout.py reads the
+    # workbook or its text export) and cleaning stage.
+    temp_data, cleaning_report = clean_temp_data(load_temp_data(downloads_dir=DOWNLOADS_DIR, session=SESSION))
+    print(cleaning_report.to_string(index=False))
+    all_series = [(name, data) for name, data in merge_capsules(temp_data).items() if not data.empty]
 
     # Plot Unified
     if all_series:
-        plt.figure(figsize=(20, 10))
-        for name, data in all_series:
-            color = color_map.get(name, 'black')
-            plt.plot(data['Datetime'], data['Temp'], label=name, color=color, linewidth=2)
-            
-        plt.title("Core Temperature (Filtered >= 36.0°C)")
-        plt.xlabel("Time")
-        plt.ylabel("Temperature (°C)")
-        plt.legend(loc='upper right', bbox_to_anchor=(1.1, 1))
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-        plt.grid(True)
-        plt.tight_layout()
-        
-        plt.savefig(output_path)
-        print(f"Saved unified plot to {output_path}")
+        with figure(figsize=FIGSIZE) as fig:
+            ax = fig.add_subplot()
+            for name, data in all_series:
+                color = COLOR_MAP.get(name, 'black')
+                ax.plot(data['Datetime'], data['Temp'], label=name, color=color, linewidth=2)
+
+            ax.set_title("Core Temperature (cleaned)")
+            ax.set_xlabel("Time")
+            ax.set_ylabel("Temperature (°C)")
+            ax.legend(loc='upper right', bbox_to_anchor=(1.1, 1))
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+            ax.grid(True)
+            fig.tight_layout()
+
+            output_path = save_figure(fig, output_path, output_class="overview")
+            print(f"Saved unified plot to {output_path}")
     else:
         print("No valid data found to plot.")
 
+def plot_thermo_unified_pyramid(output_path):
+    with figure(figsize=FIGSIZE) as fig:
+        ax = fig.add_subplot()
+        level = plot_signal(ax, open_signal_pyramid(), "temp_clean", TIME_RANGE,
+                            width_px=FIGSIZE[0] * DEFAULT_DPI, colors=COLOR_MAP)
+        if level is None:
+            print("No valid data found to plot.")
+            return
+
+        ax.set_title(f"Core Temperature (cleaned, {level}s bins)")
+        ax.set_xlabel("Time")
+        ax.set_ylabel("Temperature (°C)")
+        ax.legend(loc='upper right', bbox_to_anchor=(1.1, 1))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        ax.grid(True)
+        fig.tight_layout()
+
+        output_path = save_figure(fig, output_path, output_class="overview")
+        print(f"Saved unified plot to {output_path}")
+
 if __name__ == "__main__":
     plot_thermo_unified()
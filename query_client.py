@@ -0,0 +1,90 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+# Must match query_service.py; not imported so the client stays stdlib-only
+# and starts without loading pandas or matplotlib.
+HOST = "127.0.0.1"
+PORT = 8765
+
+# Thin client for query_service.py, e.g.
+#   python query_client.py stats
+#   python query_client.py plot Exp1 --band sd
+#   python query_client.py sheet "Heart Rate" -o hr.csv
+#   python query_client.py workbook --clean
+#   python query_client.py phases
+
+def fetch(path, params=None, host=HOST, port=PORT):
+    url = f"http://{host}:{port}{path}"
+    if params:
+        url += "?" + urlencode(params)
+    start = time.perf_counter()
+    with urlopen(url) as response:
+        body = response.read()
+        server_ms = response.headers.get("X-Elapsed-Ms")
+    total_ms = (time.perf_counter() - start) * 1000
+    print(f"{path}: {len(body)} bytes in {total_ms:.1f} ms (server {server_ms} ms)", file=sys.stderr)
+    return body
+
+def write_output(body, out_path):
+    if out_path is None:
+        sys.stdout.write(body.decode('utf-8-sig'))
+        return
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(body)
+    print(f"Saved {out_path}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local session service (query_service.py).")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--clean", action="store_true", help="use cleaned capsule data")
+    parser.add_argument("--offsets", action="store_true", help="correct device clock offsets")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    plot = sub.add_parser("plot")
+    plot.add_argument("exp", help="experiment prefix, e.g. Exp1")
+    plot.add_argument("--band", default="ci", choices=["ci", "sd", "sem"])
+    plot.add_argument("--format", default="png", choices=["png", "svg", "pdf"])
+    plot.add_argument("-o", "--output")
+    sub.add_parser("sheets")
+    sheet = sub.add_parser("sheet")
+    sheet.add_argument("name")
+    sheet.add_argument("-o", "--output")
+    workbook = sub.add_parser("workbook")
+    workbook.add_argument("-o", "--output", default=str(DOWNLOADS_DIR / "Experiment_Data_Aligned.xlsx"))
+    phases = sub.add_parser("phases")
+    phases.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    flags = {"clean": int(args.clean), "offsets": int(args.offsets)}
+    try:
+        if args.command == "stats":
+            print(json.dumps(json.loads(fetch("/stats", port=args.port)), ensure_ascii=False, indent=1))
+        elif args.command == "plot":
+            body = fetch("/plot/ensemble", {"exp": args.exp, "band": args.band, "format": args.format, **flags}, port=args.port)
+            write_output(body, args.output or DOWNLOADS_DIR / f"{args.exp}_Ensemble.{args.format}")
+        elif args.command == "sheets":
+            print("\n".join(json.loads(fetch("/sheets", flags, port=args.port))))
+        elif args.command == "sheet":
+            write_output(fetch("/sheet", {"name": args.name, **flags}, port=args.port), args.output)
+        elif args.command == "workbook":
+            write_output(fetch("/workbook", flags, port=args.port), args.output)
+        elif args.command == "phases":
+            write_output(fetch("/phases", flags, port=args.port), args.output)
+    except HTTPError as e:
+        print(f"Error {e.code}: {e.reason}", file=sys.stderr)
+        sys.exit(1)
+    except URLError as e:
+        print(f"Service not reachable on port {args.port} ({e.reason}); start it with python query_service.py", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from alignment import load_session_tensor
+from ensemble import ensemble_summary, phase_means
+from events import SCHEDULE_FILE, load_events
+from export_aligned_excel import WRITE_CHARTS, chart_groups, export_sheets, write_workbook
+from plot_aligned_ensemble import BAND, draw_ensemble
+from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+from plot_aligned_grid import PHASES
+from render_core import figure, figure_bytes
+from session_store import DOWNLOADS_DIR, session_sources
+
+# --- Configuration ---
+HOST = "127.0.0.1"        # local only
+PORT = 8765
+CACHE_BYTES = 512 * 1024 ** 2
+ENSEMBLE_FIGSIZE = (14, 10)
+
+# Long-lived local service: the session is loaded and aligned once, and the
+# aligned tensor, summaries, sheets and rendered plots stay in a size-bounded
+# LRU cache. Every cache key carries a fingerprint of the source files (and
+# the reviewed event schedule), so editing a workbook or CSV makes the next
+# request rebuild while stale entries simply age out.
+#
+#   GET /stats                              cache hit rate, size, entries
+#   GET /plot/ensemble?exp=Exp1&band=ci     PNG (format=svg|pdf also work)
+#   GET /sheets                             sheet names of the export
+#   GET /sheet?name=Heart Rate              one export sheet as CSV
+#   GET /workbook                           the whole export as .xlsx
+#   GET /phases                             pre/during/post means per trace (CSV)
+# Every data request takes clean=1 (cleaned capsules) and offsets=1 (clock
+# offset correction) like load_session_tensor. query_client.py wraps these.
+
+def estimate_size(value):
+    # Bytes held by a cached value (arrays, frames, encoded files, containers).
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if is_dataclass(value):
+        return sum(estimate_size(getattr(value, f.name)) for f in fields(value))
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class SizeLRU:
+    # LRU cache bounded by estimated bytes. Concurrent requests for the same
+    # missing key wait for the first build instead of repeating it.
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()     # key -> (value, size)
+        self._building = {}             # key -> threading.Event
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        while True:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return self._items[key][0]
+                pending = self._building.get(key)
+                if pending is None:
+                    self.misses += 1
+                    self._building[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            value = build()
+        finally:
+            with self._lock:
+                self._building.pop(key).set()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._items:
+                self.bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.bytes += size
+            # Always keep the newest entry, even if it alone exceeds the budget.
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._items), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else None,
+                    "keys": [" ".join(map(str, key[:1] + key[2:])) for key in self._items]}
+
+class QueryService:
+
+    def __init__(self, downloads_dir=DOWNLOADS_DIR, cache_bytes=CACHE_BYTES):
+        self.downloads_dir = Path(downloads_dir)
+        self.cache = SizeLRU(cache_bytes)
+        self.started = time.time()
+        self.requests = 0
+
+    def fingerprint(self):
+        files = list(session_sources(self.downloads_dir)) + [SCHEDULE_FILE]
+        return tuple((str(f), os.path.getmtime(f)) for f in files if os.path.exists(f))
+
+    def _get(self, name, params, build):
+        key = (name, self.fingerprint()) + tuple(params)
+        return self.cache.get(key, build)
+
+    def tensor(self, clean=False, offsets=False):
+        def build():
+            events = load_events({"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+            experiments = [("Exp1_", events["Exp1"]), ("Exp2_", events["Exp2"])]
+            return load_session_tensor(experiments, correct_offsets=offsets, clean=clean)
+        return self._get("tensor", (clean, offsets), build)
+
+    def summary(self, clean=False, offsets=False):
+        return self._get("ensemble", (clean, offsets), lambda: ensemble_summary(self.tensor(clean, offsets)))
+
+    def sheets(self, clean=False, offsets=False):
+        return self._get("sheets", (clean, offsets),
+                         lambda: export_sheets(self.tensor(clean, offsets), summary=self.summary(clean, offsets)))
+
+    def sheet_csv(self, name, clean=False, offsets=False):
+        def build():
+            sheets = self.sheets(clean, offsets)
+            if name not in sheets:
+                raise KeyError(f"unknown sheet {name!r}, available: {', '.join(sheets)}")
+            return sheets[name].to_csv().encode('utf-8-sig')
+        return self._get("sheet", (name, clean, offsets), build)
+
+    def workbook(self, clean=False, offsets=False):
+        def build():
+            buffer = io.BytesIO()
+            # Same workbook as export_aligned_excel.main(), native charts included
+            groups = chart_groups(self.tensor(clean, offsets)) if WRITE_CHARTS else None
+            write_workbook(self.sheets(clean, offsets), buffer, groups)
+            return buffer.getvalue()
+        return self._get("workbook", (clean, offsets), build)
+
+    def phases_csv(self, clean=False, offsets=False):
+        def build():
+            table = phase_means(self.tensor(clean, offsets), PHASES)
+            table.columns = [" ".join(c) for c in table.columns]
+            return table.to_csv().encode('utf-8-sig')
+        return self._get("phases", (clean, offsets), build)
+
+    def ensemble_plot(self, exp_name, band=BAND, fmt='png', clean=False, offsets=False):
+        def build():
+            with figure(figsize=ENSEMBLE_FIGSIZE) as fig:
+                draw_ensemble(fig, self.summary(clean, offsets), exp_name, band)
+                return figure_bytes(fig, fmt)
+        return self._get("plot", ("ensemble", exp_name, band, fmt, clean, offsets), build)
+
+    def count_request(self):
+        # Handler threads share the service; the cache lock guards the counter too.
+        with self.cache._lock:
+            self.requests += 1
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self.cache._lock:
+            stats["requests"] = self.requests
+        stats["uptime_s"] = round(time.time() - self.started, 1)
+        return stats
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml", "pdf": "application/pdf",
+                 "csv": "text/csv; charset=utf-8", "json": "application/json; charset=utf-8",
+                 "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    service = None  # set by serve()
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        flags = {"clean": query.get("clean") == "1", "offsets": query.get("offsets") == "1"}
+        service = self.service
+        service.count_request()
+        try:
+            if url.path == "/stats":
+                body, kind = json.dumps(service.stats(), ensure_ascii=False).encode('utf-8'), "json"
+            elif url.path == "/plot/ensemble":
+                kind = query.get("format", "png")
+                body = service.ensemble_plot(query.get("exp", "Exp1"), query.get("band", BAND), kind, **flags)
+            elif url.path == "/sheets":
+                body, kind = json.dumps(list(service.sheets(**flags)), ensure_ascii=False).encode('utf-8'), "json"
+            elif url.path == "/sheet":
+                body, kind = service.sheet_csv(query.get("name", "Heart Rate"), **flags), "csv"
+            elif url.path == "/workbook":
+                body, kind = service.workbook(**flags), "xlsx"
+            elif url.path == "/phases":
+                body, kind = service.phases_csv(**flags), "csv"
+            else:
+                self.send_error(404, f"unknown path {url.path}")
+                return
+        except KeyError as e:
+            self.send_error(404, str(e.args[0]))
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.send_error(500, f"{type(e).__name__}: {e}")
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(kind, "application/octet-stream"))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Elapsed-Ms", f"{elapsed_ms:.1f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+def serve(host=HOST, port=PORT, cache_bytes=CACHE_BYTES):
+    QueryHandler.service = QueryService(cache_bytes=cache_bytes)
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    print(f"Serving {DOWNLOADS_DIR.resolve()} on http://{host}:{port} (cache {cache_bytes / 1024 ** 2:.0f} MB)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    serve()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import io
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import matplotlib
+import matplotlib.font_manager as fm
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# --- Configuration ---
+JAPANESE_FONTS = ['Hiragino Sans', 'Hiragino Kaku Gothic ProN', 'Arial Unicode MS', 'Meiryo', 'Yu Gothic', 'TakaoPGothic', 'IPAPGothic']
+DEFAULT_DPI = 100
+# Per output class: file format, DPI (None = the figure's own) and PNG zlib
+# level (0-9, Pillow's default is 6; lower encodes faster, larger files)
+OUTPUT_CLASSES = {
+    "overview": {"format": "png", "dpi": None, "compress_level": 6},     # whole-session and experiment plots
+    "individual": {"format": "png", "dpi": None, "compress_level": 6},   # one figure per subject and event
+    "grid": {"format": "png", "dpi": None, "compress_level": 6},         # multi-panel grids
+}
+
+# Rendering goes through matplotlib.figure.Figure + FigureCanvasAgg only.
+# Nothing here touches pyplot, so there is no global figure registry that can
+# keep figures alive, and separate threads can each own their own Figure.
+
+_font_lock = threading.Lock()
+_font_family = None
+_figure_writer = None   # set by figure_output.write_behind()
+
+
+def setup_japanese_font():
+    # Resolved once per process; scanning fontManager.ttflist for every figure
+    # is slow and rcParams must not be mutated while other threads draw.
+    global _font_family
+    with _font_lock:
+        if _font_family is None:
+            available = {f.name for f in fm.fontManager.ttflist}
+            _font_family = next((f for f in JAPANESE_FONTS if f in available), 'sans-serif')
+            matplotlib.rcParams['font.family'] = _font_family
+    return _font_family
+
+
+def new_figure(figsize=(10, 6), dpi=DEFAULT_DPI):
+    setup_japanese_font()
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def release_figure(fig):
+    # Break artist -> figure references so the figure is freed immediately by
+    # refcounting instead of waiting for the cyclic GC.
+    fig.clear()
+    fig.canvas = None
+
+
+@contextmanager
+def figure(figsize=(10, 6), dpi=DEFAULT_DPI):
+    fig = new_figure(figsize=figsize, dpi=dpi)
+    try:
+        yield fig
+    finally:
+        release_figure(fig)
+
+
+@contextmanager
+def subplots(nrows=1, ncols=1, figsize=(10, 6), dpi=DEFAULT_DPI, **kwargs):
+    # Same shape as plt.subplots(): yields (fig, axes).
+    with figure(figsize=figsize, dpi=dpi) as fig:
+        axes = fig.subplots(nrows, ncols, **kwargs)
+        yield fig, axes
+
+
+def output_options(output_class=None, dpi=None):
+    options = dict(OUTPUT_CLASSES.get(output_class, {"format": "png", "dpi": None, "compress_level": 6}))
+    if dpi is not None:
+        options["dpi"] = dpi
+    return options
+
+
+def output_path(out_path, options):
+    # The class format decides the suffix, e.g. .png -> .svg
+    return Path(out_path).with_suffix("." + options["format"])
+
+
+def set_figure_writer(writer):
+    # Route save_figure through a write-behind writer (None = save inline).
+    global _figure_writer
+    previous, _figure_writer = _figure_writer, writer
+    return previous
+
+
+def save_figure(fig, out_path, dpi=None, output_class=None):
+    # Returns the path written (its suffix follows the class format). With a
+    # write-behind writer active the file appears once the writer flushes.
+    writer = _figure_writer
+    if writer is not None:
+        return writer.submit(fig, out_path, output_class=output_class, dpi=dpi)
+    options = output_options(output_class, dpi)
+    out_path = output_path(out_path, options)
+    pil_kwargs = {"compress_level": options["compress_level"]} if options["format"] == "png" else None
+    fig.savefig(out_path, dpi=options["dpi"], format=options["format"], pil_kwargs=pil_kwargs)
+    return out_path
+
+
+def figure_bytes(fig, fmt='png', dpi=None):
+    # Encoded image in memory, for callers that serve or cache it.
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi)
+    return buffer.getvalue()
+
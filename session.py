@@ -0,0 +1,244 @@
+import time
+from pathlib import Path
+
+import numpy as np
+
+from alignment import WINDOW, build_aligned_tensor
+from cleaning import clean_temp_data
+from ensemble import ensemble_summary, phase_means
+from events import read_schedule, session_events
+from plot_aligned_grid import PHASES
+from render_core import new_figure, release_figure, save_figure
+from thermo_loaders import DOWNLOADS_DIR, SESSION, data_epoch, load_hr_data_for_subject, load_temp_data, merge_capsules
+
+# --- Configuration ---
+# Stage -> stages it is computed from
+STAGES = {
+    "raw_temp": (),
+    "events": (),
+    "epoch": ("raw_temp",),
+    "hr": ("epoch",),
+    "cleaned": ("raw_temp",),
+    "tensor": ("cleaned", "hr", "events"),
+    "phase_stats": ("tensor",),
+    "summary": ("tensor",),
+    "figures": ("summary",),
+}
+# Setting -> first stages it changes; the directory and session decide both
+# the loaded files and the default events.
+SETTINGS = {"downloads_dir": ("raw_temp", "events"), "session": ("raw_temp", "events"), "clean": ("cleaned",),
+            "events": ("events",), "window": ("tensor",), "phases": ("phase_stats",)}
+
+# In-memory session for notebooks: every stage is computed on first access
+# and kept, and changing a setting drops only the stages that depend on it.
+#
+#   s = Session("Downloads")
+#   s.phase_stats           # loads, cleans, aligns (seconds)
+#   s.window = (-600, 600)  # tensor, phase_stats, summary, figures dropped
+#   s.phase_stats           # re-aligns the frames already in memory (ms)
+#
+# s.timings holds the last compute time of each stage in ms, including the
+# stages it had to compute first.
+
+class Session:
+
+    def __init__(self, downloads_dir=DOWNLOADS_DIR, events=None, window=WINDOW, phases=PHASES, clean=True,
+                 session=SESSION):
+        self._cache = {}
+        self.timings = {}
+        self._settings = {}
+        self.session = session
+        self.downloads_dir = downloads_dir
+        self.events = events
+        self.window = window
+        self.phases = phases
+        self.clean = clean
+
+    def __repr__(self):
+        cached = [name for name in STAGES if name in self._cache]
+        return f"Session({str(self.downloads_dir)!r}, cached={cached})"
+
+    # Settings
+
+    def _set(self, name, value):
+        self._settings[name] = value
+        for stage in SETTINGS[name]:
+            self.invalidate(stage)
+
+    @property
+    def session(self):
+        # YYMMDD of the capsule exports to load
+        return self._settings["session"]
+
+    @session.setter
+    def session(self, value):
+        self._set("session", str(value))
+
+    @property
+    def downloads_dir(self):
+        return self._settings["downloads_dir"]
+
+    @downloads_dir.setter
+    def downloads_dir(self, value):
+        self._set("downloads_dir", Path(value))
+
+    @property
+    def events(self):
+        # {experiment: [(TimeStr, names, suffix), ...]}
+        def load():
+            value = self._settings["events"]
+            if value is None:
+                from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+                value = session_events(self.session, self.downloads_dir, {"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+                if value is None:
+                    print(f"Session {self.session}: no event schedule in {self.downloads_dir}")
+                    value = {}
+            elif isinstance(value, (str, Path)):
+                value = read_schedule(value)
+            return {exp: list(events) for exp, events in value.items()}
+        return self._stage("events", load)
+
+    @events.setter
+    def events(self, value):
+        # A dict as above, a schedule CSV (events.py), or None for the
+        # directory's event_schedule.csv, else (for the 260117 session only)
+        # the hand-typed events; resolved when first needed.
+        self._set("events", value)
+
+    @property
+    def experiments(self):
+        return [(f"{exp}_", events) for exp, events in self.events.items()]
+
+    @property
+    def window(self):
+        return self._settings["window"]
+
+    @window.setter
+    def window(self, value):
+        self._set("window", (int(value[0]), int(value[1])))
+
+    @property
+    def phases(self):
+        return self._settings["phases"]
+
+    @phases.setter
+    def phases(self, value):
+        self._set("phases", dict(value))
+
+    @property
+    def clean(self):
+        return self._settings["clean"]
+
+    @clean.setter
+    def clean(self, value):
+        self._set("clean", bool(value))
+
+    # Stages
+
+    def invalidate(self, stage=None):
+        # Drop `stage` and everything computed from it; None drops all (e.g.
+        # after the files on disk changed).
+        stages = set(STAGES) if stage is None else {stage}
+        changed = True
+        while changed:
+            dependents = {name for name, deps in STAGES.items() if stages & set(deps)}
+            changed = not dependents <= stages
+            stages |= dependents
+        for name in stages:
+            value = self._cache.pop(name, None)
+            if name == "figures" and value:
+                for fig in value.values():
+                    release_figure(fig)
+
+    def _stage(self, name, compute):
+        if name not in self._cache:
+            start = time.perf_counter()
+            self._cache[name] = compute()
+            self.timings[name] = (time.perf_counter() - start) * 1000
+        return self._cache[name]
+
+    @property
+    def raw_temp(self):
+        # [(name, frame), ...] as thermo_loaders.load_temp_data
+        return self._stage("raw_temp", lambda: load_temp_data(downloads_dir=self.downloads_dir, session=self.session))
+
+    @property
+    def epoch(self):
+        return self._stage("epoch", lambda: data_epoch(self.raw_temp))
+
+    @property
+    def hr(self):
+        # {subject: frame} for every HR CSV in the directory, so that editing
+        # the events never reloads HR.
+        def load():
+            frames = {}
+            for path in sorted(self.downloads_dir.glob("心拍数_*.CSV")):
+                name = path.stem.split('_', 1)[1]
+                frames[name] = load_hr_data_for_subject(name, self.epoch, downloads_dir=self.downloads_dir)
+            return frames
+        return self._stage("hr", load)
+
+    @property
+    def cleaned(self):
+        # ({subject: frame}, cleaning report or None), cleaned when self.clean
+        def load():
+            if not self.clean:
+                return merge_capsules(self.raw_temp), None
+            frames, report = clean_temp_data(self.raw_temp)
+            return merge_capsules(frames), report
+        return self._stage("cleaned", load)
+
+    @property
+    def temp(self):
+        return self.cleaned[0]
+
+    @property
+    def cleaning_report(self):
+        return self.cleaned[1]
+
+    @property
+    def tensor(self):
+        # alignment.AlignedTensor over self.window for self.events
+        seconds = np.arange(self.window[0], self.window[1] + 1, 1)
+        return self._stage("tensor", lambda: build_aligned_tensor(self.experiments, self.temp, self.hr,
+                                                                  seconds=seconds))
+
+    @property
+    def phase_stats(self):
+        return self._stage("phase_stats", lambda: phase_means(self.tensor, self.phases))
+
+    @property
+    def summary(self):
+        # ensemble.ensemble_summary (bootstrap CIs)
+        return self._stage("summary", lambda: ensemble_summary(self.tensor))
+
+    @property
+    def figures(self):
+        # {experiment: ensemble Figure}; shown inline by Jupyter
+        from plot_aligned_ensemble import draw_ensemble  # imports plot modules
+
+        def draw():
+            figures = {}
+            for exp in self.events:
+                fig = new_figure(figsize=(14, 10))
+                draw_ensemble(fig, self.summary, exp)
+                figures[exp] = fig
+            return figures
+        return self._stage("figures", draw)
+
+    def save_figures(self, out_dir=None):
+        out_dir = Path(out_dir or self.downloads_dir)
+        return [save_figure(fig, out_dir / f"{exp}_Ensemble.png", output_class="overview")
+                for exp, fig in self.figures.items()]
+
+def main():
+    session = Session()
+    session.phase_stats
+    print(f"Cold: {session.timings}")
+    session.timings.clear()
+    session.window = (-600, 600)
+    print(session.phase_stats.round(2).to_string())
+    print(f"After changing the window: {session.timings}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from thermo_loaders import data_epoch, find_capsule_files, load_hr_data_for_subject, load_temp_data, merge_capsules
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+STORE_DIR = DOWNLOADS_DIR / "session_store"
+INDEX_FILE = "index.json"
+TIME_DTYPE = np.int64
+VALUE_DTYPE = np.float64
+
+# On-disk layout (one directory per session):
+#   index.json              build, signal -> {length, keys: {key: [start, stop]}}, epoch, source mtimes
+#   <signal>.<build>.t.bin  int64 session seconds (see timebase.py) of every key, concatenated
+#   <signal>.<build>.v.bin  float64 values, same order as the .t.bin
+# Each key's samples are one contiguous, time-sorted run, so a worker can
+# open the files read-only with np.memmap and slice them without copying.
+# A rebuild writes new files under a new build id and then swaps index.json,
+# so readers that already mapped (or just read the index of) the previous
+# build keep consistent data; builds older than that are deleted.
+
+def _signal_paths(store_dir, signal, build):
+    store_dir = Path(store_dir)
+    return store_dir / f"{signal}.{build}.t.bin", store_dir / f"{signal}.{build}.v.bin"
+
+def _read_build(index_path):
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            return json.load(f).get("build")
+    except (OSError, ValueError):
+        return None
+
+def remove_old_builds(directory, keep):
+    # Delete <name>.<build>.{t,v}.bin files whose build is not in `keep`.
+    # Mappings that are still open stay valid after the unlink.
+    for path in Path(directory).glob("*.bin"):
+        if path.name.split('.')[-3] not in keep:
+            path.unlink(missing_ok=True)
+
+def write_session_store(store_dir, signals, epoch=None, sources=()):
+    # signals: {signal: {key: (session_seconds, values)}}
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    previous = _read_build(store_dir / INDEX_FILE)
+    build = f"{time.time_ns():x}"
+
+    index = {"time_unit": "s", "epoch": None if epoch is None else str(epoch), "build": build, "signals": {},
+             "sources": {}}
+    for signal, series in signals.items():
+        keys = {}
+        offset = 0
+        for key, (times, values) in series.items():
+            keys[key] = [offset, offset + len(times)]
+            offset += len(times)
+
+        t_path, v_path = _signal_paths(store_dir, signal, build)
+        # np.memmap refuses zero-length files; an empty signal just has no keys.
+        if offset:
+            t_map = np.memmap(t_path, dtype=TIME_DTYPE, mode='w+', shape=(offset,))
+            v_map = np.memmap(v_path, dtype=VALUE_DTYPE, mode='w+', shape=(offset,))
+            for key, (times, values) in series.items():
+                start, stop = keys[key]
+                order = np.argsort(times, kind='stable')
+                t_map[start:stop] = np.asarray(times, dtype=TIME_DTYPE)[order]
+                v_map[start:stop] = np.asarray(values, dtype=VALUE_DTYPE)[order]
+            t_map.flush()
+            v_map.flush()
+            del t_map, v_map
+
+        index["signals"][signal] = {"length": offset, "keys": keys}
+
+    for source in sources:
+        index["sources"][str(source)] = os.path.getmtime(source)
+
+    # Index last, so a half-written store is never picked up as warm.
+    tmp_path = store_dir / (INDEX_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, store_dir / INDEX_FILE)
+    remove_old_builds(store_dir, {build, previous})
+    return store_dir
+
+class SessionStore:
+    # Read-only view over a session store. Pickles as its path only, so it can
+    # be handed to process-pool workers, which re-open the same mapping.
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / INDEX_FILE, encoding='utf-8') as f:
+            self.index = json.load(f)
+        self._maps = {}
+
+    def __getstate__(self):
+        return {"store_dir": self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state["store_dir"])
+
+    def epoch(self):
+        epoch = self.index.get("epoch")
+        return None if epoch is None else np.datetime64(epoch, 's')
+
+    def signals(self):
+        return list(self.index["signals"])
+
+    def keys(self, signal):
+        return list(self.index["signals"].get(signal, {}).get("keys", {}))
+
+    def _arrays(self, signal):
+        if signal not in self._maps:
+            length = self.index["signals"][signal]["length"]
+            if length == 0:
+                self._maps[signal] = (np.empty(0, TIME_DTYPE), np.empty(0, VALUE_DTYPE))
+            else:
+                t_path, v_path = _signal_paths(self.store_dir, signal, self.index["build"])
+                self._maps[signal] = (
+                    np.memmap(t_path, dtype=TIME_DTYPE, mode='r', shape=(length,)),
+                    np.memmap(v_path, dtype=VALUE_DTYPE, mode='r', shape=(length,)),
+                )
+        return self._maps[signal]
+
+    def series(self, signal, key):
+        # Zero-copy views into the mapping; empty arrays for unknown keys.
+        keys = self.index["signals"].get(signal, {}).get("keys", {})
+        if key not in keys:
+            return np.empty(0, TIME_DTYPE), np.empty(0, VALUE_DTYPE)
+        start, stop = keys[key]
+        times, values = self._arrays(signal)
+        return times[start:stop], values[start:stop]
+
+    def window(self, signal, key, t_start, t_end):
+        # Samples with t_start <= t <= t_end, still views into the mapping.
+        times, values = self.series(signal, key)
+        lo = np.searchsorted(times, t_start, side='left')
+        hi = np.searchsorted(times, t_end, side='right')
+        return times[lo:hi], values[lo:hi]
+
+def is_warm(store_dir, sources):
+    index_path = Path(store_dir) / INDEX_FILE
+    if not index_path.exists():
+        return False
+    with open(index_path, encoding='utf-8') as f:
+        index = json.load(f)
+    current = {str(s): os.path.getmtime(s) for s in sources}
+    return "build" in index and index.get("sources", {}) == current
+
+def session_sources(downloads_dir=DOWNLOADS_DIR):
+    downloads_dir = Path(downloads_dir)
+    return sorted(set(find_capsule_files(downloads_dir)) | set(downloads_dir.glob("心拍数_*.CSV")))
+
+def build_session_store(store_dir=STORE_DIR, downloads_dir=DOWNLOADS_DIR):
+    temp_data = load_temp_data(downloads_dir=downloads_dir)
+    epoch = data_epoch(temp_data)
+    temp = {}
+    for name, df in merge_capsules(temp_data).items():
+        df = df.dropna(subset=['Temp'])
+        temp[name] = (df['SessionSeconds'].to_numpy(), df['Temp'].to_numpy(dtype=float))
+
+    hr = {}
+    for path in Path(downloads_dir).glob("心拍数_*.CSV"):
+        name = path.stem.split('_', 1)[1]
+        df = load_hr_data_for_subject(name, epoch, downloads_dir=downloads_dir)
+        if df.empty or 'HR (bpm)' not in df.columns:
+            continue
+        hr[name] = (df['SessionSeconds'].to_numpy(), df['HR (bpm)'].to_numpy(dtype=float))
+
+    return write_session_store(store_dir, {"temp": temp, "hr": hr}, epoch=epoch, sources=session_sources(downloads_dir))
+
+def open_session_store(store_dir=STORE_DIR, downloads_dir=DOWNLOADS_DIR):
+    # Warm start is just an mmap; the workbooks are only parsed when a source
+    # file was added or modified since the store was written.
+    sources = session_sources(downloads_dir)
+    if not is_warm(store_dir, sources):
+        build_session_store(store_dir, downloads_dir)
+    return SessionStore(store_dir)
+
+def main():
+    store = open_session_store()
+    for signal in store.signals():
+        print(f"{signal}: {len(store.keys(signal))} series")
+        for key in store.keys(signal):
+            times, _ = store.series(signal, key)
+            print(f"  {key}: {len(times)} samples")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import matplotlib.dates as mdates
+import numpy as np
+
+from cleaning import TempCleaner
+from session_store import DOWNLOADS_DIR, STORE_DIR, open_session_store, remove_old_builds
+from timebase import clock_to_seconds, from_session_seconds, unwrap_midnight
+
+# --- Configuration ---
+PYRAMID_DIR = "pyramid"           # inside the session store directory
+PYRAMID_INDEX = "pyramid.json"
+LEVELS = [1, 10, 60, 600]         # bin widths in seconds
+POINTS_PER_PIXEL = 2              # finest level with at most this many bins per pixel
+GAP_SECONDS = 60                  # lines are broken across longer gaps
+# Derived signals: name -> source signal in the session store; "temp_clean"
+# runs the source through cleaning.TempCleaner before binning.
+DERIVED_SIGNALS = {"temp_clean": "temp"}
+
+# Per signal, key and level the pyramid holds one row per non-empty bin:
+#   <signal>.<level>s.<build>.t.bin   int64 bin start (session seconds)
+#   <signal>.<level>s.<build>.v.bin   float64 (n, 4): min, max, mean, count
+# Rebuilds write under a new build id and then swap the index, like the
+# session store, so a running viewer keeps its mapped build.
+# Level 1 is built from the raw samples, every coarser level from the one
+# below it, so a build is a few reduceat passes per series. A query picks
+# the level from the requested span and pixel width, then slices it with
+# searchsorted; the work depends on the plot width, not on the data length.
+
+@dataclass
+class PyramidSlice:
+    level: int            # bin width in seconds
+    t: np.ndarray         # bin start, session seconds
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+    count: np.ndarray
+
+def _level_paths(pyramid_dir, signal, level, build):
+    pyramid_dir = Path(pyramid_dir)
+    return pyramid_dir / f"{signal}.{level}s.{build}.t.bin", pyramid_dir / f"{signal}.{level}s.{build}.v.bin"
+
+def bin_reduce(times, mins, maxs, sums, counts, level):
+    # Merge time-sorted rows into `level`-second bins.
+    times = np.asarray(times, dtype=np.int64)
+    if times.size == 0:
+        return np.empty(0, np.int64), np.empty((0, 4))
+    bins = (times // level) * level
+    starts = np.flatnonzero(np.concatenate([[True], bins[1:] != bins[:-1]]))
+    total = np.add.reduceat(counts, starts)
+    stats = np.empty((starts.size, 4))
+    stats[:, 0] = np.minimum.reduceat(mins, starts)
+    stats[:, 1] = np.maximum.reduceat(maxs, starts)
+    stats[:, 2] = np.add.reduceat(sums, starts) / total
+    stats[:, 3] = total
+    return bins[starts], stats
+
+def series_levels(times, values, levels=LEVELS):
+    # {level: (bin_t, stats)} for one time-sorted series.
+    values = np.asarray(values, dtype=float)
+    ok = np.isfinite(values)
+    times, values = np.asarray(times, dtype=np.int64)[ok], values[ok]
+    out = {}
+    t, stats = times, np.column_stack([values, values, values, np.ones_like(values)])
+    for level in sorted(levels):
+        t, stats = bin_reduce(t, stats[:, 0], stats[:, 1], stats[:, 2] * stats[:, 3], stats[:, 3], level)
+        out[level] = (t, stats)
+    return out
+
+def _store_series(store):
+    # {signal: {key: (times, values)}} including the derived signals.
+    signals = {signal: {key: store.series(signal, key) for key in store.keys(signal)}
+               for signal in store.signals()}
+    for name, source in DERIVED_SIGNALS.items():
+        if source not in signals:
+            continue
+        cleaner = TempCleaner()
+        derived = {}
+        for key, (times, values) in signals[source].items():
+            keep = cleaner.feed(np.full(len(times), key), times, values)
+            derived[key] = (times[keep], values[keep])
+        signals[name] = derived
+    return signals
+
+def cleaning_hash():
+    # Fingerprint of the effective cleaning.CLEANING_CONFIG behind the derived signals.
+    return hashlib.sha1(json.dumps(TempCleaner().config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def build_signal_pyramid(store, levels=LEVELS):
+    pyramid_dir = store.store_dir / PYRAMID_DIR
+    pyramid_dir.mkdir(parents=True, exist_ok=True)
+    index_path = pyramid_dir / PYRAMID_INDEX
+    previous = None
+    if index_path.exists():
+        with open(index_path, encoding='utf-8') as f:
+            previous = json.load(f).get("build")
+    build = f"{time.time_ns():x}"
+    index = {"levels": sorted(levels), "epoch": store.index.get("epoch"), "sources": store.index.get("sources", {}),
+             "cleaning": cleaning_hash(), "build": build, "signals": {}}
+
+    for signal, series in _store_series(store).items():
+        per_key = {key: series_levels(times, values, levels) for key, (times, values) in series.items()}
+        index["signals"][signal] = {}
+        for level in sorted(levels):
+            keys, offset = {}, 0
+            for key, by_level in per_key.items():
+                n = len(by_level[level][0])
+                keys[key] = [offset, offset + n]
+                offset += n
+            if offset:
+                t_path, v_path = _level_paths(pyramid_dir, signal, level, build)
+                np.concatenate([by_level[level][0] for by_level in per_key.values()]).astype(np.int64).tofile(t_path)
+                np.concatenate([by_level[level][1] for by_level in per_key.values()]).astype(np.float64).tofile(v_path)
+            index["signals"][signal][str(level)] = {"length": offset, "keys": keys}
+
+    tmp_path = pyramid_dir / (PYRAMID_INDEX + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, index_path)
+    remove_old_builds(pyramid_dir, {build, previous})
+    return pyramid_dir
+
+class SignalPyramid:
+    # Read-only, memory-mapped pyramid next to a session store.
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.pyramid_dir = Path(store_dir) / PYRAMID_DIR
+        with open(self.pyramid_dir / PYRAMID_INDEX, encoding='utf-8') as f:
+            self.index = json.load(f)
+        self.levels = self.index["levels"]
+        self._maps = {}
+
+    def epoch(self):
+        epoch = self.index.get("epoch")
+        return None if epoch is None else np.datetime64(epoch, 's')
+
+    def signals(self):
+        return list(self.index["signals"])
+
+    def keys(self, signal):
+        return list(self.index["signals"].get(signal, {}).get(str(self.levels[0]), {}).get("keys", {}))
+
+    def _arrays(self, signal, level):
+        if (signal, level) not in self._maps:
+            length = self.index["signals"][signal][str(level)]["length"]
+            if length == 0:
+                self._maps[signal, level] = (np.empty(0, np.int64), np.empty((0, 4)))
+            else:
+                t_path, v_path = _level_paths(self.pyramid_dir, signal, level, self.index["build"])
+                self._maps[signal, level] = (
+                    np.memmap(t_path, dtype=np.int64, mode='r', shape=(length,)),
+                    np.memmap(v_path, dtype=np.float64, mode='r', shape=(length, 4)),
+                )
+        return self._maps[signal, level]
+
+    def extent(self, signal):
+        # (first, last) session second over all keys, None if empty.
+        level = self.levels[-1]
+        times, _ = self._arrays(signal, level)
+        if times.size == 0:
+            return None
+        return int(times.min()), int(times.max()) + level
+
+    def choose_level(self, span, width_px):
+        needed = span / max(1, width_px * POINTS_PER_PIXEL)
+        for level in self.levels:
+            if level >= needed:
+                return level
+        return self.levels[-1]
+
+    def query(self, signal, key, t_start, t_end, width_px=None, level=None):
+        # Bins overlapping [t_start, t_end] at `level`, or at the finest level
+        # that still fits width_px pixels.
+        if level is None:
+            level = self.choose_level(t_end - t_start, width_px) if width_px else self.levels[0]
+        empty = PyramidSlice(level, *(np.empty(0),) * 5)
+        keys = self.index["signals"].get(signal, {}).get(str(level), {}).get("keys", {})
+        if key not in keys:
+            return empty
+        start, stop = keys[key]
+        times, stats = self._arrays(signal, level)
+        times, stats = times[start:stop], stats[start:stop]
+        lo = np.searchsorted(times, t_start - level + 1, side='left')
+        hi = np.searchsorted(times, t_end, side='right')
+        stats = stats[lo:hi]
+        return PyramidSlice(level, times[lo:hi], stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3])
+
+def is_current(store):
+    index_path = store.store_dir / PYRAMID_DIR / PYRAMID_INDEX
+    if not index_path.exists():
+        return False
+    with open(index_path, encoding='utf-8') as f:
+        index = json.load(f)
+    return ("build" in index and index.get("sources") == store.index.get("sources", {})
+            and index.get("levels") == sorted(LEVELS) and index.get("cleaning") == cleaning_hash())
+
+def open_signal_pyramid(store_dir=STORE_DIR, downloads_dir=DOWNLOADS_DIR):
+    # Rebuilt whenever the session store was rebuilt from newer sources or
+    # the cleaning config changed.
+    store = open_session_store(store_dir, downloads_dir)
+    if not is_current(store):
+        build_signal_pyramid(store)
+    return SignalPyramid(store_dir)
+
+def plot_envelope(ax, piece, epoch, color=None, label=None, linewidth=1.5):
+    # Mean line plus a min/max band; lines break across data gaps.
+    if piece.t.size == 0:
+        return
+    if epoch is None:
+        epoch = np.datetime64(0, 's')  # clock-only data: times of day still format correctly
+    breaks = np.flatnonzero(np.diff(piece.t) > max(GAP_SECONDS, 2 * piece.level)) + 1
+    x = mdates.date2num(from_session_seconds(piece.t + piece.level // 2, epoch))
+    x = np.insert(x, breaks, np.nan)
+    mean = np.insert(piece.mean, breaks, np.nan)
+    line, = ax.plot(x, mean, color=color, label=label, linewidth=linewidth)
+    if piece.level > 1:
+        ax.fill_between(x, np.insert(piece.min, breaks, np.nan), np.insert(piece.max, breaks, np.nan),
+                        color=line.get_color(), alpha=0.25, linewidth=0)
+
+def time_range_seconds(pyramid, signal, time_range=None):
+    # ("HH:MM:SS", "HH:MM:SS") on the session date -> session seconds;
+    # None -> the whole extent of the signal.
+    if time_range is None:
+        return pyramid.extent(signal)
+    t_start, t_end = unwrap_midnight(clock_to_seconds(list(time_range)))
+    return int(t_start), int(t_end)
+
+def plot_signal(ax, pyramid, signal, time_range=None, width_px=2000, colors=None):
+    # One envelope per key; returns the level used (seconds per bin).
+    bounds = time_range_seconds(pyramid, signal, time_range)
+    if bounds is None:
+        return None
+    level = pyramid.choose_level(bounds[1] - bounds[0], width_px)
+    for key in pyramid.keys(signal):
+        piece = pyramid.query(signal, key, bounds[0], bounds[1], level=level)
+        plot_envelope(ax, piece, pyramid.epoch(), color=(colors or {}).get(key), label=key)
+    return level
+
+def main():
+    pyramid = open_signal_pyramid()
+    for signal in pyramid.signals():
+        sizes = {level: pyramid.index["signals"][signal][str(level)]["length"] for level in pyramid.levels}
+        print(f"{signal}: {len(pyramid.keys(signal))} series, bins per level {sizes}")
+
+if __name__ == "__main__":
+    main()
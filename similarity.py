@@ -0,0 +1,235 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.cluster.hierarchy import fcluster, linkage
+    from scipy.spatial.distance import squareform
+except ImportError:  # optional; cluster() falls back to a NumPy agglomeration
+    linkage = None
+
+from timebase import block_means
+
+# --- Configuration ---
+SIGNAL = "hr"               # AlignedTensor signal to compare ("hr" or "temp")
+RESOLUTION = 5              # s; windows are compared on block means (timebase.block_means)
+MIN_COVERAGE = 0.8          # fraction of finite points a window needs to be compared
+METRIC = "euclidean"        # distance matrix for clustering: "euclidean" or "dtw" (quadratic, see below)
+BAND = 6                    # Sakoe-Chiba radius for DTW, in points (6 x 5 s = 30 s)
+K = 3
+N_CLUSTERS = 4
+METHOD = "average"          # linkage: "average", "complete" or "single"
+OUTLIER_Z = 3.0             # robust z of the mean k-NN distance that flags a trial
+PAIR_CHUNK = 20000          # DTW pairs per vectorized batch
+
+# Response-curve similarity over aligned event windows. Every window is
+# reduced to RESOLUTION-second block means, its gaps are interpolated and it
+# is z-normalized, so shape is compared rather than level or amplitude.
+#   euclidean  one matrix product for the whole distance matrix
+#   dtw        banded DTW, vectorized over thousands of pairs at once: along
+#              each row of the DP, x[k] = c[k] + min(a[k], x[k-1]) is solved
+#              with a cumulative sum and a running minimum, so the only
+#              Python loop is over the window length
+# k-NN queries under DTW are pruned with LB_Keogh: candidates are visited in
+# lower-bound order and exact DTW stops once the bound exceeds the k-th best.
+# With BAND = 0, DTW equals the Euclidean distance.
+# Cost: clustering 2000 windows on the Euclidean matrix takes about a second
+# and a pruned DTW query against them about 0.1 s. The full DTW matrix grows
+# with the square of the window count (~7 s for 500 windows of 144 points,
+# ~100 s for 2000), so clustering defaults to "euclidean" and DTW is meant
+# for knn() lookups or small sets.
+
+def prepare(seconds, values, resolution=RESOLUTION, min_coverage=MIN_COVERAGE):
+    # (rows, n) aligned windows -> (z-normalized (rows, m), usable mask)
+    if resolution:
+        _, values = block_means(seconds, values, resolution)
+    values = np.array(values, dtype=float)
+    finite = np.isfinite(values)
+    usable = finite.mean(axis=1) >= min_coverage
+    x = np.arange(values.shape[1])
+    for i in np.flatnonzero(usable & ~finite.all(axis=1)):
+        values[i] = np.interp(x, x[finite[i]], values[i, finite[i]])
+    values[~usable] = 0.0
+    mean = values.mean(axis=1, keepdims=True)
+    sd = values.std(axis=1, keepdims=True)
+    z = np.divide(values - mean, sd, out=np.zeros_like(values), where=sd > 0)
+    return z, usable
+
+def euclidean_matrix(Z):
+    sq = (Z * Z).sum(axis=1)
+    d2 = sq[:, None] + sq[None, :] - 2.0 * Z @ Z.T
+    np.fill_diagonal(d2, 0.0)
+    return np.sqrt(np.maximum(d2, 0.0))
+
+def dtw_pairs(A, B, band=BAND):
+    # Banded DTW distance between A[p] and B[p] for every pair p; (P, m) each.
+    # The DP runs on (band cell, pair) arrays, so every step is a row op.
+    P, m = A.shape
+    width = 2 * band + 1
+    AT = np.ascontiguousarray(A.T)
+    BT = np.pad(np.ascontiguousarray(B.T), ((band, band), (0, 0)))
+    j = np.arange(-band, band + 1)
+    a = np.full((width, P), np.inf)
+    a[band] = 0.0                   # first row: only rightward steps from (0, 0)
+    row = np.empty((width, P))
+    for i in range(m):
+        c = np.subtract(AT[i], BT[i:i + width])
+        np.square(c, out=c)
+        outside = (i + j < 0) | (i + j >= m)        # cells (i, i + k) off the matrix
+        edge = i < band or i >= m - band
+        if edge:
+            c[outside] = 0.0
+            a[outside] = np.inf
+        C = np.cumsum(c, axis=0)
+        np.subtract(C, c, out=c)
+        np.subtract(a, c, out=a)
+        np.minimum.accumulate(a, axis=0, out=a)
+        np.add(C, a, out=row)
+        if edge:
+            row[outside] = np.inf
+        # next row: from (i-1, j-1) [same k] or (i-1, j) [k + 1]
+        np.minimum(row[:-1], row[1:], out=a[:-1])
+        a[-1] = row[-1]
+    return np.sqrt(row[band])
+
+def dtw_matrix(Z, band=BAND, chunk=PAIR_CHUNK):
+    n = len(Z)
+    D = np.zeros((n, n))
+    I, J = np.triu_indices(n, 1)
+    for s in range(0, len(I), chunk):
+        i, j = I[s:s + chunk], J[s:s + chunk]
+        D[i, j] = D[j, i] = dtw_pairs(Z[i], Z[j], band)
+    return D
+
+def lb_keogh(query, Z, band=BAND):
+    # Lower bound of dtw(query, Z[r]) for every row r (same band).
+    padded = np.pad(query, band, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * band + 1)
+    upper, lower = windows.max(axis=1), windows.min(axis=1)
+    above = np.maximum(Z - upper, 0.0)
+    below = np.maximum(lower - Z, 0.0)
+    return np.sqrt((above ** 2 + below ** 2).sum(axis=1))
+
+def knn(Z, query, k=K, metric="dtw", band=BAND, exclude=None, batch=64):
+    # k nearest rows of Z to `query` (a row index or an (m,) array):
+    # (indices, distances, exact DTW computations).
+    if isinstance(query, (int, np.integer)):
+        exclude = query if exclude is None else exclude
+        query = Z[query]
+    candidates = np.array([r for r in range(len(Z)) if r != exclude])
+    if metric == "euclidean":
+        d = np.sqrt(((Z[candidates] - query) ** 2).sum(axis=1))
+        order = np.argsort(d, kind='stable')[:k]
+        return candidates[order], d[order], 0
+
+    lb = lb_keogh(query, Z[candidates], band)
+    order = np.argsort(lb, kind='stable')
+    best_idx, best_d = np.empty(0, dtype=int), np.empty(0)
+    computed = 0
+    for s in range(0, len(order), batch):
+        # Nothing left can beat the current k-th best.
+        if len(best_d) == k and lb[order[s]] >= best_d[-1]:
+            break
+        rows = order[s:s + batch]
+        d = dtw_pairs(np.broadcast_to(query, (len(rows), len(query))), Z[candidates[rows]], band)
+        computed += len(rows)
+        best_idx = np.concatenate([best_idx, candidates[rows]])
+        best_d = np.concatenate([best_d, d])
+        keep = np.argsort(best_d, kind='stable')[:k]
+        best_idx, best_d = best_idx[keep], best_d[keep]
+    return best_idx, best_d, computed
+
+def _relabel(labels):
+    # Clusters numbered 1.. in order of first appearance.
+    mapping = {}
+    return np.array([mapping.setdefault(l, len(mapping) + 1) for l in labels])
+
+def cluster(D, n_clusters=N_CLUSTERS, method=METHOD):
+    # Agglomerative clustering of a distance matrix into n_clusters labels.
+    n = len(D)
+    if n <= n_clusters:
+        return np.arange(1, n + 1)
+    if linkage is not None:
+        Z = linkage(squareform(D, checks=False), method=method)
+        return _relabel(fcluster(Z, n_clusters, criterion='maxclust'))
+
+    # Lance-Williams updates on a working copy of the matrix. Each row keeps
+    # its nearest column, so a merge only rescans the rows it touched.
+    D = D.astype(float).copy()
+    np.fill_diagonal(D, np.inf)
+    size = np.ones(n)
+    members = np.arange(n)
+    index = np.arange(n)
+    nearest = D.argmin(axis=1)
+    for _ in range(n - n_clusters):
+        a = np.argmin(D[index, nearest])
+        b = nearest[a]
+        if method == "single":
+            merged = np.minimum(D[a], D[b])
+        elif method == "complete":
+            merged = np.maximum(D[a], D[b])
+        else:
+            merged = (size[a] * D[a] + size[b] * D[b]) / (size[a] + size[b])
+        D[a], D[:, a] = merged, merged
+        D[a, a] = np.inf
+        D[b], D[:, b] = np.inf, np.inf
+        size[a] += size[b]
+        members[members == b] = a
+        stale = (nearest == a) | (nearest == b)
+        stale[a] = True
+        nearest[stale] = D[stale].argmin(axis=1)
+        closer = D[:, a] < D[index, nearest]
+        nearest[closer] = a
+    return _relabel(members)
+
+def atypical(D, k=K, z=OUTLIER_Z):
+    # Mean distance to the k nearest other windows and its robust z-score.
+    D = D.copy()
+    np.fill_diagonal(D, np.inf)
+    score = np.sort(D, axis=1)[:, :k].mean(axis=1)
+    median = np.median(score)
+    mad = 1.4826 * np.median(np.abs(score - median))
+    robust = (score - median) / mad if mad > 0 else np.zeros_like(score)
+    return score, robust, robust > z
+
+def similarity_table(rows, seconds, values, metric=METRIC, k=K, n_clusters=N_CLUSTERS):
+    # rows: AlignedTensor.rows (plus e.g. a session column); one output row
+    # per usable window with its cluster, k nearest labels and outlier score.
+    Z, usable = prepare(seconds, values)
+    rows = rows[usable].reset_index(drop=True)
+    Z = Z[usable]
+    D = dtw_matrix(Z) if metric == "dtw" else euclidean_matrix(Z)
+    labels = cluster(D, n_clusters)
+    score, robust, flagged = atypical(D, k)
+    order = np.argsort(np.where(np.eye(len(D), dtype=bool), np.inf, D), axis=1)[:, :k]
+    table = rows.assign(cluster=labels, knn_score=score, robust_z=robust, atypical=flagged,
+                        neighbours=[", ".join(rows["label"].iloc[o]) for o in order])
+    return table, D
+
+def main():
+    from session import Session
+    from thermo_loaders import find_sessions
+
+    frames, blocks = [], []
+    for session, directory in find_sessions().items():
+        s = Session(directory, session=session)
+        if not s.events:
+            continue
+        tensor = s.tensor
+        frames.append(tensor.rows.assign(session=session, label=session + "_" + tensor.rows["label"]))
+        blocks.append(getattr(tensor, SIGNAL))
+        seconds = tensor.seconds
+    if not frames:
+        print("No sessions found.")
+        return
+    rows = pd.concat(frames, ignore_index=True)
+    values = np.concatenate(blocks)
+
+    start = time.perf_counter()
+    table, D = similarity_table(rows, seconds, values)
+    print(f"{len(table)} windows, {METRIC} matrix and clustering in {time.perf_counter() - start:.2f} s")
+    print(table[["label", "cluster", "knn_score", "robust_z", "atypical", "neighbours"]].round(2).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import gc
+import os
+import resource
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from render_core import figure, save_figure
+
+# --- Configuration ---
+N_FIGURES = 2000
+N_WORKERS = 4
+WARMUP_FIGURES = 300
+SAMPLE_EVERY = 250
+MAX_RSS_GROWTH_MB = 20.0
+
+# Soak test for render_core: renders thousands of figures from a thread pool
+# and checks that resident memory stays flat once the font/glyph caches are
+# warm. Exits non-zero if RSS keeps growing.
+
+def current_rss_mb():
+    # /proc gives the *current* RSS; ru_maxrss is only the peak, used as a
+    # fallback on platforms without procfs.
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def render_one(i, out_dir):
+    rng = np.random.default_rng(i)
+    t = np.arange(-300, 421) / 60.0
+    with figure(figsize=(6, 4)) as fig:
+        ax1 = fig.add_subplot()
+        ax1.plot(t, 70 + np.cumsum(rng.normal(0, 1, t.size)), linewidth=1)
+        ax2 = ax1.twinx()
+        ax2.plot(t, 37 + np.cumsum(rng.normal(0, 0.01, t.size)), linestyle=':')
+        ax1.set_title(f"soak {i}")
+        # Overwrite a handful of files so disk usage stays bounded too.
+        save_figure(fig, Path(out_dir) / f"soak_{i % N_WORKERS}_{i % 7}.png")
+
+def main():
+    samples = []
+    with tempfile.TemporaryDirectory() as out_dir, ThreadPoolExecutor(max_workers=N_WORKERS) as pool:
+        for start in range(0, N_FIGURES, SAMPLE_EVERY):
+            batch = range(start, min(start + SAMPLE_EVERY, N_FIGURES))
+            list(pool.map(lambda i: render_one(i, out_dir), batch))
+            gc.collect()
+            rss = current_rss_mb()
+            samples.append((batch[-1] + 1, rss))
+            print(f"{batch[-1] + 1:6d} figures  RSS {rss:8.1f} MB")
+
+    baseline = next(rss for n, rss in samples if n >= WARMUP_FIGURES)
+    growth = samples[-1][1] - baseline
+    print(f"RSS growth after warmup: {growth:+.1f} MB (limit {MAX_RSS_GROWTH_MB} MB)")
+    if growth > MAX_RSS_GROWTH_MB:
+        print("FAIL: memory keeps growing, figures are leaking.")
+        return 1
+    print("OK: RSS is flat.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
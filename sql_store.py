@@ -0,0 +1,171 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from alignment import WINDOW
+from cleaning import clean_temp_data
+from plot_aligned_grid import PHASES
+from thermo_loaders import (DOWNLOADS_DIR, data_epoch, find_sessions, load_hr_data_for_subject, load_temp_data,
+                            source_mtimes)
+from timebase import event_seconds
+
+# --- Configuration ---
+DB_PATH = DOWNLOADS_DIR / "sessions.sqlite"
+INSERT_BATCH = 50000
+
+# One SQLite file for every session. samples is clustered on
+# (session, subject, signal, t) (WITHOUT ROWID), so a window is one index
+# range scan; a second index on (subject, signal, session, t) serves
+# subject-first longitudinal queries. events holds each session's schedule
+# so phase aggregates are a single join. SQLite stores NaN as NULL, and AVG
+# skips NULLs, which matches the nanmean of calculate_stats.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    epoch TEXT,
+    sources TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    session TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    signal TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (session, subject, signal, t)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_by_subject ON samples (subject, signal, session, t);
+CREATE TABLE IF NOT EXISTS events (
+    session TEXT NOT NULL,
+    experiment TEXT NOT NULL,
+    time_str TEXT NOT NULL,
+    event_t INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    suffix TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (session, subject);
+"""
+
+WINDOW_SQL = """
+SELECT t - :event_t AS rel_t, value FROM samples
+WHERE session = :session AND subject = :subject AND signal = :signal
+  AND t BETWEEN :event_t + :lo AND :event_t + :hi
+ORDER BY t
+"""
+
+def _phase_condition(phase, lo, hi):
+    # Same bounds as plot_aligned_grid.calculate_stats: [lo, hi), post [lo, hi].
+    upper = "<=" if phase == "post" else "<"
+    return f"s.t - e.event_t >= {int(lo)} AND s.t - e.event_t {upper} {int(hi)}"
+
+def phase_sql(phases=PHASES):
+    columns = ",\n    ".join(f"AVG(CASE WHEN {_phase_condition(p, lo, hi)} THEN s.value END) AS {p}"
+                             for p, (lo, hi) in phases.items())
+    lo = min(b[0] for b in phases.values())
+    hi = max(b[1] for b in phases.values())
+    return f"""
+SELECT e.session, e.experiment, e.subject, e.suffix, e.time_str, e.event_t,
+    {columns}
+FROM events e
+JOIN samples s ON s.session = e.session AND s.subject = e.subject AND s.signal = :signal
+    AND s.t BETWEEN e.event_t + {int(lo)} AND e.event_t + {int(hi)}
+GROUP BY e.rowid
+ORDER BY e.session, e.event_t, e.subject
+"""
+
+def connect(db_path=DB_PATH):
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def insert_series(conn, session, subject, signal, times, values):
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    # INSERT_BATCH rows per executemany, so only one batch is ever converted
+    # to Python tuples. Duplicate timestamps keep the first sample, like
+    # timebase.align_nearest.
+    for start in range(0, len(times), INSERT_BATCH):
+        t, v = times[start:start + INSERT_BATCH], values[start:start + INSERT_BATCH]
+        rows = zip([session] * len(t), [subject] * len(t), [signal] * len(t), t.tolist(), v.tolist())
+        conn.executemany("INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?, ?)", rows)
+
+def ingest_session(conn, session, directory):
+    temp_data, _ = clean_temp_data(load_temp_data(downloads_dir=directory, session=session))
+    epoch = data_epoch(temp_data)
+    with conn:
+        conn.execute("DELETE FROM samples WHERE session = ?", (session,))
+        for name, df in temp_data:
+            insert_series(conn, session, name, "temp", df['SessionSeconds'].to_numpy(), df['Temp'].to_numpy(dtype=float))
+        for path in sorted(Path(directory).glob("心拍数_*.CSV")):
+            name = path.stem.split('_', 1)[1]
+            df = load_hr_data_for_subject(name, epoch, downloads_dir=directory)
+            if df.empty or 'HR (bpm)' not in df.columns:
+                continue
+            values = pd.to_numeric(df['HR (bpm)'], errors='coerce').to_numpy(dtype=float)
+            insert_series(conn, session, name, "hr", df['SessionSeconds'].to_numpy(), values)
+        conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                     (session, None if epoch is None else str(epoch), json.dumps(source_mtimes(directory, session))))
+
+def set_events(conn, session, experiments):
+    # experiments: {"Exp1": EVENTS_EXP1, ...} for one session.
+    with conn:
+        conn.execute("DELETE FROM events WHERE session = ?", (session,))
+        for experiment, events in experiments.items():
+            for event_t, (time_str, names, suffix) in zip(event_seconds(events), events):
+                conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                                 [(session, experiment, time_str, int(event_t), name, suffix) for name in names])
+
+def ingest(conn, root=DOWNLOADS_DIR):
+    # Incremental: a session is re-read only when its source files changed.
+    known = dict(conn.execute("SELECT session, sources FROM sessions"))
+    for session, directory in find_sessions(root).items():
+        if known.get(session) == json.dumps(source_mtimes(directory, session)):
+            print(f"Session {session}: up to date")
+            continue
+        ingest_session(conn, session, directory)
+        n = conn.execute("SELECT COUNT(*) FROM samples WHERE session = ?", (session,)).fetchone()[0]
+        print(f"Session {session}: {n} samples")
+
+def window(conn, session, subject, signal, event_t, lo=WINDOW[0], hi=WINDOW[1]):
+    # (rel_t, values) of one event window; the statement is cached by sqlite3.
+    rows = conn.execute(WINDOW_SQL, {"session": session, "subject": subject, "signal": signal,
+                                     "event_t": int(event_t), "lo": lo, "hi": hi}).fetchall()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0)
+    rel_t, values = zip(*rows)
+    return np.array(rel_t, dtype=np.int64), np.array(values, dtype=float)
+
+def phase_stats(conn, signal, phases=PHASES):
+    # One row per (session, event, subject) with the phase means.
+    return pd.read_sql_query(phase_sql(phases), conn, params={"signal": signal})
+
+def longitudinal(conn, signal="hr", phase="during"):
+    # e.g. mean during-phase HR for each subject (rows) per session (columns).
+    stats = phase_stats(conn, signal)
+    return stats.pivot_table(index="subject", columns="session", values=phase, aggfunc="mean")
+
+def main():
+    from events import session_events
+    from plot_aligned_experiment import EVENTS_EXP1, EVENTS_EXP2
+
+    conn = connect()
+    ingest(conn)
+    for session, directory in find_sessions().items():
+        events = session_events(session, directory, {"Exp1": EVENTS_EXP1, "Exp2": EVENTS_EXP2})
+        if events is None:
+            print(f"Session {session}: no event schedule, events skipped")
+            continue
+        set_events(conn, session, events)
+    print("Mean during-phase HR per subject and session:")
+    print(longitudinal(conn, "hr", "during").round(1).to_string())
+    conn.close()
+
+if __name__ == "__main__":
+    main()
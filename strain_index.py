@@ -0,0 +1,38 @@
+import warnings
+
+import numpy as np
+
+# --- Configuration ---
+BASELINE_WINDOW = (-300, 0)   # seconds from event start, end exclusive
+HR_MAX = 180.0                # bpm, PSI reference maximum (Moran et al. 1998)
+TC_MAX = 39.5                 # °C
+INDICES = ["PSI", "dHR", "dTc", "HRR%"]
+
+# Combined HR + core-temperature strain indices on the aligned grid, for
+# every row of the aligned tensor at once:
+#   PSI  = 5 (Tc - Tc0) / (39.5 - Tc0) + 5 (HR - HR0) / (180 - HR0)
+#   dHR  = HR - HR0, dTc = Tc - Tc0
+#   HRR% = 100 (HR - HR0) / (HR_MAX - HR0)   (share of heart-rate reserve used)
+# HR0 / Tc0 are each row's mean over the pre-event baseline window.
+
+def baseline(block, seconds, window=BASELINE_WINDOW):
+    in_window = (seconds >= window[0]) & (seconds < window[1])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # rows without baseline data
+        return np.nanmean(block[:, in_window], axis=1)
+
+def physiological_strain_index(hr, tc, hr0, tc0, hr_max=HR_MAX, tc_max=TC_MAX):
+    with np.errstate(all='ignore'):
+        return 5.0 * (tc - tc0) / (tc_max - tc0) + 5.0 * (hr - hr0) / (hr_max - hr0)
+
+def strain_indices(tensor, window=BASELINE_WINDOW, hr_max=HR_MAX, tc_max=TC_MAX):
+    # Returns {index name: (n_rows, n_seconds) array}
+    hr0 = baseline(tensor.hr, tensor.seconds, window)[:, None]
+    tc0 = baseline(tensor.temp, tensor.seconds, window)[:, None]
+    with np.errstate(all='ignore'):
+        return {
+            "PSI": physiological_strain_index(tensor.hr, tensor.temp, hr0, tc0, hr_max, tc_max),
+            "dHR": tensor.hr - hr0,
+            "dTc": tensor.temp - tc0,
+            "HRR%": 100.0 * (tensor.hr - hr0) / (hr_max - hr0),
+        }
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from alignment import build_aligned_tensor, iter_aligned_subjects
+from thermo_loaders import group_capsules, merge_capsules
+
+EXPERIMENTS = [("Exp1_", [("10:00:00", ["A", "B"], "1回目"), ("10:20:00", ["A", "C"], "2回目")])]
+
+
+def _capsule(start, stop, level):
+    t = np.arange(start, stop, 4, dtype=np.int64)
+    return pd.DataFrame({"SessionSeconds": t, "Temp": level + 1e-4 * (t - start)})
+
+
+def _hr(name):
+    t = np.arange(35000, 38000, dtype=np.int64)
+    return pd.DataFrame({"SessionSeconds": t, "HR (bpm)": 80.0 + (t % 7) + ord(name)})
+
+
+# A swallowed a second pill: its capsules meet in the middle of the second event.
+CAPSULES = [("A", _capsule(35000, 37300, 37.0)), ("B", _capsule(35000, 38000, 36.8)),
+            ("A", _capsule(37304, 38000, 37.4))]
+
+
+def test_group_capsules_holds_only_multi_capsule_subjects():
+    order = [name for name, _ in group_capsules(iter(CAPSULES), {"A": 2, "B": 1})]
+    assert order == ["B", "A"]
+    assert [len(frames) for _, frames in group_capsules(iter(CAPSULES))] == [2, 1]
+    merged = merge_capsules(CAPSULES)["A"]["SessionSeconds"]
+    assert merged.is_monotonic_increasing and len(merged) == sum(len(f) for n, f in CAPSULES if n == "A")
+
+
+def test_streamed_equals_batch():
+    batch = build_aligned_tensor(EXPERIMENTS, merge_capsules(CAPSULES), {n: _hr(n) for n in "ABC"})
+    shape = batch.temp.shape
+    hr, temp = np.full(shape, np.nan), np.full(shape, np.nan)
+    hr_samples, temp_samples = np.zeros(shape[0], np.int64), np.zeros(shape[0], np.int64)
+    seen = []
+    for subject, idx, h, t, hs, ts in iter_aligned_subjects(EXPERIMENTS, iter(CAPSULES), _hr, capsules={"A": 2}):
+        seen.append(subject)
+        hr[idx], temp[idx], hr_samples[idx], temp_samples[idx] = h, t, hs, ts
+    assert sorted(seen) == ["A", "B", "C"]
+    np.testing.assert_array_equal(temp, batch.temp)
+    np.testing.assert_array_equal(hr, batch.hr)
+    assert temp_samples.tolist() == batch.temp_samples.tolist()
+    assert hr_samples.tolist() == batch.hr_samples.tolist()
+    # The second A window spans both capsules and C has HR only.
+    a2 = batch.rows.index[(batch.rows["subject"] == "A") & (batch.rows["suffix"] == "2回目")][0]
+    assert np.isfinite(batch.temp[a2]).all()
+    assert np.isnan(batch.temp[batch.rows["subject"] == "C"]).all()
@@ -0,0 +1,78 @@
+import csv
+import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from capsule_layout import read_capsule_blocks, workbook_layout
+from thermo_loaders import find_capsule_files
+
+ROWS = 40
+
+
+def _rows(extra_meta=0):
+    # Logger layout: metadata, "Capsule n-X" row, label row, data.
+    rows = [[f"meta{r}"] for r in range(5 + extra_meta)]
+    rows.append(["Capsule n-2", None, None, None, None, "Capsule n-3"])
+    rows.append(["Sample", "Date", "Hour", "Temperature", None] * 2)
+    for k in range(ROWS):
+        s = 13 * 3600 + 5 * k
+        time = datetime.time(s // 3600, s // 60 % 60, s % 60)
+        rows.append([k + 1, datetime.date(2026, 1, 17), time, 37.0 + k / 100, None,
+                     k + 1, datetime.date(2026, 1, 17), time, 36.5 + k / 100])
+    return rows
+
+
+def _write_xlsx(path, rows):
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([["" if v is None else str(v) for v in row] for row in rows])
+
+
+def test_workbook_and_text_export_give_the_same_blocks(tmp_path):
+    cache = tmp_path / "layouts.json"
+    _write_xlsx(tmp_path / "260117_no1.xlsx", _rows())
+    _write_csv(tmp_path / "260117_no1.csv", _rows())
+    from_xlsx = read_capsule_blocks(tmp_path / "260117_no1.xlsx", cache_path=cache)
+    from_csv = read_capsule_blocks(tmp_path / "260117_no1.csv", cache_path=cache)
+    assert [cap for cap, _ in from_xlsx] == [cap for cap, _ in from_csv] == [2, 3]
+    for (_, a), (_, b) in zip(from_xlsx, from_csv):
+        assert len(a) == len(b) == ROWS and a.index[0] == b.index[0] == 7
+        np.testing.assert_allclose(a["Temp"].astype(float), b["Temp"].astype(float))
+        assert [str(t) for t in a["Time"]] == list(b["Time"])
+    np.testing.assert_allclose(from_csv[1][1]["Temp"].to_numpy()[:2], [36.5, 36.51])
+
+
+def test_layout_follows_the_header_rows(tmp_path):
+    _write_csv(tmp_path / "a.csv", _rows())
+    _write_csv(tmp_path / "b.csv", _rows(extra_meta=3))
+    a = workbook_layout(tmp_path / "a.csv", cache_path=None)
+    b = workbook_layout(tmp_path / "b.csv", cache_path=None)
+    assert a.capsules == b.capsules == ((2, 1, 2, 3), (3, 6, 7, 8))
+    assert (a.data_start, b.data_start) == (7, 10)
+    _write_csv(tmp_path / "none.csv", [["no capsule header"], ["1", "2"]])
+    assert read_capsule_blocks(tmp_path / "none.csv", cache_path=None) == []
+
+
+
+def test_text_export_is_preferred_and_tsv_reads_like_csv(tmp_path):
+    _write_xlsx(tmp_path / "260117_no1.xlsx", _rows())
+    _write_csv(tmp_path / "260117_no1.csv", _rows())
+    _write_xlsx(tmp_path / "260117_no2.xlsx", _rows())
+    (tmp_path / "260117_no3.json").write_text("{}")
+    assert [p.name for p in find_capsule_files(tmp_path, "260117")] == ["260117_no1.csv", "260117_no2.xlsx"]
+
+    with open(tmp_path / "260117_no4.tsv", 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f, delimiter="\t").writerows([["" if v is None else str(v) for v in row] for row in _rows()])
+    from_csv = read_capsule_blocks(tmp_path / "260117_no1.csv", cache_path=None)
+    from_tsv = read_capsule_blocks(tmp_path / "260117_no4.tsv", cache_path=None)
+    for (cap_a, a), (cap_b, b) in zip(from_csv, from_tsv):
+        assert cap_a == cap_b
+        pd.testing.assert_frame_equal(a, b)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from cleaning import FILTERS, TempCleaner, clean_temp_data
+
+
+def _capsule(n=3600, noise=0.03, seed=0):
+    # 1 Hz core temperature: a slow rise of 1 °C over the hour plus sensor noise.
+    rng = np.random.default_rng(seed)
+    t = np.arange(n, dtype=np.int64)
+    return t, 37.0 + t / n + rng.normal(scale=noise, size=n)
+
+
+def test_clean_noisy_data_keeps_almost_everything():
+    for noise in (0.02, 0.03, 0.05):
+        t, v = _capsule(noise=noise)
+        cleaned, report = clean_temp_data([("A", pd.DataFrame({"SessionSeconds": t, "Temp": v}))])
+        assert len(cleaned[0][1]) >= 0.999 * len(v), (noise, report.to_dict("records"))
+
+
+def test_artifacts_are_removed():
+    t, v = _capsule()
+    v[1000] += 1.5          # spike
+    v[2000] = np.nan        # dropout
+    v[2500] = 50.0          # out of range
+    keep = TempCleaner().feed(np.full(len(v), "A"), t, v)
+    assert not keep[[1000, 2000, 2500]].any()
+    assert keep.sum() >= len(v) - 10
+
+
+def test_step_from_last_good_sample():
+    # A sudden 2 °C drop (e.g. a cold drink) is flagged on the step from the
+    # last accepted sample, whatever the rolling median says.
+    t, v = _capsule(noise=0.0)
+    v[1800:] -= 2.0
+    cleaner = TempCleaner({"spike_min_delta": 10.0})   # isolate the rate filter
+    keep = cleaner.feed(np.full(len(v), "A"), t, v)
+    assert not keep[1800]
+    assert cleaner.report().loc[0, "rate"] >= 1
+
+
+def test_chunked_equals_single_pass():
+    t, v = _capsule(noise=0.1, seed=3)
+    v[[100, 700, 701, 1500]] += [1.0, -2.0, -2.0, 3.0]
+    keys = np.full(len(v), "A")
+    whole = TempCleaner().feed(keys, t, v)
+    cleaner = TempCleaner()
+    chunked = np.concatenate([cleaner.feed(keys[i:i + 97], t[i:i + 97], v[i:i + 97]) for i in range(0, len(v), 97)])
+    assert np.array_equal(whole, chunked)
+    assert list(cleaner.report().columns[2:2 + len(FILTERS)]) == FILTERS
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from alignment import build_aligned_tensor, load_session_tensor
+from clock_offset import offsets_from_markers
+
+EXPERIMENTS = [("Exp1_", [("10:00:00", ["A", "B"], "")])]
+EVENT_T = 36000
+TRUE_T = np.arange(EVENT_T - 900, EVENT_T + 900)
+OFFSETS = {"A": 7.0, "B": -4.0}
+DRIFT = {"A": 0.0, "B": 1e-3}
+REF_T = EVENT_T
+
+
+def _response(t):
+    return 37.0 + 0.5 / (1.0 + np.exp(-(t - EVENT_T) / 60.0))
+
+
+def _device_times(subject):
+    return np.rint(TRUE_T + OFFSETS[subject] + DRIFT[subject] * (TRUE_T - REF_T)).astype(np.int64)
+
+
+def _markers():
+    return {subject: [(EVENT_T + OFFSETS[subject] + DRIFT[subject] * (t - REF_T) + (t - EVENT_T), t)
+                      for t in (EVENT_T - 600, EVENT_T, EVENT_T + 600)]
+            for subject in OFFSETS}
+
+
+class _Store:
+    # Minimal stand-in for session_store.SessionStore.
+    def __init__(self, signals):
+        self.signals = signals
+
+    def keys(self, signal):
+        return list(self.signals[signal])
+
+    def series(self, signal, key):
+        return self.signals[signal][key]
+
+
+def test_markers_keyed_for_alignment():
+    offsets = offsets_from_markers(_markers())
+    assert set(offsets) == {("temp", "A"), ("temp", "B")}
+    assert abs(offsets[("temp", "A")]["offset"] - 7.0) < 1e-9
+    assert abs(offsets[("temp", "B")]["drift"] - 1e-3) < 1e-9
+
+
+def test_offset_round_trip():
+    true_frames = {s: pd.DataFrame({"SessionSeconds": TRUE_T, "Temp": _response(TRUE_T)}) for s in OFFSETS}
+    skewed = {s: pd.DataFrame({"SessionSeconds": _device_times(s), "Temp": _response(TRUE_T)}) for s in OFFSETS}
+
+    reference = build_aligned_tensor(EXPERIMENTS, true_frames, {})
+    uncorrected = build_aligned_tensor(EXPERIMENTS, skewed, {})
+    corrected = build_aligned_tensor(EXPERIMENTS, skewed, {}, offsets=offsets_from_markers(_markers()))
+    assert np.nanmax(np.abs(uncorrected.temp - reference.temp)) > 0.005
+    np.testing.assert_allclose(corrected.temp, reference.temp, atol=1e-3)
+
+
+def test_load_session_tensor_applies_markers():
+    store = _Store({
+        "temp": {s: (_device_times(s), _response(TRUE_T)) for s in OFFSETS},
+        "hr": {},
+    })
+    true_frames = {s: pd.DataFrame({"SessionSeconds": TRUE_T, "Temp": _response(TRUE_T)}) for s in OFFSETS}
+    reference = build_aligned_tensor(EXPERIMENTS, true_frames, {})
+    tensor = load_session_tensor(EXPERIMENTS, store=store, markers=_markers())
+    np.testing.assert_allclose(tensor.temp, reference.temp, atol=1e-3)
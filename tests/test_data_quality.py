@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from data_quality import series_quality, window_coverage
+
+
+def test_series_quality_finds_gaps_jumps_and_duplicates():
+    # The logger restarts: 600..795 s, then the clock jumps back to 0..195 s.
+    times = np.concatenate([np.arange(600, 800, 5), np.arange(0, 200, 5)])
+    values = times / 100.0
+    # 190 repeated with its value after a small step back, 195 with a different one.
+    times = np.concatenate([times, [190, 195]])
+    values = np.concatenate([values, [1.9, 0.0]])
+    summary, issues = series_quality(times, values)
+    assert summary["samples"] == 82 and summary["span_s"] == 795
+    assert summary["median_interval_s"] == 5 and summary["off_median_frac"] == 0
+    assert summary["duplicates"] == 2 and summary["duplicate_conflicts"] == 1
+    assert summary["out_of_order"] == 1 and summary["clock_jumps"] == 1
+    assert summary["gaps"] == 1 and summary["longest_gap_s"] == 405
+    assert sorted(issues) == [("clock_jump", 795, 0), ("gap", 195, 600)]
+
+
+def test_window_coverage_counts_samples_and_holes():
+    times = np.arange(0, 2000, 2)
+    times = times[(times < 1000) | (times > 1060)]
+    frames = {"A": pd.DataFrame({"SessionSeconds": times, "HR (bpm)": 70.0})}
+    rows = pd.DataFrame({"subject": ["A", "A", "B"], "event_t": [500, 1030, 500]})
+    n, expected, coverage, longest = window_coverage(frames, "HR (bpm)", rows, {"A": 2.0}, window=(-100, 100))
+    assert n.tolist() == [101, 70, 0]
+    assert expected[0] == 101 and np.isnan(expected[2])
+    assert coverage[0] == 1.0 and np.isclose(coverage[1], 70 / 101)
+    assert longest.tolist() == [2, 64, 200]
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from alignment import AlignedTensor
+from ensemble import bootstrap_ci, ensemble_summary, nan_summary, phase_means
+
+
+def _tensor():
+    seconds = np.arange(-5, 6)
+    rng = np.random.default_rng(0)
+    hr = 80.0 + rng.normal(size=(4, seconds.size))
+    hr[1, :3] = np.nan
+    temp = 37.0 + 0.01 * np.arange(4)[:, None] + 0 * seconds
+    rows = pd.DataFrame({"experiment": ["Exp1", "Exp1", "Exp1", "Exp2"], "subject": list("ABCA"),
+                         "suffix": ["1回目", "1回目", "1回目", ""], "label": ["a", "b", "c", "d"]})
+    return AlignedTensor(seconds, rows, hr, temp, np.ones(4, int), np.ones(4, int))
+
+
+def test_nan_summary_matches_pandas():
+    block = _tensor().hr[:3]
+    mean, sd, sem, n = nan_summary(block)
+    frame = pd.DataFrame(block)
+    np.testing.assert_allclose(mean, frame.mean())
+    np.testing.assert_allclose(sd, frame.std())
+    np.testing.assert_allclose(sem, frame.sem())
+    assert n.tolist() == frame.count().tolist()
+
+
+def test_bootstrap_ci_is_reproducible_and_brackets_the_mean():
+    block = _tensor().hr[:3]
+    low, high = bootstrap_ci(block, n_boot=600, workers=1)
+    again = bootstrap_ci(block, n_boot=600, workers=1)
+    np.testing.assert_array_equal(low, again[0])
+    mean = nan_summary(block)[0]
+    assert (low <= mean + 1e-12).all() and (mean <= high + 1e-12).all()
+
+
+def test_summary_groups_and_phases():
+    tensor = _tensor()
+    summary = ensemble_summary(tensor, n_boot=100, workers=1)
+    assert set(summary.columns.get_level_values("group")) == {"Exp1 1回目", "Exp2"}
+    assert summary[("temp", "Exp1 1回目", "n")].eq(3).all()
+    phases = phase_means(tensor, {"pre": (-5, 0), "post": (0, 5)})
+    np.testing.assert_allclose(phases[("temp", "post")], 37.0 + 0.01 * np.arange(4))
+    np.testing.assert_allclose(phases.loc["a", ("hr", "pre")], tensor.hr[0, :5].mean())
@@ -0,0 +1,24 @@
+import excel_backends
+from excel_backends import BACKENDS, _write_sample, available_backends, read_rows, select_backend
+
+
+def test_backends_agree_on_a_window(tmp_path):
+    path = tmp_path / "sample.xlsx"
+    _write_sample(path, rows=50)
+    reference = list(BACKENDS["openpyxl"](path, 8, 20, 1, 9))
+    assert len(reference) == 12 and all(len(row) == 8 for row in reference)
+    assert reference[0][2] == 37.0 and reference[0][7] == reference[0][2]
+    for name in available_backends():
+        assert list(read_rows(path, 8, 20, 1, 9, backend=name)) == reference
+
+
+def test_selection_is_stored_per_machine(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_backends, "_selected", None)
+    monkeypatch.setattr(excel_backends, "BENCH_ROWS", 50)
+    monkeypatch.setattr(excel_backends, "benchmark_backends", lambda: {"openpyxl": 5.0, "openpyxl-readonly": 2.0})
+    choice = tmp_path / "choice.json"
+    assert select_backend(choice) == "openpyxl-readonly"
+    monkeypatch.setattr(excel_backends, "_selected", None)
+    monkeypatch.setattr(excel_backends, "benchmark_backends", lambda: {"openpyxl": 1.0})
+    assert select_backend(choice) == "openpyxl-readonly"            # stored, not re-benchmarked
+    assert select_backend(choice, rebenchmark=True) == "openpyxl"
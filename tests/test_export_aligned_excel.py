@@ -0,0 +1,67 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from alignment import AlignedTensor
+from export_aligned_excel import chart_groups, export_sheets, write_workbook
+
+
+def _tensor():
+    seconds = np.arange(-300, 421)
+    rng = np.random.default_rng(0)
+    hr = 80.0 + rng.normal(size=(3, seconds.size))
+    hr[1, 100:200] = np.nan
+    temp = 37.0 + 0.001 * seconds + 0.1 * np.arange(3)[:, None]
+    samples = np.ones(3, int)
+    samples_hr = np.array([1, 1, 0])
+    rows = pd.DataFrame({"experiment": ["Exp1", "Exp1", "Exp2"], "subject": list("ABA"), "suffix": ["", "", ""],
+                         "label": ["A_1", "B_1", "A_2"]})
+    return AlignedTensor(seconds, rows, hr, temp, samples_hr, samples)
+
+
+def test_resolution_sheets_match_a_naive_block_mean():
+    tensor = _tensor()
+    sheets = export_sheets(tensor, strain_sheets=[], write_ensemble=False, resolutions=[30, 60])
+    assert list(sheets) == ["Core Temp", "Heart Rate", "Core Temp 30s", "Heart Rate 30s",
+                            "Core Temp 1min", "Heart Rate 1min"]
+    # Rows without samples are left out of every resolution, like the base sheet.
+    assert list(sheets["Heart Rate 30s"].columns) == ["A_1", "B_1"]
+    for width, label in ((30, "30s"), (60, "1min")):
+        hr = pd.DataFrame(tensor.hr[:2].T, index=tensor.seconds, columns=["A_1", "B_1"])
+        blocks = hr.groupby(hr.index // width * width).mean()
+        counts = hr.groupby(hr.index // width * width).size()
+        naive = blocks[counts == width]
+        sheet = sheets[f"Heart Rate {label}"]
+        assert len(sheet) == len(naive) and sheet.index[0] == "-5:00"
+        np.testing.assert_allclose(sheet.to_numpy(), naive.to_numpy())
+    assert sheets["Heart Rate 1min"].index[-1] == "6:00"
+
+
+def test_resolution_must_fit_the_grid():
+    tensor = _tensor()
+    coarse = AlignedTensor(tensor.seconds[::2], tensor.rows, tensor.hr[:, ::2], tensor.temp[:, ::2],
+                           tensor.hr_samples, tensor.temp_samples)
+    assert "Core Temp 30s" in export_sheets(coarse, strain_sheets=[], write_ensemble=False, resolutions=[30])
+    with pytest.raises(ValueError, match="not a multiple"):
+        export_sheets(coarse, strain_sheets=[], write_ensemble=False, resolutions=[5])
+
+
+def test_workbook_charts_reference_the_signal_sheets(tmp_path):
+    tensor = _tensor()
+    sheets = export_sheets(tensor, strain_sheets=[], write_ensemble=False, resolutions=[])
+    path = write_workbook(sheets, tmp_path / "aligned.xlsx", chart_groups(tensor))
+    book = load_workbook(path)
+    assert book.sheetnames == ["Core Temp", "Heart Rate", "Charts Exp1", "Charts Exp2"]
+    with zipfile.ZipFile(path) as archive:
+        charts = [archive.read(name).decode('utf-8') for name in sorted(archive.namelist())
+                  if name.startswith("xl/charts/chart")]
+    # Exp1: two overlays and one chart per trial. Exp2 has no HR samples, so
+    # only the temperature overlay and the A_2 chart.
+    assert len(charts) == 2 + 2 + 1 + 1
+    refs = "".join(charts)
+    n = len(tensor.seconds) + 1
+    assert f"'Heart Rate'!$B$2:$B${n}" in refs and f"'Heart Rate'!$C$2:$C${n}" in refs
+    assert f"'Core Temp'!$D$2:$D${n}" in refs and "'Heart Rate'!$D$" not in refs
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import render_core
+from figure_output import FigureWriter, write_behind
+from render_core import figure, save_figure
+
+
+def _draw(fig, k):
+    ax = fig.add_subplot(111)
+    ax.plot(np.arange(50), np.sin(np.arange(50) / (k + 2)))
+
+
+def test_write_behind_matches_inline_save(tmp_path, monkeypatch):
+    monkeypatch.setitem(render_core.OUTPUT_CLASSES, "vector", {"format": "svg", "dpi": None, "compress_level": 6})
+    for k in range(3):
+        with figure(figsize=(4, 3)) as fig:
+            _draw(fig, k)
+            save_figure(fig, tmp_path / f"inline_{k}.png")
+    with write_behind(workers=2, queue_size=1, report=False) as writer:
+        for k in range(3):
+            with figure(figsize=(4, 3)) as fig:
+                _draw(fig, k)
+                save_figure(fig, tmp_path / f"behind_{k}.png", output_class="grid")
+        with figure(figsize=(4, 3)) as fig:
+            _draw(fig, 0)
+            assert save_figure(fig, tmp_path / "vector.png", output_class="vector").suffix == ".svg"
+    assert render_core._figure_writer is None
+    for k in range(3):
+        inline = np.asarray(Image.open(tmp_path / f"inline_{k}.png"))
+        behind = np.asarray(Image.open(tmp_path / f"behind_{k}.png"))
+        np.testing.assert_array_equal(inline, behind)
+    assert (tmp_path / "vector.svg").read_bytes().lstrip().startswith(b"<?xml")
+    report = writer.report()
+    assert len(report) == 4 and set(report["format"]) == {"png", "svg"}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_write_errors_surface_on_flush(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    writer = FigureWriter(workers=1)
+    with figure(figsize=(2, 2)) as fig:
+        _draw(fig, 0)
+        writer.submit(fig, blocker / "plot.png")
+    with pytest.raises(RuntimeError, match="1 figure"):
+        writer.close()
@@ -0,0 +1,56 @@
+import base64
+import json
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from alignment import AlignedTensor
+from export_html_viewer import pack_arrays, write_html_viewer
+from session_store import SessionStore, write_session_store
+from signal_pyramid import SignalPyramid, build_signal_pyramid
+
+
+def _unpack(html):
+    meta = json.loads(re.search(r"const META = (.*);\n", html).group(1))
+    blob = zlib.decompress(base64.b64decode(re.search(r'const PAYLOAD = "([^"]*)"', html).group(1)))
+    arrays = {}
+    for entry in meta["arrays"]:
+        assert entry["offset"] % 4 == 0
+        arrays[entry["name"]] = np.frombuffer(blob, dtype="<" + entry["dtype"], count=entry["length"],
+                                              offset=entry["offset"])
+    return meta, arrays
+
+
+def test_pack_arrays_types_and_offsets():
+    blob, manifest = pack_arrays({"a": np.arange(3), "b": np.array([0.5, np.nan])})
+    assert [(m["name"], m["dtype"], m["offset"], m["length"]) for m in manifest] == [("a", "i4", 0, 3), ("b", "f4", 12, 2)]
+    assert len(blob) == 20
+
+
+def test_viewer_payload_round_trips(tmp_path):
+    seconds = np.arange(-3, 4)
+    rows = pd.DataFrame({"experiment": ["Exp1", "Exp1"], "subject": ["A", "B"], "suffix": ["1回目", ""],
+                         "time_str": ["13:00:00", "13:05:00"], "event_t": [46800, 47100], "label": ["a", "b"]})
+    hr = np.vstack([70.0 + seconds, np.full(seconds.size, np.nan)])
+    temp = 37.0 + 0.25 * np.vstack([seconds, -seconds])
+    tensor = AlignedTensor(seconds, rows, hr, temp, np.ones(2, int), np.ones(2, int))
+
+    store_dir = tmp_path / "store"
+    times = np.arange(0, 3000, 2)
+    write_session_store(store_dir, {"hr": {"A": (times, 60.0 + times % 7)}, "temp": {"A": (times, np.full(times.size, 37.2))}})
+    build_signal_pyramid(SessionStore(store_dir))
+    pyramid = SignalPyramid(store_dir)
+
+    html = write_html_viewer(tensor, pyramid, out_path=tmp_path / "viewer.html", title="Test").read_text(encoding='utf-8')
+    meta, arrays = _unpack(html)
+    assert meta["events"]["start"] == -3 and meta["events"]["n"] == 7
+    assert [r["subject"] for r in meta["events"]["rows"]] == ["A", "B"]
+    np.testing.assert_array_equal(arrays["events/hr"].reshape(2, 7), hr.astype(np.float32))
+    np.testing.assert_allclose(arrays["events/temp"].reshape(2, 7), temp, rtol=1e-6)
+    piece = pyramid.query("hr", "A", 0, 3000, level=60)
+    np.testing.assert_array_equal(arrays["session/hr/60/A/t"], piece.t)
+    np.testing.assert_allclose(arrays["session/hr/60/A/mean"], piece.mean, rtol=1e-6)
+    assert "session/temp_clean/10/A/t" in arrays and meta["session"]["extent"] == [0, 3000]
+    assert meta["subjects"] == ["A", "B"]
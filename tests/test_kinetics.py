@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from alignment import AlignedTensor
+from kinetics import fit_curve, fit_exponential, fit_kinetics, fit_linear, fits_by_event
+
+TAUS = np.array([30.0, 90.0, 240.0, 600.0])
+
+
+def test_fit_exponential_recovers_taus():
+    x = np.arange(301, dtype=float)
+    rng = np.random.default_rng(0)
+    Y = 80.0 + 40.0 * np.exp(-x / TAUS[:, None]) + rng.normal(scale=0.5, size=(len(TAUS), x.size))
+    Y[1, 50:120] = np.nan              # gaps are masked, not filled
+    fit = fit_exponential(x, Y)
+    np.testing.assert_allclose(fit["tau_s"], TAUS, rtol=0.1)
+    np.testing.assert_allclose(fit["base"][:2], 80.0, atol=1.0)
+    assert fit["converged"].all() and (fit["r2"] > 0.9).all()
+
+
+def test_fit_linear_and_too_few_points():
+    x = np.arange(421, dtype=float)
+    Y = np.vstack([37.0 + 0.01 * x, np.full(x.size, np.nan)])
+    Y[1, :10] = 37.0
+    fit = fit_linear(x, Y)
+    assert abs(fit["slope_per_min"][0] - 0.6) < 1e-9
+    assert np.isnan(fit["slope_per_min"][1]) and fit["n"][1] == 10
+
+
+def test_fit_kinetics_table_round_trip():
+    seconds = np.arange(-300, 421)
+    after = np.clip(seconds - 120, 0, None)
+    hr = np.where(seconds < 120, 150.0, 70.0 + 80.0 * np.exp(-after / 60.0))
+    temp = 37.0 + 0.5 * (1 - np.exp(-np.clip(seconds, 0, None) / 200.0))
+    rows = pd.DataFrame({"subject": ["A"], "event_t": [50000], "label": ["Exp1_A"]})
+    tensor = AlignedTensor(seconds, rows, hr[None], temp[None], np.ones(1, int), np.ones(1, int))
+    table = fit_kinetics(tensor)
+    assert abs(table.loc["Exp1_A", ("hr_recovery", "tau_s")] - 60.0) < 0.5
+    assert abs(table.loc["Exp1_A", ("temp_rise", "tau_s")] - 200.0) < 2.0
+    fit = fits_by_event(tensor, table)[("A", 50000)]
+    np.testing.assert_allclose(fit_curve(fit, "hr_recovery", seconds[seconds >= 120]), hr[seconds >= 120], atol=0.05)
+    assert np.isnan(fit_curve(fit, "hr_recovery", [0])).all()
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from onset_detection import candidate_schedule, detect_onsets, group_onsets, pelt, subject_onsets
+
+
+def _hr(onsets, n=3600, seed=0):
+    # 1 Hz HR at 70 bpm with a 2-min bout at +50 bpm after each onset.
+    rng = np.random.default_rng(seed)
+    t = np.arange(50000, 50000 + n, dtype=np.int64)
+    hr = 70.0 + rng.normal(scale=1.5, size=n)
+    for onset in onsets:
+        hr[(t >= onset) & (t < onset + 120)] += 50.0
+    return t, hr
+
+
+def test_pelt_finds_planted_steps():
+    rng = np.random.default_rng(1)
+    x = np.concatenate([np.zeros(40), np.full(30, 5.0), np.full(50, 2.0)]) + rng.normal(scale=0.3, size=120)
+    assert pelt(x, 3 * 0.09 * np.log(x.size)).tolist() == [40, 70]
+    assert pelt(np.zeros(50) + rng.normal(scale=0.3, size=50), 3 * 0.09 * np.log(50)).size == 0
+
+
+def test_subject_onsets_within_seconds():
+    t, hr = _hr([50600, 52000])
+    onsets = subject_onsets(t, hr)
+    assert len(onsets) == 2
+    assert np.abs(onsets["t"].to_numpy() - [50600, 52000]).max() <= 5
+    assert (onsets["rise"] > 40).all()
+
+
+def test_pairs_become_one_schedule_row():
+    frames = {}
+    for subject, shift, seed in (("A", 0, 2), ("B", 8, 3)):
+        t, hr = _hr([50600 + shift, 51000 + shift], seed=seed)
+        frames[subject] = pd.DataFrame({"SessionSeconds": t, "HR (bpm)": hr})
+    events = group_onsets(detect_onsets(frames))
+    assert len(events) == 2 and all(sorted(s) == ["A", "B"] for s in events["subjects"])
+    schedule = candidate_schedule(events)
+    assert schedule["suffix"].tolist() == ["1回目", "2回目"]
+    assert schedule["experiment"].tolist() == ["Exp1", "Exp1"]   # 400 s apart, one experiment
+    assert schedule["time"].iloc[0][:5] == "14:03"
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from parquet_dataset import ROW_GROUP_SIZE, WindowReader, event_windows, partition_path, write_partition
+
+
+def _series(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.choice(20000, size=n, replace=False)).astype(np.int64) + 36000
+    return times, rng.normal(loc=80.0, size=n)
+
+
+def test_window_equals_pandas_filter(tmp_path):
+    times, values = _series()
+    order = np.random.default_rng(1).permutation(len(times))
+    write_partition(partition_path(tmp_path, "260117", "A", "hr"), times[order], values[order],
+                    np.datetime64("2026-01-17"))
+    reader = WindowReader(tmp_path)
+    frame = pd.DataFrame({"t": times, "value": values})
+    for t_start, t_end in ((36000, 36500), (40123, 47000), (1000, 2000)):
+        t, v = reader.window("260117", "A", "hr", t_start, t_end)
+        expected = frame[(frame["t"] >= t_start) & (frame["t"] <= t_end)]
+        assert t.tolist() == expected["t"].tolist() and v.tolist() == expected["value"].tolist()
+    # Row groups outside the windows were never read.
+    assert reader.row_groups_read < reader.row_groups_total
+    assert reader.row_groups_total == 3 * -(-len(times) // ROW_GROUP_SIZE)
+    assert len(reader.window("260117", "B", "hr", 0, 10**6)[0]) == 0
+
+
+def test_event_windows_relative_times(tmp_path):
+    times, values = _series()
+    write_partition(partition_path(tmp_path, "260117", "A", "hr"), times, values, None)
+    schedules = {"260117": [("10:30:00", ["A", "B"], "1回目"), ("11:00:00", ["A"], "2回目")]}
+    windows = event_windows(WindowReader(tmp_path), schedules, "hr", subject="A", suffix="1回目", window=(-60, 60))
+    inside = (times >= 37800 - 60) & (times <= 37800 + 60)
+    assert windows["rel_t"].tolist() == (times[inside] - 37800).tolist()
+    assert set(windows["suffix"]) == {"1回目"}
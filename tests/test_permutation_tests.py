@@ -0,0 +1,55 @@
+import itertools
+
+import numpy as np
+
+import permutation_tests
+from permutation_tests import _t_threshold, cluster_test, condition_tests
+
+
+def _naive_max_mass(D, threshold):
+    # Largest |summed t| over same-sign supra-threshold runs, one row at a time.
+    n = D.shape[0]
+    t = D.mean(axis=0) / (D.std(axis=0, ddof=1) / np.sqrt(n))
+    best, run, sign = 0.0, 0.0, 0
+    for value in t:
+        s = int(np.sign(value)) if abs(value) > threshold else 0
+        run = run + value if s != 0 and s == sign else (value if s != 0 else 0.0)
+        sign = s
+        best = max(best, abs(run))
+    return best
+
+
+def test_exact_null_and_p_values_for_small_n():
+    rng = np.random.default_rng(0)
+    diffs = rng.normal(size=(5, 40))
+    diffs[:, 10:20] += 1.5
+    result = cluster_test(diffs, n_perm=1000, workers=1)
+    assert result["exact"] and len(result["null"]) == 2 ** 5
+    threshold = float(_t_threshold(4))
+    null = [_naive_max_mass(diffs * np.array(signs)[:, None], threshold)
+            for signs in itertools.product((1.0, -1.0), repeat=5)]
+    np.testing.assert_allclose(np.sort(result["null"]), np.sort(null))
+    for start, stop, mass, p in result["clusters"]:
+        assert p == np.mean(np.array(null) >= abs(mass) - 1e-9 * abs(mass))
+    # With five subjects the smallest attainable p is 2 / 32 (the pattern and its mirror).
+    assert min(p for *_, p in result["clusters"]) == 2 / 32
+
+
+def test_t_threshold_fallback_matches_known_quantiles(monkeypatch):
+    monkeypatch.setattr(permutation_tests, "t_dist", None)
+    np.testing.assert_allclose(_t_threshold(np.array([1, 2, 5, 10, 30])),
+                               [12.7062, 4.3027, 2.5706, 2.2281, 2.0423], atol=2e-3)
+    assert np.isinf(_t_threshold(0))
+
+
+def test_planted_difference_is_significant_without_a_pool(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("process pool started for a single chunk")
+    monkeypatch.setattr(permutation_tests, "ProcessPoolExecutor", no_pool)
+    rng = np.random.default_rng(1)
+    diffs = rng.normal(size=(12, 60))
+    diffs[:, 20:40] += 2.0
+    result = cluster_test(diffs, n_perm=400, workers=4)
+    significant = [(start, stop) for start, stop, _, p in result["clusters"] if p < 0.05]
+    assert len(significant) == 1 and significant[0][0] <= 22 and significant[0][1] >= 38
+    assert not result["exact"] and len(result["null"]) == 400
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+
+from query_service import QueryService, SizeLRU
+
+
+def test_size_lru_evicts_oldest_and_counts_hits():
+    cache = SizeLRU(max_bytes=2500)
+    for key in "abc":
+        cache.put(key, np.zeros(100))           # 800 bytes each
+    assert cache.get("a", lambda: None) is not None
+    cache.put("d", np.zeros(100))               # evicts b, the least recently used
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["evictions"] == 1 and stats["bytes"] == 2400
+    assert cache.get("b", lambda: "rebuilt") == "rebuilt"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_concurrent_misses_build_once():
+    cache = SizeLRU()
+    builds, release = [], threading.Event()
+
+    def build():
+        builds.append(1)
+        release.wait(5)
+        return np.arange(10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", build))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1 and len(results) == 8
+    assert all(r is results[0] for r in results)
+
+
+def test_request_counter_is_exact_under_threads(tmp_path):
+    service = QueryService(downloads_dir=tmp_path)
+
+    def hammer():
+        for _ in range(2000):
+            service.count_request()
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert service.stats()["requests"] == 16000
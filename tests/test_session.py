@@ -0,0 +1,34 @@
+from events import schedule_frame, write_schedule
+from session import Session
+
+
+def _schedule(directory, time_str):
+    write_schedule(schedule_frame({"Exp1": [(time_str, ["A"], "1回目")]}), directory / "event_schedule.csv")
+
+
+def test_default_events_follow_the_directory(tmp_path):
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    _schedule(a, "10:00:00")
+    _schedule(b, "11:00:00")
+    c.mkdir()
+    s = Session(a, session="260201")
+    assert s.events["Exp1"][0][0] == "10:00:00"
+    s.downloads_dir = b
+    assert s.events["Exp1"][0][0] == "11:00:00"
+    # Another session without a schedule never gets the 260117 events.
+    s.downloads_dir = c
+    assert s.events == {}
+
+
+def test_settings_drop_only_dependent_stages(tmp_path):
+    _schedule(tmp_path, "10:00:00")
+    s = Session(tmp_path, session="260201")
+    s.events
+    s._cache.update(raw_temp=[], epoch=None, cleaned=({}, None), hr={})
+    s.window = (-60, 60)
+    assert {"raw_temp", "cleaned", "hr", "events"} <= set(s._cache)
+    s.session = "260202"
+    assert not {"raw_temp", "epoch", "cleaned", "hr", "events"} & set(s._cache)
+    s._cache.update(raw_temp=[], epoch=None, cleaned=({}, None), hr={})
+    s.events = {"Exp1": [("12:00:00", ["A"], "")]}
+    assert "raw_temp" in s._cache and s.events["Exp1"][0][0] == "12:00:00"
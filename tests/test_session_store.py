@@ -0,0 +1,33 @@
+import numpy as np
+
+from session_store import SessionStore, write_session_store
+
+
+def _signals(scale=1.0):
+    return {"temp": {"A": (np.array([5, 1, 3]), scale * np.array([37.5, 37.1, 37.3])),
+                     "B": (np.arange(4), scale * np.full(4, 36.9))},
+            "hr": {}}
+
+
+def test_round_trip_sorted_views(tmp_path):
+    write_session_store(tmp_path, _signals(), epoch=np.datetime64("2026-01-17T10:00:00"))
+    store = SessionStore(tmp_path)
+    times, values = store.series("temp", "A")
+    assert times.tolist() == [1, 3, 5] and values.tolist() == [37.1, 37.3, 37.5]
+    assert isinstance(times.base, np.memmap)
+    assert store.window("temp", "B", 1, 2)[0].tolist() == [1, 2]
+    assert store.keys("hr") == [] and len(store.series("hr", "A")[0]) == 0
+    assert store.epoch() == np.datetime64("2026-01-17T10:00:00")
+
+
+def test_rebuild_leaves_open_readers_intact(tmp_path):
+    write_session_store(tmp_path, _signals())
+    old = SessionStore(tmp_path)
+    before = old.series("temp", "A")[1].copy()
+    write_session_store(tmp_path, {"temp": {"A": (np.arange(2), np.zeros(2))}})
+    # The old mapping still sees its own build; a new reader sees the new one.
+    assert np.array_equal(old.series("temp", "A")[1], before)
+    assert SessionStore(tmp_path).series("temp", "A")[1].tolist() == [0.0, 0.0]
+    write_session_store(tmp_path, _signals(2.0))
+    # Only the current and the previous build are kept on disk.
+    assert len({p.name.split('.')[-3] for p in tmp_path.glob("*.bin")}) == 2
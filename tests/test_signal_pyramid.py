@@ -0,0 +1,39 @@
+import numpy as np
+
+from session_store import SessionStore, write_session_store
+from signal_pyramid import SignalPyramid, build_signal_pyramid, series_levels
+
+
+def _series(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.choice(20000, size=n, replace=False)).astype(np.int64)
+    return times, 37.0 + rng.normal(scale=0.2, size=n)
+
+
+def test_levels_match_naive_binning():
+    times, values = _series()
+    values[::50] = np.nan
+    for level, (bin_t, stats) in series_levels(times, values, [1, 10, 60, 600]).items():
+        ok = np.isfinite(values)
+        bins = times[ok] // level * level
+        assert np.array_equal(bin_t, np.unique(bins))
+        for b, row in zip(bin_t[:40], stats[:40]):
+            v = values[ok][bins == b]
+            assert np.allclose(row, [v.min(), v.max(), v.mean(), len(v)])
+
+
+def test_query_and_rebuild_under_an_open_reader(tmp_path):
+    times, values = _series()
+    write_session_store(tmp_path, {"temp": {"A": (times, values)}})
+    build_signal_pyramid(SessionStore(tmp_path))
+    pyramid = SignalPyramid(tmp_path)
+    piece = pyramid.query("temp", "A", 1000, 4000, level=60)
+    inside = (times >= 960) & (times < 4020)       # whole 60 s bins overlapping the span
+    assert piece.count.sum() == inside.sum()
+    assert pyramid.choose_level(20000, 100) == 600
+
+    before = piece.mean.copy()
+    write_session_store(tmp_path, {"temp": {"A": (times, values + 1.0)}})
+    build_signal_pyramid(SessionStore(tmp_path))
+    assert np.array_equal(pyramid.query("temp", "A", 1000, 4000, level=60).mean, before)
+    assert np.allclose(SignalPyramid(tmp_path).query("temp", "A", 1000, 4000, level=60).mean, before + 1.0)
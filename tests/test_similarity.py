@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import similarity
+from similarity import cluster, dtw_matrix, dtw_pairs, knn, similarity_table
+
+
+def _naive_dtw(x, y, band):
+    # Textbook O(m^2) DP restricted to |i - j| <= band.
+    m = len(x)
+    cost = np.full((m + 1, m + 1), np.inf)
+    cost[0, 0] = 0.0
+    for i in range(1, m + 1):
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            cost[i, j] = (x[i - 1] - y[j - 1]) ** 2 + min(cost[i - 1, j], cost[i, j - 1], cost[i - 1, j - 1])
+    return np.sqrt(cost[m, m])
+
+
+def _naive_cluster(D, n_clusters):
+    # Average linkage rescanning the whole matrix every merge.
+    D = D.copy()
+    np.fill_diagonal(D, np.inf)
+    size = np.ones(len(D))
+    members = np.arange(len(D))
+    for _ in range(len(D) - n_clusters):
+        a, b = np.unravel_index(np.argmin(D), D.shape)
+        merged = (size[a] * D[a] + size[b] * D[b]) / (size[a] + size[b])
+        D[a], D[:, a] = merged, merged
+        D[a, a] = np.inf
+        D[b], D[:, b] = np.inf, np.inf
+        size[a] += size[b]
+        members[members == b] = a
+    return similarity._relabel(members)
+
+
+def _windows(n, m=720, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(size=(n, m)), axis=1)
+
+
+def test_dtw_matches_naive():
+    rng = np.random.default_rng(1)
+    A, B = rng.normal(size=(2, 12, 30))
+    for band in (0, 1, 4, 29):
+        expected = [_naive_dtw(a, b, band) for a, b in zip(A, B)]
+        assert np.allclose(dtw_pairs(A, B, band), expected)
+    assert np.allclose(dtw_pairs(A, B, 0), np.sqrt(((A - B) ** 2).sum(axis=1)))
+
+
+def test_knn_pruning_finds_the_exact_neighbours():
+    Z = np.random.default_rng(2).normal(size=(60, 40))
+    D = dtw_matrix(Z, band=3)
+    for q in (0, 17, 59):
+        idx, d, computed = knn(Z, q, k=3, band=3)
+        row = np.where(np.arange(len(Z)) == q, np.inf, D[q])
+        assert np.allclose(d, np.sort(row)[:3])
+        assert computed <= len(Z) - 1
+
+
+def test_cluster_matches_full_rescan():
+    Z = np.random.default_rng(3).normal(size=(80, 10))
+    D = similarity.euclidean_matrix(Z)
+    assert np.array_equal(cluster(D, 4), _naive_cluster(D, 4))
+
+
+def test_planted_shapes_cluster_together():
+    t = np.linspace(0, 1, 720)
+    shapes = [np.sin(2 * np.pi * t), t ** 2, -t, np.exp(-5 * t)]
+    rng = np.random.default_rng(4)
+    values = np.array([shapes[i % 4] + rng.normal(scale=0.05, size=len(t)) for i in range(40)])
+    rows = pd.DataFrame({"label": [f"w{i}" for i in range(40)]})
+    table, _ = similarity_table(rows, np.arange(720), values, n_clusters=4)
+    for i in range(4):
+        assert table["cluster"].iloc[i::4].nunique() == 1
+    assert table["cluster"].nunique() == 4
+
+
+def test_default_clustering_scales_to_thousands_of_windows():
+    assert similarity.METRIC == "euclidean"
+    n = 2000
+    rows = pd.DataFrame({"label": [f"w{i}" for i in range(n)]})
+    start = time.perf_counter()
+    table, D = similarity_table(rows, np.arange(720), _windows(n))
+    assert time.perf_counter() - start < 10.0
+    assert len(table) == n and D.shape == (n, n)
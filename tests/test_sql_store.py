@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+import sql_store
+from plot_aligned_grid import PHASES, calculate_stats
+from sql_store import connect, insert_series, phase_stats, set_events, window
+
+
+def _hr(seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(36000, 39000, dtype=np.int64)
+    values = 80.0 + rng.normal(size=t.size)
+    values[::97] = np.nan
+    return t, values
+
+
+def test_chunked_insert_keeps_first_duplicate(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql_store, "INSERT_BATCH", 7)
+    conn = connect(tmp_path / "s.sqlite")
+    t = np.array([5, 1, 2, 2, 3, 4, 6, 7, 8, 8, 9], dtype=np.int64)
+    v = np.arange(len(t), dtype=float)
+    insert_series(conn, "260117", "A", "hr", t, v)
+    rel_t, values = window(conn, "260117", "A", "hr", 0, 0, 100)
+    assert rel_t.tolist() == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert values[rel_t.tolist().index(8)] == 8.0 and values[rel_t.tolist().index(2)] == 2.0
+    conn.close()
+
+
+def test_phase_stats_match_calculate_stats(tmp_path):
+    conn = connect(tmp_path / "s.sqlite")
+    t, values = _hr()
+    insert_series(conn, "260117", "A", "hr", t, values)
+    set_events(conn, "260117", {"Exp1": [("10:10:00", ["A"], "1回目")]})
+    stats = phase_stats(conn, "hr")
+    assert stats["event_t"].tolist() == [36600]
+    segment = pd.DataFrame({"SessionSeconds": t, "HR (bpm)": values})
+    expected = calculate_stats(segment, "HR (bpm)", 36600)
+    np.testing.assert_allclose(stats.loc[0, list(PHASES)].to_numpy(dtype=float), expected)
+    rel_t, v = window(conn, "260117", "A", "hr", 36600, -10, 10)
+    assert rel_t.tolist() == list(range(-10, 11))
+    conn.close()
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from alignment import AlignedTensor
+from strain_index import HR_MAX, TC_MAX, strain_indices
+
+
+def test_psi_from_baseline():
+    seconds = np.arange(-300, 421)
+    hr = np.where(seconds < 0, 60.0, 120.0)[None]
+    temp = np.where(seconds < 0, 37.0, 38.0)[None]
+    rows = pd.DataFrame({"label": ["a"]})
+    out = strain_indices(AlignedTensor(seconds, rows, hr, temp, np.ones(1, int), np.ones(1, int)))
+    expected = 5 * 1.0 / (TC_MAX - 37.0) + 5 * 60.0 / (HR_MAX - 60.0)
+    np.testing.assert_allclose(out["PSI"][0, seconds >= 0], expected)
+    np.testing.assert_allclose(out["PSI"][0, seconds < 0], 0.0)
+    np.testing.assert_allclose(out["HRR%"][0, -1], 50.0)
+    assert out["dTc"][0, -1] == 1.0 and out["dHR"][0, -1] == 60.0
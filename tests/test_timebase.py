@@ -0,0 +1,50 @@
+import datetime
+
+import numpy as np
+
+from timebase import block_means, clock_to_seconds, event_seconds, unwrap_midnight, window_bounds
+
+
+def test_clock_to_seconds_formats():
+    values = ["00:00:00", "23:59:59", "9:05:07", datetime.time(13, 0, 1), 0.5, "13:00:01.000", "n/a", None]
+    assert clock_to_seconds(values).tolist() == [0, 86399, 32707, 46801, 43200, 46801, -1, -1]
+
+
+def test_unwrap_midnight():
+    clock = [86000, 86399, 10, 500, 400]
+    # One wrap after 23:59:59; a small step back is not a new day.
+    assert unwrap_midnight(clock).tolist() == [86000, 86399, 86410, 86900, 86800]
+    assert unwrap_midnight([5]).tolist() == [5]
+
+
+def test_event_seconds_across_midnight():
+    events = [("23:50:00", [], ""), ("00:03:00", [], "")]
+    assert event_seconds(events).tolist() == [85800, 86580]
+
+
+def test_event_seconds_independent_of_order():
+    # Lists ordered by subject, not by time, still unwrap around the session.
+    events = [("00:10:00", ["B"], ""), ("23:50:00", ["A"], ""), ("00:03:00", ["A"], "")]
+    assert event_seconds(events).tolist() == [87000, 85800, 86580]
+    # Anchored to the session start, a single event lands on the same second.
+    assert event_seconds(events[:1], start=85000).tolist() == [87000]
+    assert event_seconds(events[1:2], start=85000).tolist() == [85800]
+    assert event_seconds([("13:00:00", [], ""), ("bad", [], "")], start=50000).tolist() == [46800, -1]
+
+
+def test_window_bounds_inclusive():
+    times = np.arange(0, 100, 10)
+    lo, hi = window_bounds(times, 50, -20, 20)
+    assert times[lo:hi].tolist() == [30, 40, 50, 60, 70]
+    lo, hi = window_bounds(times, np.array([0, 95]), -5, 5)
+    assert lo.tolist() == [0, 9] and hi.tolist() == [1, 10]
+
+
+def test_block_means_nan_aware():
+    seconds = np.arange(-3, 7)
+    values = np.array([[1.0, 2.0, 3.0, 4.0, np.nan, 6.0, np.nan, np.nan, np.nan, 10.0]])
+    starts, means = block_means(seconds, values, 3)
+    # Only complete blocks anchored at 0: [-3, 0), [0, 3), [3, 6).
+    assert starts.tolist() == [-3, 0, 3]
+    np.testing.assert_allclose(means[0, :2], [2.0, 5.0])
+    assert np.isnan(means[0, 2])
@@ -0,0 +1,246 @@
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from capsule_layout import read_capsule_blocks
+from timebase import clock_to_seconds, from_session_seconds, session_epoch, to_session_seconds, unwrap_midnight
+
+# --- Configuration ---
+DOWNLOADS_DIR = Path("Downloads")
+# Capsule workbooks are named <SESSION>_no<n>.xlsx (YYMMDD of the session);
+# the logger's text export of the same sheet may be .csv/.tsv/.txt instead
+SESSION = "260117"
+# In order of preference when one capsule file exists in several formats
+CAPSULE_EXTENSIONS = (".csv", ".tsv", ".txt", ".xlsx")
+
+# Name Mapping: HR_Col_Name -> Kanji Name
+NAME_MAP_HR_TO_KANJI = {
+    "Fujii": "藤井",
+    "Itai": "板井",
+    "Ito": "伊藤",
+    "Kan": "姜",
+    "Kitada": "北田",
+    "Takamizawa": "高見澤",
+    "Yamaguchi": "山口",
+    "Yamamoto": "山本"
+}
+
+# Reverse map for convenience
+NAME_MAP_KANJI_TO_HR = {v: k for k, v in NAME_MAP_HR_TO_KANJI.items()}
+
+# FileNo -> {CapsuleID -> Name}
+# Note: 3-1 means File 3, Capsule 1
+CAPSULE_NAME_MAPPING = {
+    1: {2: "板井", 3: "姜"},
+    2: {2: "北田", 3: "伊藤"},
+    3: {1: "山本", 3: "高見澤"},
+    5: {1: "山口", 2: "藤井"}
+}
+
+# All loaders return frames sorted by 'SessionSeconds' (int64 seconds since
+# the session epoch, see timebase.py) and keep a real 'Datetime' column.
+
+def find_capsule_files(downloads_dir=DOWNLOADS_DIR, session=SESSION):
+    # One file per capsule export: the text export is read in preference to
+    # the workbook with the same name (parsing it is several times faster).
+    files = {}
+    for path in Path(downloads_dir).glob(f"{session}_*"):
+        ext = path.suffix.lower()
+        if ext not in CAPSULE_EXTENSIONS or path.stem[len(session) + 1:][:2] not in ("no", "No"):
+            continue
+        best = files.get(path.stem)
+        if best is None or CAPSULE_EXTENSIONS.index(ext) < CAPSULE_EXTENSIONS.index(best.suffix.lower()):
+            files[path.stem] = path
+    return sorted(files.values())
+
+def source_mtimes(directory=DOWNLOADS_DIR, session=SESSION):
+    # {source path: mtime} of one session's capsule exports and HR CSVs,
+    # for incremental ingests that skip unchanged sessions.
+    directory = Path(directory)
+    files = set(find_capsule_files(directory, session)) | set(directory.glob("心拍数_*.CSV"))
+    return {str(f): os.path.getmtime(f) for f in sorted(files)}
+
+def find_sessions(root=DOWNLOADS_DIR):
+    # {session: directory} for every directory under root holding capsule
+    # exports; each session keeps its HR CSVs next to its exports.
+    sessions = {}
+    for path in sorted(Path(root).rglob("*_*")):
+        match = re.match(r'(\d{6})_[nN]o\d+(\.\w+)$', path.name)
+        if match and match.group(2).lower() in CAPSULE_EXTENSIONS:
+            sessions.setdefault(match.group(1), path.parent)
+    return sessions
+
+def data_epoch(temp_data):
+    # Session epoch from the capsule Date columns of load_temp_data() output.
+    if not temp_data:
+        return None
+    return session_epoch(pd.concat([df['Datetime'] for _, df in temp_data]))
+
+def _block_to_frame(block, counts=None):
+    # block: raw Date/Time/Temp cells of one capsule (capsule_layout).
+    # counts (optional dict) receives the rows dropped while parsing.
+    present = block[['Time', 'Temp']].notna()
+    block = block.dropna(subset=['Time', 'Temp'])
+    block['Temp'] = pd.to_numeric(block['Temp'], errors='coerce')
+
+    clock = clock_to_seconds(block['Time'].to_numpy())
+    if counts is not None:
+        counts["incomplete"] = counts.get("incomplete", 0) + int((present.any(axis=1) & ~present.all(axis=1)).sum())
+        counts["bad_time"] = counts.get("bad_time", 0) + int((clock < 0).sum())
+    block = block[clock >= 0]
+    clock = clock[clock >= 0]
+
+    dates = pd.to_datetime(block['Date'], errors='coerce').dt.normalize().ffill().bfill()
+    if dates.isna().all():
+        # No usable Date column: keep the clock and only unwrap midnight.
+        block['Datetime'] = pd.NaT
+        block['_clock'] = unwrap_midnight(clock)
+    else:
+        block['Datetime'] = dates + pd.to_timedelta(clock, unit='s')
+        block['_clock'] = -1
+    return block
+
+def _iter_capsule_blocks(downloads_dir, session, counts=None):
+    # (name, block) per capsule, one workbook in memory at a time.
+    for file_path in find_capsule_files(downloads_dir, session):
+        filename = os.path.basename(file_path)
+        blocks = []
+        try:
+            file_no_match = re.search(r'no(\d+)', filename.lower())
+            if not file_no_match: continue
+            file_no = int(file_no_match.group(1))
+
+            for cap_id, raw in read_capsule_blocks(file_path):
+                name = CAPSULE_NAME_MAPPING.get(file_no, {}).get(cap_id, None)
+                if not name: continue
+                blocks.append((name, _block_to_frame(raw, counts=None if counts is None else counts.setdefault(name, {}))))
+        except Exception as e:
+            print(f"Error loading {filename}: {e}")
+            if counts is not None:
+                counts.setdefault("errors", []).append(f"{filename}: {e}")
+        yield from blocks
+
+def _finish_block(block, epoch):
+    if block['Datetime'].notna().any():
+        block['SessionSeconds'] = to_session_seconds(block['Datetime'], epoch)
+    else:
+        block['SessionSeconds'] = block['_clock'].to_numpy()
+        if epoch is not None:
+            block['Datetime'] = from_session_seconds(block['SessionSeconds'], epoch)
+    block = block.drop(columns='_clock')
+    return block.sort_values('SessionSeconds', kind='stable')
+
+def load_temp_data(epoch=None, downloads_dir=DOWNLOADS_DIR, session=SESSION, counts=None):
+    # counts (optional dict) collects {name: {"incomplete", "bad_time"}} rows
+    # dropped while parsing, and {"errors": [...]} for unreadable files.
+    blocks = list(_iter_capsule_blocks(downloads_dir, session, counts))
+    if epoch is None:
+        epoch = session_epoch(pd.concat([b['Datetime'] for _, b in blocks])) if blocks else None
+    return [(name, _finish_block(block, epoch)) for name, block in blocks]
+
+def session_date_epoch(session=SESSION):
+    # Midnight of the session date encoded in the workbook names (YYMMDD).
+    return np.datetime64(datetime.strptime(session, "%y%m%d"), 's')
+
+def iter_temp_data(epoch=None, downloads_dir=DOWNLOADS_DIR, session=SESSION, counts=None):
+    # Streaming load_temp_data: yields (name, frame) per capsule while the
+    # workbooks are parsed, so only one workbook is held at a time. The epoch
+    # cannot wait for every Date column, so it defaults to the session date,
+    # which is what load_temp_data finds unless a capsule logged from the day
+    # before.
+    if epoch is None:
+        epoch = session_date_epoch(session)
+    for name, block in _iter_capsule_blocks(downloads_dir, session, counts):
+        yield name, _finish_block(block, epoch)
+
+def capsule_counts(downloads_dir=DOWNLOADS_DIR, session=SESSION):
+    # {name: capsules} from the file names and CAPSULE_NAME_MAPPING alone; a
+    # subject who swallowed a second pill has two.
+    counts = {}
+    for path in find_capsule_files(downloads_dir, session):
+        match = re.search(r'no(\d+)', path.name.lower())
+        for name in CAPSULE_NAME_MAPPING.get(int(match.group(1)), {}).values() if match else ():
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def group_capsules(temp_iter, capsules=None):
+    # Yields (name, [frames]) per subject from a (name, frame) capsule stream.
+    # capsules: {name: capsules expected} (capsule_counts); a subject is held
+    # back only until its last capsule has arrived, so single-capsule
+    # subjects stream straight through. The rest follow at the end.
+    pending = {}
+    for name, frame in temp_iter:
+        pending.setdefault(name, []).append(frame)
+        if capsules is not None and len(pending[name]) >= capsules.get(name, 1):
+            yield name, pending.pop(name)
+    yield from pending.items()
+
+def merge_frames(frames):
+    # One time-sorted frame from a subject's capsules.
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True).sort_values('SessionSeconds', kind='stable')
+
+def merge_capsules(temp_data):
+    # {name: frame} from load_temp_data output with each subject's capsules
+    # concatenated, where dict(temp_data) would keep only the last one.
+    return {name: merge_frames(frames) for name, frames in group_capsules(temp_data)}
+
+def load_hr_data(epoch=None, downloads_dir=DOWNLOADS_DIR, columns=None):
+    # Combined HR export: one column per subject (romanized), clock time only.
+    # columns: read only these subject columns (and Time).
+    path = Path(downloads_dir) / "Jisedai2026_HR.csv"
+    if not path.exists():
+        return pd.DataFrame()
+
+    df = pd.read_csv(path, usecols=None if columns is None else lambda c: c == 'Time' or c in columns)
+    df['SessionSeconds'] = unwrap_midnight(clock_to_seconds(df['Time'].to_numpy()))
+    if epoch is not None:
+        df['Datetime'] = from_session_seconds(df['SessionSeconds'], epoch)
+    return df
+
+def load_hr_data_for_subject(kanji_name, epoch=None, downloads_dir=DOWNLOADS_DIR, counts=None):
+    # counts (optional dict) receives "bad_time" rows dropped while parsing,
+    # or "error" when the file cannot be read.
+    filename = f"心拍数_{kanji_name}.CSV"
+    path = Path(downloads_dir) / filename
+    if not path.exists():
+        return pd.DataFrame()
+
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            meta_header = f.readline().strip().split(',')
+            meta_values = f.readline().strip().split(',')
+
+        try:
+            date_idx = meta_header.index('Date')
+            start_time_idx = meta_header.index('Start time')
+            start_dt = datetime.strptime(f"{meta_values[date_idx]} {meta_values[start_time_idx]}", "%d-%m-%Y %H:%M:%S")
+        except (ValueError, IndexError):
+            if counts is not None:
+                counts["error"] = "no Date/Start time metadata"
+            return pd.DataFrame()
+
+        if epoch is None:
+            epoch = session_epoch([start_dt])
+        start_offset = int(to_session_seconds([start_dt], epoch)[0])
+
+        df = pd.read_csv(path, header=2)
+        if df.empty:
+            return df
+        duration = pd.to_timedelta(df['Time'], errors='coerce').dt.total_seconds()
+        if counts is not None:
+            counts["bad_time"] = int(duration.isna().sum())
+        df = df[duration.notna()].copy()
+        df['SessionSeconds'] = start_offset + np.rint(duration[duration.notna()].to_numpy()).astype(np.int64)
+        df['Datetime'] = from_session_seconds(df['SessionSeconds'], epoch)
+        return df.sort_values('SessionSeconds', kind='stable')
+    except Exception as e:
+        print(f"Error loading {filename}: {e}")
+        if counts is not None:
+            counts["error"] = str(e)
+        return pd.DataFrame()
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+# Every sample and event is represented as int64 seconds since a session
+# epoch: local midnight of the session date, taken from the capsule Date
+# column or the HR CSV Date/Start time metadata. Window math is then plain
+# integer NumPy arithmetic, and an event at 00:03:00 after a session that
+# started at 23:50:00 lands at 86580 instead of silently wrapping.
+
+SECONDS_PER_DAY = 86400
+_CLOCK_PATTERN = r'(\d{1,2}):(\d{2}):(\d{2})'
+
+def session_epoch(datetimes):
+    # Midnight of the earliest date in `datetimes` as datetime64[s].
+    values = pd.to_datetime(pd.Series(datetimes), errors='coerce').dropna()
+    if values.empty:
+        return None
+    return values.min().normalize().to_datetime64().astype('datetime64[s]')
+
+def to_session_seconds(datetimes, epoch):
+    values = pd.to_datetime(pd.Series(datetimes), errors='coerce').to_numpy(dtype='datetime64[s]')
+    return (values - np.datetime64(epoch, 's')).astype(np.int64)
+
+def from_session_seconds(seconds, epoch):
+    return np.datetime64(epoch, 's') + np.asarray(seconds, dtype=np.int64).astype('timedelta64[s]')
+
+def _fixed_clock(text):
+    # Seconds of day for cells that are exactly "HH:MM:SS", read from the
+    # code points without a regex; -1 for every other cell.
+    out = np.full(len(text), -1, dtype=np.int64)
+    fits = (text.str.len() == 8).to_numpy(dtype=bool)
+    if fits.any():
+        codes = np.array(text[fits].tolist(), dtype='U8').view(np.uint32).reshape(-1, 8).astype(np.int64)
+        digits = codes[:, [0, 1, 3, 4, 6, 7]] - ord('0')
+        ok = (codes[:, 2] == ord(':')) & (codes[:, 5] == ord(':')) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+        hms = digits[:, 0::2] * 10 + digits[:, 1::2]
+        out[np.flatnonzero(fits)[ok]] = (hms[:, 0] * 3600 + hms[:, 1] * 60 + hms[:, 2])[ok]
+    return out
+
+def clock_to_seconds(values):
+    # Seconds of day for "HH:MM:SS" strings, datetime.time, datetimes and
+    # Excel day fractions alike. Unparseable cells come back as -1.
+    s = pd.Series(values)
+    text = s.astype(str)
+    # Plain "HH:MM:SS" (text exports, str(datetime.time)) is the bulk of
+    # every series; only the other cells go through to_numeric and the regex.
+    out = _fixed_clock(text)
+    rest = np.flatnonzero(out < 0)
+    if rest.size == 0:
+        return out
+    s, text = s.iloc[rest], text.iloc[rest]
+
+    numeric = pd.to_numeric(s, errors='coerce').to_numpy()
+    is_fraction = np.isfinite(numeric) & (numeric >= 0) & (numeric < 1)
+    out[rest[is_fraction]] = np.rint(numeric[is_fraction] * SECONDS_PER_DAY).astype(np.int64)
+
+    parts = text.str.extract(_CLOCK_PATTERN)
+    parsed = parts.notna().all(axis=1).to_numpy() & ~is_fraction
+    if parsed.any():
+        hms = parts[parsed].astype(np.int64).to_numpy()
+        out[rest[parsed]] = hms[:, 0] * 3600 + hms[:, 1] * 60 + hms[:, 2]
+    return out
+
+def unwrap_midnight(seconds_of_day):
+    # For a chronologically ordered clock sequence, add a day every time the
+    # clock jumps back by more than 12 h.
+    seconds = np.asarray(seconds_of_day, dtype=np.int64)
+    if seconds.size < 2:
+        return seconds.copy()
+    wraps = np.concatenate([[0], np.cumsum(np.diff(seconds) < -SECONDS_PER_DAY // 2)])
+    return seconds + wraps * SECONDS_PER_DAY
+
+def anchor_clock(seconds_of_day, start):
+    # Session seconds of clock times around a session that starts at `start`
+    # (session seconds): each time goes on the day that puts it less than
+    # 12 h before the start, whatever order the times come in. Unparseable
+    # times (-1) stay -1.
+    seconds = np.asarray(seconds_of_day, dtype=np.int64)
+    days = (int(start) - seconds + SECONDS_PER_DAY // 2) // SECONDS_PER_DAY
+    return np.where(seconds < 0, seconds, seconds + days * SECONDS_PER_DAY)
+
+def first_clock(seconds_of_day):
+    # The clock time a schedule starts at: the one after the longest gap
+    # around the 24 h dial, so 23:50 for [00:03, 23:50, 00:10].
+    clock = np.unique(np.asarray(seconds_of_day, dtype=np.int64))
+    clock = clock[clock >= 0]
+    if clock.size == 0:
+        return 0
+    gaps = np.diff(np.concatenate([clock, clock[:1] + SECONDS_PER_DAY]))
+    return int(clock[(np.argmax(gaps) + 1) % clock.size])
+
+def event_seconds(events, start=None):
+    # events: [(TimeStr, names, suffix), ...] in any order, clock times on
+    # the session date. start: session seconds of the session start (e.g.
+    # its first capsule sample); by default the schedule's own first_clock,
+    # so lists ordered by subject unwrap the same as chronological ones.
+    clock = clock_to_seconds([e[0] for e in events])
+    return anchor_clock(clock, first_clock(clock) if start is None else start)
+
+def window_bounds(times, event_t, lo, hi):
+    # [start, stop) indices of lo <= t - event_t <= hi in sorted `times`;
+    # event_t may be a scalar or an array of events.
+    times = np.asarray(times)
+    event_t = np.asarray(event_t, dtype=np.int64)
+    return np.searchsorted(times, event_t + lo, side='left'), np.searchsorted(times, event_t + hi, side='right')
+
+def _unique_sorted(times, values):
+    times, first = np.unique(np.asarray(times, dtype=np.int64), return_index=True)
+    return times, np.asarray(values, dtype=float)[first]
+
+def align_nearest(times, values, event_t, offsets, tolerance):
+    # Value of the sample nearest to event_t + offset, NaN if further than
+    # `tolerance` seconds. Duplicated timestamps keep the first sample.
+    target = np.asarray(event_t, dtype=np.int64)[..., None] + np.asarray(offsets)
+    times, values = _unique_sorted(times, values)
+    if times.size == 0:
+        return np.full(target.shape, np.nan)
+    right = np.clip(np.searchsorted(times, target), 0, times.size - 1)
+    left = np.clip(right - 1, 0, times.size - 1)
+    take_left = np.abs(target - times[left]) <= np.abs(times[right] - target)
+    nearest = np.where(take_left, left, right)
+    out = values[nearest]
+    out[np.abs(times[nearest] - target) > tolerance] = np.nan
+    return out
+
+def align_interp(times, values, event_t, offsets):
+    # Linear interpolation onto event_t + offset, NaN outside the samples.
+    target = np.asarray(event_t, dtype=np.int64)[..., None] + np.asarray(offsets)
+    times, values = _unique_sorted(times, values)
+    if times.size == 0:
+        return np.full(target.shape, np.nan)
+    return np.interp(target, times, values, left=np.nan, right=np.nan)
+
+def block_means(seconds, values, width):
+    # NaN-aware means of `values` (..., n) on the regular ascending grid
+    # `seconds` over blocks of `width` seconds anchored at 0 ([0, width),
+    # [width, 2 * width), ... and likewise before 0). Only blocks the grid
+    # covers completely are returned: (block start seconds, means (..., k)).
+    # One cumulative sum per call, so any number of blocks costs O(n).
+    seconds = np.asarray(seconds, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    step = int(seconds[1] - seconds[0]) if seconds.size > 1 else 1
+    first = -(-int(seconds[0]) // width) * width
+    starts = np.arange(first, int(seconds[-1]) - width + step + 1, width, dtype=np.int64)
+    lo, hi = np.searchsorted(seconds, starts), np.searchsorted(seconds, starts + width)
+
+    finite = np.isfinite(values)
+    pad = np.zeros(values.shape[:-1] + (1,))
+    sums = np.concatenate([pad, np.nancumsum(values, axis=-1)], axis=-1)
+    counts = np.concatenate([pad, np.cumsum(finite, axis=-1)], axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums[..., hi] - sums[..., lo]) / (counts[..., hi] - counts[..., lo])
+    return starts, means